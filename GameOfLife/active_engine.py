@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+@author: Patrick Tu & Kathrin Witzlsperger
+"""
+
+import numpy as np
+from GameOfLife.engine import Engine
+from GameOfLife.bit_engine import BitEngine
+
+
+class ActiveEngine:
+    '''
+    Incremental stepping engine for one board over many generations. The board is divided into
+    square tiles and a bitmap records which tiles changed in the last generation. A cell can only
+    change if itself or one of its neighbours changed, so only the changed tiles and the tiles around
+    them are recomputed and the cost scales with the activity on the board instead of its area.
+
+    :param grid: initial grid
+    :param tile_size: edge length of the tiles
+    :param update_grid: function stepping the whole board, used when most tiles are active
+    '''
+
+    TILE_SIZE = 32
+
+    # from this fraction of tiles to recompute on, the whole board is stepped at once
+    FULL_STEP_FRACTION = 0.5
+
+    def __init__(self, grid, tile_size=TILE_SIZE, update_grid=BitEngine.update_grid):
+
+        self.grid = np.array(grid, dtype=np.uint8)
+        self.tile_size = tile_size
+        self.update_grid = update_grid
+
+        rows, cols = self.grid.shape
+        tile_rows, tile_cols = -(-rows // tile_size), -(-cols // tile_size)
+        # every tile changed before the first generation
+        self.active = np.ones((tile_rows, tile_cols), dtype=bool)
+
+        # rows and columns of every tile row / tile column with a one cell halo, wrapping around the
+        # edges of the board. The last tiles may reach past the board, their surplus cells are computed
+        # from wrapped cells as well and only make the change bitmap more conservative.
+        halo = np.arange(-1, tile_size + 1)
+        self.row_index = (np.arange(tile_rows)[:, None] * tile_size + halo) % rows
+        self.col_index = (np.arange(tile_cols)[:, None] * tile_size + halo) % cols
+
+    def dirty_tiles(self):
+        '''
+        Returns the bitmap of the tiles which have to be recomputed, the active tiles and their neighbours
+        '''
+
+        dirty = self.active.copy()
+        for x, y in Engine.NEIGHBOUR_OFFSETS:
+            dirty |= np.roll(self.active, (x, y), axis=(0, 1))
+        return dirty
+
+    def step_all(self):
+        '''
+        Steps the whole board and records the changed tiles
+        '''
+
+        new_grid = np.asarray(self.update_grid(self.grid), dtype=np.uint8)
+
+        # changed cells, padded to whole tiles and reduced per tile
+        tile_rows, tile_cols = self.active.shape
+        changed = np.zeros((tile_rows * self.tile_size, tile_cols * self.tile_size), dtype=bool)
+        changed[:new_grid.shape[0], :new_grid.shape[1]] = new_grid != self.grid
+        self.active = changed.reshape(tile_rows, self.tile_size, tile_cols, self.tile_size).any(axis=(1, 3))
+
+        self.grid = new_grid
+
+    def step_tiles(self, tiles):
+        '''
+        Recomputes the given tiles at once and records which of them changed
+        '''
+
+        tile_row, tile_col = tiles
+        padded_tiles = self.grid[self.row_index[tile_row][:, :, None], self.col_index[tile_col][:, None, :]]
+        new_tiles = Engine.update_padded_grid(padded_tiles)
+        changed = (new_tiles != padded_tiles[:, 1:-1, 1:-1]).any(axis=(1, 2))
+
+        self.active[:] = False
+        self.active[tile_row[changed], tile_col[changed]] = True
+
+        # all tiles are computed from the old board before any of them is written back
+        rows, cols = self.grid.shape
+        for k in np.flatnonzero(changed):
+            r0, c0 = tile_row[k] * self.tile_size, tile_col[k] * self.tile_size
+            r1, c1 = min(r0 + self.tile_size, rows), min(c0 + self.tile_size, cols)
+            self.grid[r0:r1, c0:c1] = new_tiles[k, :r1 - r0, :c1 - c0]
+
+    def step(self, generations=1):
+        '''
+        Advances the board by a number of generations
+        '''
+
+        for _ in range(generations):
+            dirty = self.dirty_tiles()
+            if dirty.mean() >= self.FULL_STEP_FRACTION:
+                self.step_all()
+            elif dirty.any():
+                self.step_tiles(np.nonzero(dirty))
+
+    def current_grid(self):
+        '''
+        Returns a copy of the current generation as numpy array of dtype int32
+        '''
+
+        return self.grid.astype('i')
@@ -0,0 +1,234 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+'''
+@author: Patrick Tu & Kathrin Witzlsperger
+
+
+'''
+
+import asyncio
+import socket
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from time import gmtime, strftime
+from GameOfLife.helper import Helper
+from GameOfLife.server import Server, gol_methods
+from GameOfLife.active_engine import ActiveEngine
+from GameOfLife.game_store import GameStore
+from GameOfLife.cycle_detector import CycleDetector
+from GameOfLife.instrumentation import log, configure
+
+
+# asyncio implementation of the server protocol. A single event loop serves all client sessions with
+# streams instead of one thread per connection, so idle or slow clients only cost a socket. The CPU-bound
+# requests (grid updates and homomorphic evaluations) run in a bounded thread pool.
+
+
+class AsyncServer(Server):
+    '''
+    Serves the same protocol as Server with an asyncio event loop
+
+    :param max_connections: number of client sessions served at the same time, further clients wait until
+                            a session ends
+    :param max_workers: number of threads computing requests
+    :param max_pending: number of requests computed or waiting for a worker thread, further requests are not
+                        read from their sockets until a slot is free
+    :param write_buffer_limit: number of bytes buffered for a client before the session waits for the client
+    :param game_cache_bytes: memory cap of the boards of the games kept by the server
+    '''
+
+    SERVER_ADRESS = "127.0.0.1"
+    PORT = 12345
+
+    def __init__(self, max_connections=1000, max_workers=4, max_pending=16, write_buffer_limit=1 << 20,
+                 game_cache_bytes=GameStore.MAX_BYTES):
+        super().__init__(game_cache_bytes)
+        self.max_connections = max_connections
+        self.max_pending = max_pending
+        self.write_buffer_limit = write_buffer_limit
+        self.executor = ThreadPoolExecutor(max_workers)
+
+        # created in start_server as they belong to the event loop
+        self.loop = None
+        self.connection_slots = None
+        self.pending_slots = None
+
+    async def receive_message(self, reader, codec=None):
+        '''
+        Receives a complete message from a stream and returns its type, its payload and its generation.
+        Encoded grids are decoded with the codec of the session in the thread pool, so decoding large boards
+        does not stall the other sessions. Returns None, None, 0 if the peer closed the connection between
+        two messages. Headers with a payload or grid above Helper.MAX_PAYLOAD or a
+        dtype outside Helper.GRID_DTYPES raise RuntimeError before the payload is read
+        '''
+
+        try:
+            header = await reader.readexactly(Helper.HEADER.size)
+        except asyncio.IncompleteReadError as error:
+            if error.partial:
+                raise RuntimeError("socket connection broken")
+            return None, None, 0
+        # validates length, dtype and shape chosen by the peer, see Helper.unpack_header
+        message_type, generation, length, dtype, shape = Helper.unpack_header(header)
+
+        try:
+            payload = await reader.readexactly(length)
+        except asyncio.IncompleteReadError:
+            raise RuntimeError("socket connection broken")
+
+        if dtype is not None and not message_type & Helper.ENCODED:
+            payload = np.frombuffer(payload, dtype=dtype).reshape(shape)
+        if message_type & Helper.ENCODED:
+            message_type, payload = await self.run_in_executor(Helper.decode_message, message_type, payload, dtype,
+                                                               shape, codec)
+        return message_type, payload, generation
+
+    async def send_message(self, writer, message_type, payload, generation=0, codec=None):
+        '''
+        Sends a message and waits while the client does not keep up with reading. Grids of a session with
+        compression are encoded in the thread pool, so encoding large boards does not stall the other sessions.
+        '''
+
+        if codec is not None and isinstance(payload, np.ndarray):
+            header, payload = await self.run_in_executor(Helper.pack_message, message_type, payload, generation, codec)
+        else:
+            header, payload = Helper.pack_message(message_type, payload, generation, codec)
+        writer.write(header)
+        writer.write(payload)
+        await writer.drain()
+
+    async def run_in_executor(self, function, *args):
+        '''
+        Computes function(*args) in the thread pool once one of the max_pending slots is free
+        '''
+
+        async with self.pending_slots:
+            return await self.loop.run_in_executor(self.executor, function, *args)
+
+    async def run_request(self, reader, writer, payload, session):
+        '''
+        Asynchronous version of Server.run_request. The socket is read concurrently to the run to notice
+        a STOP of the client.
+        :return: the pending read of the next message if the run ended before the client sent one
+        '''
+
+        codec = session.get("codec")
+        generations, frame_interval = Helper.RUN_PARAMETERS.unpack(payload)
+        frame_interval = max(frame_interval, 1)
+        message_type, grid, _ = await self.receive_message(reader, codec)
+        if message_type != Helper.PLAIN_GRID or not isinstance(grid, np.ndarray):
+            raise RuntimeError("RUN has to be followed by a grid")
+        log.info("[SERVER] Run of %s generations started", generations or "unlimited")
+
+        # over many generations only the active regions of the board are recomputed
+        engine = ActiveEngine(grid, update_grid=gol_methods.next_generation)
+        detector = CycleDetector()
+        detector.record(engine.grid)
+        next_message = asyncio.ensure_future(self.receive_message(reader, codec))
+        generation = 0
+        while (generations == 0 or generation < generations) and not next_message.done():
+            if not detector.advance():
+                period = await self.run_in_executor(self.step_engine, engine, detector)
+                if period is not None:
+                    log.info("[SERVER] Period %d detected after %d generations", period, generation + 1)
+                    await self.send_message(writer, Helper.PERIOD, b'', period)
+            generation += 1
+            if generation % frame_interval == 0:
+                await self.send_message(writer, Helper.FRAME, self.run_grid(engine, detector), generation, codec)
+
+        # the client always receives the last computed generation
+        if generation % frame_interval:
+            await self.send_message(writer, Helper.FRAME, self.run_grid(engine, detector), generation, codec)
+        await self.send_message(writer, Helper.RUN_DONE, b'', generation)
+        log.info("[SERVER] Run ended after %d generations", generation)
+
+        if next_message.done():
+            message_type, _, _ = next_message.result()
+            if message_type not in (Helper.STOP, None):
+                raise RuntimeError("only STOP is allowed during a run")
+            return None
+        return next_message
+
+    async def client_session(self, reader, writer):
+        '''
+        Serves all requests of a client session until the client closes the connection
+        :param reader: StreamReader of the connection
+        :param writer: StreamWriter of the connection
+        :return:
+        '''
+
+        ip, port = [str(part) for part in writer.get_extra_info('peername')[:2]]
+        log.info('[SERVER] Accepting connection from %s:%s', ip, port)
+
+        sock = writer.get_extra_info('socket')
+        if sock is not None:
+            # sessions exchange many small request / reply messages
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        writer.transport.set_write_buffer_limits(high=self.write_buffer_limit)
+
+        session = {}
+        try:
+            async with self.connection_slots:
+                log.info("[SERVER] Session started")
+                next_message = None
+                while True:
+                    if next_message is None:
+                        next_message = self.receive_message(reader, session.get("codec"))
+                    message_type, payload, generation = await next_message
+                    next_message = None
+                    if message_type is None:
+                        break # client ended the session
+                    log.info("[SERVER] Input from client received competely")
+
+                    # runs stream their own replies, a STOP after the end of a run is ignored
+                    if message_type == Helper.RUN:
+                        next_message = await self.run_request(reader, writer, payload, session)
+                        continue
+                    if message_type == Helper.STOP:
+                        continue
+
+                    #send reply
+                    reply_type, reply = await self.run_in_executor(self.handle_message, message_type, payload, generation,
+                                                                   session)
+                    await self.send_message(writer, reply_type, reply, codec=session.get("codec"))
+        except (OSError, RuntimeError):
+            log.warning("[SERVER] Connection %s:%s broken", ip, port)
+        except Exception:
+            # a failing request ends its session, but never the server
+            log.exception("[SERVER] Request of %s:%s failed", ip, port)
+        finally:
+            self.close_session(session)
+            writer.close()
+        log.info("[SERVER] Connection %s:%s ended", ip, port)
+
+    def start_server(self):
+        '''
+        Starts the server and listens at the port, every client session is served by the event loop
+        :return:
+        '''
+
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self.connection_slots = asyncio.Semaphore(self.max_connections)
+        self.pending_slots = asyncio.Semaphore(self.max_pending)
+
+        server = self.loop.run_until_complete(
+            asyncio.start_server(self.client_session, self.SERVER_ADRESS, self.PORT, backlog=self.max_connections,
+                                 reuse_address=True))
+        log.info('[SERVER] Socket now listening %s:%s', self.SERVER_ADRESS, self.PORT)
+
+        try:
+            self.loop.run_forever()
+        finally:
+            server.close()
+            self.loop.run_until_complete(server.wait_closed())
+            self.executor.shutdown()
+            self.loop.close()
+
+
+# --------------------- START MAIN -------------------------
+if __name__== '__main__':
+    print(strftime("%Y-%m-%d %H:%M:%S", gmtime()))
+    configure()
+    server = AsyncServer()
+    server.start_server()
@@ -0,0 +1,218 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+@author: Patrick Tu & Kathrin Witzlsperger
+"""
+
+import argparse
+import json
+import socket
+import threading
+import time
+import numpy as np
+import gameOfLife
+from server_simulation import Threaded_server
+from GameOfLife.async_server import AsyncServer
+from GameOfLife.instrumentation import metrics, configure
+
+
+class BatchRunner:
+    '''
+    Drives the update pipeline of GameOfLife without the GUI and as fast as possible, for a number of
+    generations of a board of a given size, and measures the throughput and the latency per generation.
+
+    Engines of the plaintext mode, all computed by the TCP server:
+        step     one request per generation (GameOfLife.update_grid)
+        run      one streamed run, every frame_interval-th generation is sent back
+        advance  one jump over all generations, HashLife for power of two boards
+
+    Engines of the homomorphic mode, on the simulated server or with remote on the TCP server:
+        cells    every cell encrypted on its own
+        batched  the cells batched into as few ciphertexts as possible
+        rules    the batched board, the server counts the neighbours and applies the rules
+
+    :param dim: dimension of the board
+    :param generations: number of generations
+    :param mode: plain or he
+    :param engine: engine of the mode, see above
+    :param remote: whether the homomorphic engines use the TCP server instead of the simulated server
+    :param threads: number of threads encrypting, decrypting and evaluating in parallel
+    :param frame_interval: frame interval of the run engine
+    :param shared_memory: whether step and advance hand the grids to the TCP server through shared memory
+    :param compression: whether the plain grids are exchanged with the TCP server as compressed deltas
+    :param server_session: whether the TCP server keeps the board and step and advance only send commands
+    :param detect_cycles: whether the generations of a periodic board are served from the memo of the client
+    '''
+
+    ENGINES = {"plain": ["step", "run", "advance"],
+               "he": ["cells", "batched", "rules"]}
+
+    def __init__(self, dim, generations, mode="plain", engine="step", remote=False, threads=1, frame_interval=1,
+                 shared_memory=False, compression=True, server_session=False, detect_cycles=True):
+
+        if engine not in self.ENGINES.get(mode, []):
+            raise ValueError("Unknown engine {} for mode {}".format(engine, mode))
+
+        self.dim = dim
+        self.generations = generations
+        self.mode = mode
+        self.engine = engine
+        self.remote = remote
+        self.threads = threads
+        self.frame_interval = frame_interval
+        self.shared_memory = shared_memory
+        self.compression = compression
+        self.server_session = server_session
+        self.detect_cycles = detect_cycles
+
+    def run(self):
+        '''
+        Runs the generations and returns the measurements as dictionary
+        '''
+
+        game = gameOfLife.GameOfLife(self.dim, batching=self.engine == "batched",
+                                     server_side_rules=self.engine == "rules",
+                                     remote_homomorphic_encryption=self.remote, threads=self.threads,
+                                     shared_memory=self.shared_memory, compression=self.compression,
+                                     server_session=self.server_session, detect_cycles=self.detect_cycles)
+        server = None
+        try:
+            # parameters, keys and the simulated server are set up before the clock starts
+            start = time.perf_counter()
+            if self.mode == "he":
+                encryption = game.setup_encryption()
+                if not self.remote:
+                    server = Threaded_server(self.dim, encryption.context, encryption.galois_keys,
+                                             encryption.evaluation_keys, self.threads)
+                    server.start()
+            setup = time.perf_counter() - start
+
+            start = time.perf_counter()
+            latencies = self.run_generations(game, server)
+            elapsed = time.perf_counter() - start
+        finally:
+            game.close()
+            if server is not None:
+                server.stop()
+
+        results = {"dim": self.dim, "generations": self.generations, "mode": self.mode, "engine": self.engine,
+                   "remote": self.remote, "threads": self.threads,
+                   "shared_memory": self.shared_memory, "compression": self.compression,
+                   "server_session": self.server_session, "detect_cycles": self.detect_cycles,
+                   "period": game.period, "setup_s": setup, "elapsed_s": elapsed,
+                   "generations_per_s": self.generations / elapsed,
+                   "cells_per_s": self.generations * self.dim * self.dim / elapsed}
+        results.update(self.latency_summary(latencies))
+        # stage timers of client and, if it runs in this process, server
+        results["stages"] = metrics.snapshot()
+        return results
+
+    def run_generations(self, game, server):
+        '''
+        Computes the generations with the engine and returns the latencies in seconds, per generation
+        for step and the homomorphic engines, per streamed frame for run and of the whole jump for advance
+        '''
+
+        latencies = []
+
+        if self.engine == "advance":
+            start = time.perf_counter()
+            game.advance(self.generations)
+            latencies.append(time.perf_counter() - start)
+
+        elif self.engine == "run":
+            last = [time.perf_counter()]
+
+            def frame_callback(generation, grid):
+                now = time.perf_counter()
+                latencies.append(now - last[0])
+                last[0] = now
+
+            game.run_without_homomorphic_encryption(self.generations, self.frame_interval, frame_callback)
+
+        else:
+            for _ in range(self.generations):
+                start = time.perf_counter()
+                game.update_grid(server, self.mode == "he")
+                latencies.append(time.perf_counter() - start)
+
+        return latencies
+
+    @staticmethod
+    def latency_summary(latencies):
+        '''
+        Returns mean, percentiles and maximum of the latencies in milliseconds
+        '''
+
+        if not latencies:
+            return {}
+        latencies = np.array(latencies) * 1000
+        return {"latency_mean_ms": float(latencies.mean()),
+                "latency_p50_ms": float(np.percentile(latencies, 50)),
+                "latency_p95_ms": float(np.percentile(latencies, 95)),
+                "latency_p99_ms": float(np.percentile(latencies, 99)),
+                "latency_max_ms": float(latencies.max())}
+
+
+def start_server(timeout=10):
+    '''
+    Starts the TCP server in a background thread of this process and waits until it accepts connections
+    '''
+
+    server = AsyncServer()
+    threading.Thread(target=server.start_server, daemon=True).start()
+
+    deadline = time.time() + timeout
+    while True:
+        try:
+            socket.create_connection((gameOfLife.GameOfLife.SERVER_ADRESS, gameOfLife.GameOfLife.PORT)).close()
+            return server
+        except OSError:
+            if time.time() > deadline:
+                raise
+            time.sleep(0.05)
+
+
+# --------------------- START MAIN -------------------------
+if __name__== '__main__':
+    parser = argparse.ArgumentParser(description="Runs Conway's Game of Life without GUI and measures its speed")
+    parser.add_argument("--dim", type=int, default=15, help="dimension of the board")
+    parser.add_argument("--generations", type=int, default=100, help="number of generations")
+    parser.add_argument("--mode", choices=sorted(BatchRunner.ENGINES), default="plain")
+    parser.add_argument("--engine", help="step, run or advance for plain, cells, batched or rules for he "
+                                         "(default: step / batched)")
+    parser.add_argument("--remote", action="store_true",
+                        help="homomorphic engines use the TCP server instead of the simulated server")
+    parser.add_argument("--threads", type=int, default=1)
+    parser.add_argument("--frame-interval", type=int, default=1, help="frame interval of the run engine")
+    parser.add_argument("--shared-memory", action="store_true",
+                        help="step and advance hand the grids to the TCP server through shared memory")
+    parser.add_argument("--no-compression", dest="compression", action="store_false",
+                        help="exchange the plain grids with the TCP server as raw int32 grids")
+    parser.add_argument("--server-session", action="store_true",
+                        help="the TCP server keeps the board, step and advance only send commands")
+    parser.add_argument("--no-cycle-detection", dest="detect_cycles", action="store_false",
+                        help="compute every generation even if the board is periodic")
+    parser.add_argument("--seed", type=int, help="seed of the random initial board")
+    parser.add_argument("--start-server", action="store_true", help="start the TCP server in this process")
+    parser.add_argument("--output", help="file the results are appended to as one JSON line")
+    parser.add_argument("--log-level", help="level of the tracing output of client and server, e.g. INFO or DEBUG")
+    args = parser.parse_args()
+
+    if args.seed is not None:
+        np.random.seed(args.seed)
+    engine = args.engine or BatchRunner.ENGINES[args.mode][0 if args.mode == "plain" else 1]
+    runner = BatchRunner(args.dim, args.generations, args.mode, engine, args.remote, args.threads,
+                         args.frame_interval, args.shared_memory, args.compression, args.server_session,
+                         args.detect_cycles)
+
+    configure(args.log_level)
+    if args.start_server:
+        start_server()
+    results = runner.run()
+
+    line = json.dumps(results, sort_keys=True)
+    print(line)
+    if args.output:
+        with open(args.output, 'a') as file:
+            file.write(line + "\n")
@@ -0,0 +1,274 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+@author: Patrick Tu & Kathrin Witzlsperger
+"""
+
+import argparse
+import contextlib
+import io
+import itertools
+import json
+import os
+import platform
+import shutil
+import socket
+import tempfile
+import threading
+import time
+from concurrent.futures import Future
+import numpy as np
+import gameOfLife
+import encryption
+from server_simulation import Threaded_server
+from GameOfLife.helper import Helper
+from GameOfLife.server import gol_methods
+from GameOfLife.key_store import KeyStore
+
+
+class Benchmark:
+    '''
+    Times every stage of the client / server pipeline on its own for a range of board sizes. The
+    stages of the homomorphic encryption are timed for every encryption mode, as long as the board
+    has at most HE_MAX_CELLS[mode] cells, larger boards would take minutes per repetition.
+
+    :param sizes: dimensions of the boards
+    :param repeat: number of timed repetitions of every stage
+    :param stages: names of the stages to time, all if None
+    :param modes: encryption modes of the homomorphic stages
+    :param key_store_directory: directory of the KeyStore which caches the keys between the sizes, a temporary
+                                directory removed after the run if None, so the keys of the user are never touched
+    '''
+
+    SIZES = [15, 64, 256, 1024, 4096]
+    REPEAT = 5
+
+    STAGES = ["live_neighbours", "update_grid", "serialization_npy", "serialization_frame", "socket_round_trip",
+              "encrypt_old_grid", "encrypt_live_neighbours_grid", "process_message", "decrypt_new_grid"]
+    HE_STAGES = STAGES[5:]
+
+    # encryption modes with the keyword arguments of Encryption and the largest number of cells timed
+    MODES = {"cells": {}, "batched": {"batching": True}, "rules": {"server_side_rules": True}}
+    HE_MAX_CELLS = {"cells": 256, "batched": 1 << 16, "rules": 1 << 12}
+
+    def __init__(self, sizes=SIZES, repeat=REPEAT, stages=None, modes=None, key_store_directory=None):
+
+        self.sizes = sizes
+        self.repeat = repeat
+        self.stages = stages or self.STAGES
+        self.modes = modes or list(self.MODES)
+        self.key_store_directory = key_store_directory
+        self.key_store = None
+
+    @staticmethod
+    def measure(function, repeat):
+        '''
+        Calls function once untimed and then repeat times and returns the statistics of the timings in milliseconds
+        '''
+
+        function()
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            function()
+            timings.append((time.perf_counter() - start) * 1000)
+        timings = np.array(timings)
+        return {"repeat": repeat,
+                "min_ms": float(timings.min()),
+                "median_ms": float(np.median(timings)),
+                "mean_ms": float(timings.mean()),
+                "max_ms": float(timings.max())}
+
+    def run(self):
+        '''
+        Times the stages for all sizes and returns the results as list of dictionaries
+        '''
+
+        directory = self.key_store_directory or tempfile.mkdtemp(prefix="gameoflife-benchmark-")
+        self.key_store = KeyStore(directory)
+        results = []
+        try:
+            for dim in self.sizes:
+                game = gameOfLife.GameOfLife(dim, key_store_directory=directory)
+                for stage, mode, function in itertools.chain(self.plain_stages(game), self.homomorphic_stages(game)):
+                    result = {"stage": stage, "mode": mode, "dim": dim}
+                    result.update(self.measure(function, self.repeat))
+                    print("[BENCHMARK]", stage, mode, dim, "{:.3f} ms".format(result["median_ms"]))
+                    results.append(result)
+                game.close()
+        finally:
+            if self.key_store_directory is None:
+                shutil.rmtree(directory, ignore_errors=True)
+        return results
+
+    def plain_stages(self, game):
+        '''
+        Yields (stage, "plain", function) for the stages without encryption. The echo server of the socket round
+        trip is shut down once the stage was timed, i.e. when the next stage is requested.
+        '''
+
+        grid = game.old_grid
+        stages = {"live_neighbours": game.live_neighbours,
+                  "update_grid": lambda: gol_methods.update_grid(grid),
+                  "serialization_npy": lambda: self.serialize_npy(grid),
+                  "serialization_frame": lambda: self.serialize_frame(grid)}
+        for stage in self.STAGES:
+            if stage in stages and stage in self.stages:
+                yield stage, "plain", stages[stage]
+
+        if "socket_round_trip" in self.stages:
+            with self.round_trip(grid) as send_and_receive:
+                yield "socket_round_trip", "plain", send_and_receive
+
+    def homomorphic_stages(self, game):
+        '''
+        Yields (stage, mode, function) for the stages of the homomorphic encryption in every mode the board fits.
+        The encryption of a mode is closed once the stages of the mode were timed, i.e. when the next stage
+        is requested.
+        '''
+
+        dim = game.N
+        for mode in self.modes:
+            if not any(stage in self.stages for stage in self.HE_STAGES) or dim * dim > self.HE_MAX_CELLS[mode]:
+                continue
+
+            encryption_mode = encryption.Encryption(dim=dim, key_store=self.key_store, **self.MODES[mode])
+            server = Threaded_server(dim, encryption_mode.context, encryption_mode.galois_keys,
+                                     encryption_mode.evaluation_keys)
+            try:
+                game.live_neighbours()
+                message = {"encrypted_old_grid": encryption_mode.encrypt_old_grid(game.old_grid, dim)}
+                if not encryption_mode.server_side_rules:
+                    message["encrypted_live_neighbours_grid"] = \
+                        encryption_mode.encrypt_live_neighbours_grid(game.live_neighbours_grid, dim)
+                encrypted_new_grid = server.homomorphic_evaluator.evaluate(
+                    message["encrypted_old_grid"], message.get("encrypted_live_neighbours_grid"))
+
+                functions = {"encrypt_old_grid": lambda e=encryption_mode: e.encrypt_old_grid(game.old_grid, dim),
+                             "process_message": lambda s=server, m=message: s.processMessage(m, Future()),
+                             "decrypt_new_grid": lambda e=encryption_mode, g=encrypted_new_grid:
+                                 e.decrypt_new_grid(g, dim)}
+                if not encryption_mode.server_side_rules:
+                    functions["encrypt_live_neighbours_grid"] = \
+                        lambda e=encryption_mode: e.encrypt_live_neighbours_grid(game.live_neighbours_grid, dim)
+
+                for stage in self.HE_STAGES:
+                    if stage in functions and stage in self.stages:
+                        yield stage, mode, functions[stage]
+            finally:
+                server.stop()
+                encryption_mode.close()
+
+    @staticmethod
+    def serialize_npy(grid):
+        '''
+        Serializes and deserializes the grid with np.save / np.load, as the protocol did before the framing
+        '''
+
+        buffer = io.BytesIO()
+        np.save(buffer, grid)
+        buffer.seek(0)
+        return np.load(buffer)
+
+    @staticmethod
+    def serialize_frame(grid):
+        '''
+        Serializes and deserializes the grid with the framing of Helper
+        '''
+
+        header, payload = Helper.pack_message(Helper.PLAIN_GRID, grid)
+        _, _, _, dtype, shape = Helper.unpack_header(header)
+        return np.frombuffer(bytes(payload), dtype=dtype).reshape(shape)
+
+    @staticmethod
+    @contextlib.contextmanager
+    def round_trip(grid):
+        '''
+        Starts a local echo server and yields a function sending the grid to it and receiving it back. Both
+        sockets are closed and the echo thread is joined on exit.
+        '''
+
+        def echo(conn):
+            with conn:
+                while True:
+                    message_type, payload, generation = Helper.receive_message(conn)
+                    if message_type is None:
+                        break
+                    Helper.send_message(conn, message_type, payload, generation)
+
+        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as listener, \
+                socket.socket(socket.AF_INET, socket.SOCK_STREAM) as client:
+            listener.bind(("127.0.0.1", 0))
+            listener.listen(1)
+            client.connect(listener.getsockname())
+            conn, _ = listener.accept()
+            client.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            echo_thread = threading.Thread(target=echo, args=(conn,), daemon=True)
+            echo_thread.start()
+
+            def send_and_receive():
+                Helper.send_message(client, Helper.PLAIN_GRID, grid)
+                return Helper.receive_message(client)
+
+            try:
+                yield send_and_receive
+            finally:
+                # the echo thread ends with the connection
+                client.close()
+                echo_thread.join()
+
+    @staticmethod
+    def compare(baseline, results, threshold=1.1):
+        '''
+        Compares the median timings with the ones of a baseline run
+
+        :param baseline: results of the baseline run
+        :param results: results of this run
+        :param threshold: ratio of the medians from which a stage counts as regression
+        :return: list of (stage, mode, dim, ratio) of the stages that got slower by at least threshold
+        '''
+
+        baseline_medians = {(r["stage"], r["mode"], r["dim"]): r["median_ms"] for r in baseline}
+        regressions = []
+        for result in results:
+            key = (result["stage"], result["mode"], result["dim"])
+            if key in baseline_medians and baseline_medians[key] > 0:
+                ratio = result["median_ms"] / baseline_medians[key]
+                if ratio >= threshold:
+                    regressions.append(key + (ratio,))
+        return regressions
+
+
+# --------------------- START MAIN -------------------------
+if __name__== '__main__':
+    parser = argparse.ArgumentParser(description="Times every stage of the Game of Life pipeline")
+    parser.add_argument("--sizes", type=int, nargs="+", default=Benchmark.SIZES, help="dimensions of the boards")
+    parser.add_argument("--repeat", type=int, default=Benchmark.REPEAT, help="timed repetitions per stage")
+    parser.add_argument("--stages", nargs="+", choices=Benchmark.STAGES, help="stages to time (default: all)")
+    parser.add_argument("--modes", nargs="+", choices=sorted(Benchmark.MODES), help="encryption modes (default: all)")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the random boards")
+    parser.add_argument("--output", default="benchmark.json", help="JSON file the results are written to")
+    parser.add_argument("--baseline", help="JSON file of an earlier run to compare with")
+    parser.add_argument("--threshold", type=float, default=1.1, help="slowdown reported as regression")
+    parser.add_argument("--key-store", help="directory caching the keys between runs (default: a temporary "
+                                            "directory removed after the run)")
+    args = parser.parse_args()
+
+    np.random.seed(args.seed)
+    results = Benchmark(args.sizes, args.repeat, args.stages, args.modes, args.key_store).run()
+
+    with open(args.output, 'w') as file:
+        json.dump({"time": time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime()),
+                   "python": platform.python_version(),
+                   "numpy": np.__version__,
+                   "machine": platform.machine(),
+                   "cpus": os.cpu_count(),
+                   "results": results}, file, indent=1)
+    print("[BENCHMARK] Results written to", args.output)
+
+    if args.baseline:
+        with open(args.baseline) as file:
+            baseline = json.load(file)["results"]
+        for stage, mode, dim, ratio in Benchmark.compare(baseline, results, args.threshold):
+            print("[BENCHMARK] Regression", stage, mode, dim, "{:.2f}x slower".format(ratio))
@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+@author: Patrick Tu & Kathrin Witzlsperger
+"""
+
+import numpy as np
+
+
+class BitEngine:
+    '''
+    Stepping engine on a bit-packed board. Every row of the board is packed into uint64 words with
+    one bit per cell, where bit j of word w holds the cell in column 64 * w + j and the bits behind
+    the last column are 0. The neighbour counts of 64 cells are computed at once by a bit-sliced
+    adder, i.e. the binary digits of all counts are kept in separate bitboards. Boards without
+    cells are rejected with a ValueError.
+    '''
+
+    WORD_BITS = 64
+
+    @staticmethod
+    def words(cols):
+        '''
+        Returns the number of uint64 words of a packed row with cols cells
+        '''
+
+        return -(-cols // BitEngine.WORD_BITS)
+
+    @staticmethod
+    def pack(grid):
+        """
+        Packs a dense N x M grid of 0 and 1 into a N x words(M) numpy array of dtype uint64
+        """
+
+        grid = np.asarray(grid)
+        rows, cols = grid.shape
+        if rows == 0 or cols == 0:
+            raise ValueError("board without cells")
+        words = BitEngine.words(cols)
+
+        packed_bytes = np.zeros((rows, words * 8), dtype=np.uint8)
+        packed_bytes[:, :-(-cols // 8)] = np.packbits(grid != 0, axis=1, bitorder='little')
+        return packed_bytes.view('<u8').astype(np.uint64, copy=False)
+
+    @staticmethod
+    def unpack(packed, cols):
+        """
+        Unpacks a bit-packed board into a dense grid with cols columns as numpy array of dtype int32
+        """
+
+        packed_bytes = np.ascontiguousarray(packed, dtype='<u8').view(np.uint8)
+        return np.unpackbits(packed_bytes, axis=1, count=cols, bitorder='little').astype('i')
+
+    @staticmethod
+    def shift_west(packed, cols):
+        '''
+        Returns the board whose cell (i, j) holds the cell (i, j - 1) of the packed board, the first
+        column takes the last column
+        '''
+
+        last = (cols - 1) % BitEngine.WORD_BITS
+        shifted = packed << np.uint64(1)
+        # bit 63 of a word carries over into bit 0 of the next word
+        shifted[:, 1:] |= packed[:, :-1] >> np.uint64(63)
+        shifted[:, 0] |= (packed[:, -1] >> np.uint64(last)) & np.uint64(1)
+        # the last column moved into the unused bits of the last word
+        shifted[:, -1] &= np.uint64((1 << (last + 1)) - 1)
+        return shifted
+
+    @staticmethod
+    def shift_east(packed, cols):
+        '''
+        Returns the board whose cell (i, j) holds the cell (i, j + 1) of the packed board, the last
+        column takes the first column
+        '''
+
+        last = (cols - 1) % BitEngine.WORD_BITS
+        shifted = packed >> np.uint64(1)
+        # bit 0 of a word carries over into bit 63 of the previous word
+        shifted[:, :-1] |= packed[:, 1:] << np.uint64(63)
+        shifted[:, -1] |= (packed[:, 0] & np.uint64(1)) << np.uint64(last)
+        return shifted
+
+    @staticmethod
+    def update_packed(packed, cols):
+        """
+        Applies Conway's rules to a bit-packed board with cols columns, which wraps around at
+        its edges, and returns the new packed board
+        """
+
+        if packed.size == 0 or cols == 0:
+            raise ValueError("board without cells")
+        west = BitEngine.shift_west(packed, cols)
+        east = BitEngine.shift_east(packed, cols)
+
+        # the 8 neighbour bitboards: the row above and below with their west and east neighbours
+        # and the west and east neighbours in the same row
+        neighbours = [west, east]
+        for rows in (west, packed, east):
+            neighbours.append(np.roll(rows, 1, axis=0))
+            neighbours.append(np.roll(rows, -1, axis=0))
+
+        # bit-sliced count of the live neighbours modulo 8, 8 neighbours count as 0 which
+        # like 0 or 1 neighbours is neither 2 nor 3
+        ones = np.zeros_like(packed)
+        twos = np.zeros_like(packed)
+        fours = np.zeros_like(packed)
+        for neighbour in neighbours:
+            carry = ones & neighbour
+            ones ^= neighbour
+            fours ^= twos & carry
+            twos ^= carry
+
+        # a cell lives in the next generation if it has exactly 3 live neighbours (reproduction
+        # or continue living) or if it is alive and has exactly 2 live neighbours (continue living)
+        return twos & ~fours & (ones | packed)
+
+    @staticmethod
+    def update_grid(old_grid):
+        """
+        Applies Conway's rules to a dense grid with the bit-packed kernel and returns the new grid
+        as a numpy array of dtype int32.
+        """
+
+        cols = np.shape(old_grid)[1]
+        return BitEngine.unpack(BitEngine.update_packed(BitEngine.pack(old_grid), cols), cols)
@@ -7,13 +7,26 @@
 
 import tkinter
 import time
+import numpy as np
 from time import gmtime, strftime
 import threading
 import queue
 import gameOfLife
 from server_simulation import Threaded_server
+from GameOfLife.instrumentation import log, metrics, configure
 
 class Gui:
+
+    # edge length of a cell in pixels, reduced for boards that would not fit into CANVAS_SIZE
+    CELL_SIZE = 30
+    CANVAS_SIZE = 900
+
+    # boards up to this dimension are drawn as one rectangle per cell, larger boards as one bitmap
+    RECTANGLE_LIMIT = 100
+
+    # colours of dead and live cells in the bitmap
+    PALETTE = np.array([[255, 255, 255], [0, 0, 255]], dtype=np.uint8)
+
     def __init__(self, dim, root, queue, startCommand, stopCommand):
         """
         Set up GUI elements consisting of start and stop button,
@@ -25,27 +38,40 @@ class Gui:
 
         # dimension of grid (number of cells = dim*dim)
         self.dim = dim
+        self.cell_size = min(self.CELL_SIZE, max(1, self.CANVAS_SIZE // dim))
+        size = self.dim * self.cell_size
 
         frame = tkinter.Frame(root)
         frame.pack()
 
         # canvas element for visualization of grid
         self.canvas = tkinter.Canvas(frame,
-                                     width=self.dim*30,
-                                     height=self.dim*30,
+                                     width=size,
+                                     height=size,
                                      background='white')
         self.canvas.pack()
 
-        # list of rectangles (= cells) on canvas element
-        self.rect = [[None for row in range(self.dim)] for col in range(self.dim)]
-        for row in range(self.dim):
-            for col in range(self.dim):
-                self.rect[row][col] = self.canvas.create_rectangle(row*30, col*30,
-                                                                   (row+1)*30,
-                                                                   (col+1)*30,
-                                                                   width=1,
-                                                                   fill='white',
-                                                                   outline='white')
+        # generation currently shown on the canvas, all cells are dead initially
+        self.drawn = np.zeros((self.dim, self.dim), dtype=bool)
+
+        self.rect = None
+        self.image = None
+        if self.dim <= self.RECTANGLE_LIMIT:
+            # list of rectangles (= cells) on canvas element
+            self.rect = [[None for row in range(self.dim)] for col in range(self.dim)]
+            for row in range(self.dim):
+                for col in range(self.dim):
+                    self.rect[row][col] = self.canvas.create_rectangle(row*self.cell_size, col*self.cell_size,
+                                                                       (row+1)*self.cell_size,
+                                                                       (col+1)*self.cell_size,
+                                                                       width=1,
+                                                                       fill='white',
+                                                                       outline='white')
+        else:
+            # a single bitmap, the rows of the grid are its columns like for the rectangles
+            self.image = tkinter.PhotoImage(width=size, height=size)
+            self.image.put('white', to=(0, 0, size, size))
+            self.canvas.create_image(0, 0, image=self.image, anchor=tkinter.NW)
 
         bottomframe = tkinter.Frame(root)
         bottomframe.pack(side = tkinter.BOTTOM)
@@ -70,31 +96,61 @@ class Gui:
 
 
     def processIncoming(self):
-        """Handle all messages (newly computed generations) currently in the queue, if any."""
+        """
+        Draw the newest generation currently in the queue, if any. Older generations in the
+        queue are skipped, they would be overdrawn before they become visible.
+        """
+        msg = None
         while self.queue.qsize():
             try:
                 msg = self.queue.get(0)
-                # draw new grid generation
-                for row in range(self.dim):
-                    for col in range(self.dim):
-                        if msg[row][col] == 1:
-                            # draw corresponding canvas rectangle (= cell) blue (= live)
-                            self.canvas.itemconfig(self.rect[row][col],
-                                                   fill='blue',
-                                                   outline='grey')
-                        if msg[row][col] == 0:
-                            # draw corresponding canvas rectangle (= cell) white (= dead)
-                            self.canvas.itemconfig(self.rect[row][col],
-                                                   fill='white',
-                                                   outline='white')
-                self.canvas.update()
             except queue.Empty:
-                print("empty queue")
+                log.info("[CLIENT / GUI] empty queue")
+        if msg is None:
+            return
+
+        with metrics.timer("render"):
+            grid = np.asarray(msg) == 1
+            if self.image is not None:
+                self.drawImage(grid)
+            else:
+                self.drawRectangles(grid)
+            self.drawn = grid
+
+    def drawRectangles(self, grid):
+        """Recolour the rectangles of the cells which changed since the last drawn generation."""
+        for row, col in np.argwhere(grid != self.drawn):
+            if grid[row, col]:
+                # draw corresponding canvas rectangle (= cell) blue (= live)
+                self.canvas.itemconfig(self.rect[row][col],
+                                       fill='blue',
+                                       outline='grey')
+            else:
+                # draw corresponding canvas rectangle (= cell) white (= dead)
+                self.canvas.itemconfig(self.rect[row][col],
+                                       fill='white',
+                                       outline='white')
+
+    def drawImage(self, grid):
+        """Blit the bounding box of the cells which changed since the last drawn generation into the bitmap."""
+        rows, cols = np.nonzero(grid != self.drawn)
+        if len(rows) == 0:
+            return
+        row0, row1 = rows.min(), rows.max() + 1
+        col0, col1 = cols.min(), cols.max() + 1
+
+        # pixels of the box as binary PPM, x runs along the rows of the grid
+        pixels = self.PALETTE[grid[row0:row1, col0:col1].T.astype(np.uint8)]
+        pixels = pixels.repeat(self.cell_size, axis=0).repeat(self.cell_size, axis=1)
+        height, width = pixels.shape[:2]
+        ppm = "P6 {} {} 255 ".format(width, height).encode() + pixels.tobytes()
+        self.image.put(ppm, to=(row0 * self.cell_size, col0 * self.cell_size))
 
 
 class ThreadedClient:
    
-    def __init__(self, dim, root):
+    def __init__(self, dim, root, batching=True, server_side_rules=False, remote_homomorphic_encryption=False,
+                 threads=1):
         """
         Set up threaded client by initializing message queue and GUI.
         """
@@ -104,6 +160,15 @@ class ThreadedClient:
         # dimension of grid
         self.dim = dim
 
+        # pack the grid into batched ciphertexts when using homomorphic encryption
+        self.batching = batching
+        # let the (simulated) server count the neighbours and apply the rules on the encrypted board
+        self.server_side_rules = server_side_rules
+        # send the encrypted grids to the TCP server instead of the simulated server
+        self.remote_homomorphic_encryption = remote_homomorphic_encryption
+        # number of threads encrypting, decrypting and evaluating in parallel
+        self.threads = threads
+
         # create the queue
         self.queue = queue.Queue()
 
@@ -129,7 +194,7 @@ class ThreadedClient:
         if self.running:
             self.gui.processIncoming()
         if not self.running:
-            print("[CLIENT / GUI] Not running")
+            log.debug("[CLIENT / GUI] Not running")
         self.root.after(200, self.periodicCall)
 
     def workerThread(self):
@@ -139,31 +204,57 @@ class ThreadedClient:
         '''
 
         # create new game
-        game = gameOfLife.GameOfLife(self.dim)
+        game = gameOfLife.GameOfLife(self.dim, batching=self.batching, server_side_rules=self.server_side_rules,
+                                     remote_homomorphic_encryption=self.remote_homomorphic_encryption,
+                                     threads=self.threads)
 
-        # create queue for simulated client server communication
-        self.server_to_client_queue = queue.Queue() #queue sending messages to server
-        self.client_to_server_queue = queue.Queue() #queue receiving from server
-        server = Threaded_server(dim,self.server_to_client_queue, self.client_to_server_queue, game.encryption.context)
-        server.start() # start server as a thread
+        # simulated server for the homomorphic updates, started when homomorphic encryption is used for the first time
+        server = None
 
         generation = 0
 
         while self.running:
-            print("[CLIENT / GUI] Generation", generation)
-            print("[CLIENT / GUI] Homomorphic encryption == ", self.gui.homomorphic_encryption.get())
+            log.info("[CLIENT / GUI] Generation %d", generation)
+            log.info("[CLIENT / GUI] Homomorphic encryption == %s", self.gui.homomorphic_encryption.get())
             if generation == 0:
                 # grid initialization
                 msg = game.old_grid
+            elif not self.gui.homomorphic_encryption.get():
+                # the server keeps computing and streams the frames until the game is stopped or encryption is ticked
+                generation += game.run_without_homomorphic_encryption(
+                    frame_callback=lambda frame_generation, grid: self.showFrame(game, grid))
+                continue
             else:
                 # compute new grid state
                 time.sleep(0.1)
-                game.update_grid(self.server_to_client_queue, self.client_to_server_queue, self.gui.homomorphic_encryption.get())
+                if server is None and not self.remote_homomorphic_encryption:
+                    encryption = game.setup_encryption()
+                    server = Threaded_server(self.dim, encryption.context, encryption.galois_keys,
+                                             encryption.evaluation_keys, self.threads)
+                    server.start() # start server as a thread
+                game.update_grid(server, self.gui.homomorphic_encryption.get())
                 msg = game.new_grid
             generation += 1
             # add to message queue and hand it over to GUI to visualize it
             self.queue.put(msg)
 
+        # end the session with the TCP server and the simulated server
+        game.close()
+        if server is not None:
+            server.stop()
+
+    def showFrame(self, game, grid):
+        '''
+        Hands a frame streamed by the server over to the GUI and stops the run of the server
+        if the game was stopped or homomorphic encryption was ticked
+        '''
+
+        self.queue.put(grid)
+        # throttles the server to the rendering rate
+        time.sleep(0.1)
+        if not self.running or self.gui.homomorphic_encryption.get():
+            game.stop_run()
+
     def stopApplication(self):
         '''
         Gets executed when the stop button is pressed.
@@ -174,7 +265,7 @@ class ThreadedClient:
         self.running = 0
         with self.queue.mutex:
             self.queue.queue.clear()
-        print("[CLIENT / GUI] Application stopped")
+        log.info("[CLIENT / GUI] Application stopped")
 
     def startApplication(self):
         '''
@@ -183,18 +274,19 @@ class ThreadedClient:
         '''
 
         if self.running == 1:
-            print("[CLIENT / GUI] already running")
+            log.info("[CLIENT / GUI] already running")
             return
         self.running = 1
         self.thread = threading.Thread(target=self.workerThread)
         self.thread.setDaemon(True)
         self.thread.start()
-        print(" [CLIENT / GUI] Application started")
+        log.info("[CLIENT / GUI] Application started")
 
 
 # --------------------- START MAIN -------------------------
 if __name__== '__main__':
     print(strftime("%Y-%m-%d %H:%M:%S", gmtime()))
+    configure()
     
     root = tkinter.Tk()
     root.title('Conway\'s Game of Life')
@@ -0,0 +1,101 @@
+'''
+@Author: Patrick Tu & Kathrin Witzlsperger
+
+'''
+
+import hashlib
+from collections import deque
+import numpy as np
+
+
+class CycleDetector:
+    '''
+    Detects when a board became a still life (period 1) or an oscillator. Every generation is
+    fingerprinted by a hash of its bit-packed board, and the fingerprints and packed boards of the last
+    generations are kept in a bounded history. When a fingerprint repeats and the stored board is equal,
+    the board is periodic and the boards of one period are the memo from which all later generations
+    are served without computing them.
+
+    :param max_period: longest period detected
+    :param max_bytes: memory of the packed boards in the history, larger boards have a shorter history
+    '''
+
+    MAX_PERIOD = 64
+    MAX_BYTES = 64 << 20
+
+    def __init__(self, max_period=MAX_PERIOD, max_bytes=MAX_BYTES):
+
+        self.max_period = max_period
+        self.max_bytes = max_bytes
+        self.reset()
+
+    def reset(self):
+        '''
+        Forgets the history, e.g. because the board was changed from outside
+        '''
+
+        # (fingerprint, packed board) of the recorded generations, the current generation last
+        self.history = deque()
+        # number of the last generation with the fingerprint in the history
+        self.generations = {}
+        self.generation = -1
+        self.shape = None
+
+        # packed boards of one period starting after the board that repeated, and the current position in it
+        self.cycle = None
+        self.position = 0
+        self.period = None
+
+    def record(self, grid):
+        '''
+        Records the next generation of the board
+
+        :return: the period if the board just turned out to be periodic, None otherwise
+        '''
+
+        packed = np.packbits(np.asarray(grid, dtype=np.uint8).ravel())
+        fingerprint = hashlib.blake2b(packed, digest_size=16).digest()
+        self.generation += 1
+        self.shape = np.shape(grid)
+
+        self.history.append((fingerprint, packed))
+        # one more board than the longest period, the board repeated is still in the history
+        length = min(self.max_period, max(self.max_bytes // packed.nbytes, 1)) + 1
+        while len(self.history) > length:
+            old_fingerprint, _ = self.history.popleft()
+            if self.generations[old_fingerprint] == self.generation - len(self.history):
+                del self.generations[old_fingerprint]
+
+        previous = self.generations.get(fingerprint)
+        self.generations[fingerprint] = self.generation
+        if previous is None:
+            return None
+
+        period = self.generation - previous
+        # the hash only proposes the period, the boards decide
+        if not np.array_equal(self.history[-1 - period][1], packed):
+            return None
+        self.cycle = [board for _, board in list(self.history)[-period:]]
+        self.position = period - 1
+        self.period = period
+        return period
+
+    def advance(self, generations=1):
+        '''
+        Advances the board of a detected cycle by a number of generations
+
+        :return: False if no cycle was detected yet
+        '''
+
+        if self.cycle is None:
+            return False
+        self.position = (self.position + generations) % self.period
+        return True
+
+    def grid(self):
+        '''
+        Returns the current board of the detected cycle as numpy array of dtype int32
+        '''
+
+        rows, cols = self.shape
+        return np.unpackbits(self.cycle[self.position], count=rows * cols).reshape(self.shape).astype('i')
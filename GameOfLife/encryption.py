@@ -11,35 +11,294 @@ from seal import EncryptionParameters, \
                  KeyGenerator,         \
                  Ciphertext,           \
                  Decryptor,            \
+                 Evaluator,            \
                  Plaintext,            \
-                 SEALContext
+                 PolyCRTBuilder,       \
+                 GaloisKeys,           \
+                 EvaluationKeys,       \
+                 SEALContext,          \
+                 ChooserEncoder,       \
+                 ChooserEvaluator,     \
+                 ChooserPoly
+from GameOfLife.thread_pool import ThreadPool
+from GameOfLife.homomorphic_rules import HomomorphicRules
+from GameOfLife.zero_pool import ZeroPool
+from GameOfLife.instrumentation import log, metrics
 
 class Encryption:
     '''
     Provides encryption / encoding methods to realize the homomorphic operations
     '''
 
-    
-    def __init__(self):
+
+    # plain modulus used for batching, a prime congruent to 1 modulo 2*2048 so that
+    # the PolyCRTBuilder can pack one value per slot
+    BATCHING_PLAIN_MODULUS = 12289
+
+    # the server side rules need a multiplicative depth of 4, hence a larger polynomial
+    # modulus and a plain modulus that is a prime congruent to 1 modulo 2*8192
+    SERVER_SIDE_RULES_POLY_MODULUS_DEGREE = 8192
+    SERVER_SIDE_RULES_PLAIN_MODULUS = 65537
+
+    # decomposition bit count of the galois keys and evaluation keys
+    DECOMPOSITION_BIT_COUNT = 30
+
+    # degrees of the polynomial modulus tried by the automatic parameter selection, each with
+    # the coefficient modulus of SEAL for 128 bit security
+    POLY_MODULUS_DEGREES = [1024, 2048, 4096, 8192, 16384, 32768]
+
+    # noise budget in bits the chooser has to leave after one generation, its estimate
+    # is not exact and a generation must never fail to decrypt
+    NOISE_BUDGET_GAP = 20
+
+    # number of generations the pool of precomputed zeros holds encryptions for
+    ZERO_POOL_GENERATIONS = 2
+    # memory the pool of precomputed zeros may take, encrypting every cell of a large board needs more
+    # ciphertexts per generation than fit, the pool then covers only a part of a generation
+    ZERO_POOL_BYTES = 128 << 20
+
+    def __init__(self, batching=False, server_side_rules=False, threads=1, dim=None, precompute=False,
+                 key_store=None):
+        """
+        Set up the encryption parameters and keys. If batching is True, the whole grid is packed
+        into the slots of as few ciphertexts as possible using the PolyCRTBuilder instead of
+        encrypting every cell on its own. If server_side_rules is True, the board is batched with
+        a wrap-around halo and galois keys and evaluation keys are generated so that the server
+        can count the neighbours and apply the rules by itself. With more than one thread the
+        cells or batches are encrypted and decrypted in parallel. If the dimension of the board
+        is given, the smallest parameters for the board and the circuit of the server are selected
+        instead of the fixed ones. If precompute is True, encryptions of zero for the board of the
+        given dimension are precomputed in the background and the cells or batches are encrypted
+        by adding them onto these zeros. If a KeyStore is given, the keys are loaded from it and
+        only generated, and then stored, if it holds no keys for the parameters yet.
+        """
+
+        if precompute and dim is None:
+            raise ValueError("Precomputing encryptions needs the dimension of the board")
+
+        self.server_side_rules = server_side_rules
+        self.batching = batching or server_side_rules
+        self.thread_pool = ThreadPool(threads)
 
         # set parameters for encryption
-        parms = EncryptionParameters()
-        parms.set_poly_modulus("1x^2048 + 1")
-        parms.set_coeff_modulus(seal.coeff_modulus_128(2048))
-        parms.set_plain_modulus(1 << 8)
+        parms = None
+        if dim is not None:
+            parms = self.select_parameters(dim, self.batching, self.server_side_rules)
+            if parms is None:
+                log.warning("[ENCRYPTION] No parameters found for dimension %d, using the fixed parameters", dim)
+
+        if parms is None:
+            parms = self.fixed_parameters(self.batching, self.server_side_rules)
        
+        self.parms = parms
         self.context = SEALContext(parms)
-        keygen = KeyGenerator(self.context)
         self.encoder = IntegerEncoder(self.context.plain_modulus())
+        self.plain_modulus = self.context.plain_modulus().value()
+
+        if self.batching:
+            self.crtbuilder = PolyCRTBuilder(self.context)
+            self.slot_count = self.crtbuilder.slot_count()
       
-        public_key = keygen.public_key()
-        self.encryptor = Encryptor(self.context, public_key)
-      
-        secret_key = keygen.secret_key()
-        self.decryptor = Decryptor(self.context, secret_key)
-      
-        
-      
+        # keys of the client and, for server side rules, the keys handed to the server for rotations
+        # and relinearization
+        names = ["public_key", "secret_key"]
+        if self.server_side_rules:
+            names += ["galois_keys", "evaluation_keys"]
+        keys = key_store.load(parms, names) if key_store is not None else None
+        if keys is None:
+            keys = self.generate_keys(names)
+            if key_store is not None:
+                # a concurrent game may have stored its keys first, both games continue with those
+                keys = key_store.save(parms, keys)
+        else:
+            log.info("[ENCRYPTION] Keys loaded from the key store")
+
+        self.encryptor = Encryptor(self.context, keys["public_key"])
+        self.decryptor = Decryptor(self.context, keys["secret_key"])
+        self.galois_keys = keys.get("galois_keys")
+        self.evaluation_keys = keys.get("evaluation_keys")
+        log.info("[ENCRYPTION] Polynomial modulus %s, plain modulus %d", parms.poly_modulus().to_string(),
+                 self.plain_modulus)
+
+        # background pool of encryptions of zero, the plaintexts are added onto them online
+        self.zero_pool = None
+        if precompute:
+            self.evaluator = Evaluator(self.context)
+            self.zero_pool = ZeroPool(self.encryptor, self.zero_pool_size(dim))
+            self.zero_pool.start()
+
+    def generate_keys(self, names):
+        '''
+        Generates a new secret key and the keys derived from it
+
+        :param names: names of the keys to generate, out of public_key, secret_key, galois_keys and evaluation_keys
+        :return: dictionary of the keys by name
+        '''
+
+        keygen = KeyGenerator(self.context)
+        keys = {"public_key": keygen.public_key(), "secret_key": keygen.secret_key()}
+
+        if "galois_keys" in names:
+            keys["galois_keys"] = GaloisKeys()
+            keygen.generate_galois_keys(self.DECOMPOSITION_BIT_COUNT, keys["galois_keys"])
+        if "evaluation_keys" in names:
+            keys["evaluation_keys"] = EvaluationKeys()
+            keygen.generate_evaluation_keys(self.DECOMPOSITION_BIT_COUNT, keys["evaluation_keys"])
+
+        return {name: keys[name] for name in names}
+
+    @classmethod
+    def fixed_parameters(cls, batching=False, server_side_rules=False):
+        '''
+        Returns the fixed encryption parameters, independent of the size of the board
+        '''
+
+        parms = EncryptionParameters()
+        if server_side_rules:
+            degree = cls.SERVER_SIDE_RULES_POLY_MODULUS_DEGREE
+            parms.set_poly_modulus("1x^{} + 1".format(degree))
+            parms.set_coeff_modulus(seal.coeff_modulus_128(degree))
+            parms.set_plain_modulus(cls.SERVER_SIDE_RULES_PLAIN_MODULUS)
+        else:
+            parms.set_poly_modulus("1x^2048 + 1")
+            parms.set_coeff_modulus(seal.coeff_modulus_128(2048))
+            if batching:
+                parms.set_plain_modulus(cls.BATCHING_PLAIN_MODULUS)
+            else:
+                parms.set_plain_modulus(1 << 8)
+        return parms
+
+    @classmethod
+    def select_parameters(cls, dim, batching=False, server_side_rules=False):
+        '''
+        Selects the smallest encryption parameters with 128 bit security that fit the board and leave
+        NOISE_BUDGET_GAP bits of noise budget after the circuit of the server, which is modelled with
+        the ChooserEvaluator of SEAL
+
+        :param dim: dimension of the board
+        :param batching: whether the cells are batched
+        :param server_side_rules: whether the server evaluates the rules on the batched board
+        :return: EncryptionParameters or None if no parameters are large enough
+        '''
+
+        evaluator = ChooserEvaluator()
+
+        if not batching:
+            # integer encoded cells, the server adds the cell (0 or 1) and the encoded neighbours (-2, 0 or 2),
+            # the chooser also picks the smallest plain modulus the sum can be decoded with
+            encoder = ChooserEncoder()
+            encrypted_cell = encoder.encode(1)
+            encrypted_cell.set_fresh()
+            encrypted_neighbours = encoder.encode(-2)
+            encrypted_neighbours.set_fresh()
+
+            parms = EncryptionParameters()
+            if evaluator.select_parameters([evaluator.add(encrypted_cell, encrypted_neighbours)],
+                                           cls.NOISE_BUDGET_GAP, parms):
+                return parms
+            return None
+
+        for degree in cls.POLY_MODULUS_DEGREES:
+            # the padded board has to fit into one row of the 2 x degree/2 batching matrix
+            if server_side_rules and (dim + 2) * (dim + 2) > degree // 2:
+                continue
+
+            parms = EncryptionParameters()
+            parms.set_poly_modulus("1x^{} + 1".format(degree))
+            parms.set_coeff_modulus(seal.coeff_modulus_128(degree))
+            parms.set_plain_modulus(cls.batching_plain_modulus(degree))
+
+            # only the noise is simulated, the slot values are reduced modulo the plain modulus
+            encrypted_grid = ChooserPoly(1, 1)
+            if server_side_rules:
+                encrypted_new_grid = HomomorphicRules.model(encrypted_grid, cls.DECOMPOSITION_BIT_COUNT)
+            else:
+                encrypted_new_grid = evaluator.add(encrypted_grid, ChooserPoly(1, 1))
+
+            if encrypted_new_grid.simulate(parms).decrypts(cls.NOISE_BUDGET_GAP):
+                return parms
+
+        return None
+
+    @staticmethod
+    def batching_plain_modulus(degree):
+        '''
+        Returns the smallest prime congruent to 1 modulo 2*degree, the smallest plain modulus
+        that allows batching with a polynomial modulus of this degree
+        '''
+
+        plain_modulus = 2 * degree + 1
+        while any(plain_modulus % divisor == 0 for divisor in range(2, int(plain_modulus ** 0.5) + 1)):
+            plain_modulus += 2 * degree
+        return plain_modulus
+
+    def noise_budget(self, encrypted_grid):
+        '''
+        Returns the smallest invariant noise budget in bits of a list of ciphertexts, 0 means that
+        at least one of them no longer decrypts correctly
+
+        :param encrypted_grid: List of encrypted cells or batches
+        :return: noise budget in bits
+        '''
+
+        return min(self.thread_pool.map(lambda encrypted, memory_pool:
+                                        self.decryptor.invariant_noise_budget(encrypted, memory_pool),
+                                        encrypted_grid))
+
+    def zero_pool_size(self, dim):
+        '''
+        Returns the number of zeros the pool holds for a board of dimension dim, enough for
+        ZERO_POOL_GENERATIONS generations but at most ZERO_POOL_BYTES of ciphertexts
+        '''
+
+        # the size of a ciphertext depends on the parameters, a zero is measured
+        zero = Ciphertext()
+        self.encryptor.encrypt(Plaintext(), zero)
+        ciphertext_bytes = len(zero.save_bytes())
+
+        return max(1, min(self.ZERO_POOL_GENERATIONS * self.ciphertexts_per_generation(dim),
+                          self.ZERO_POOL_BYTES // ciphertext_bytes))
+
+    def ciphertexts_per_generation(self, dim):
+        '''
+        Returns the number of ciphertexts the client encrypts per generation of a board of dimension dim
+        '''
+
+        if self.server_side_rules:
+            return 1
+
+        # the old grid and the live neighbours grid
+        if self.batching:
+            return 2 * -(-dim * dim // self.slot_count)
+        return 2 * dim * dim
+
+    def encrypt(self, plain, memory_pool):
+        '''
+        Encrypts a plaintext, by adding it onto a precomputed encryption of zero if the pool is running
+
+        :param plain: Plaintext to encrypt
+        :param memory_pool: memory pool of the calling thread
+        :return: Ciphertext of plain
+        '''
+
+        if self.zero_pool is None:
+            encrypted = Ciphertext()
+            self.encryptor.encrypt(plain, encrypted, memory_pool)
+            return encrypted
+
+        encrypted = self.zero_pool.take(memory_pool)
+        self.evaluator.add_plain(encrypted, plain)
+        return encrypted
+
+    def close(self):
+        '''
+        Stops the pool of precomputed zeros and the threads encrypting and decrypting
+        '''
+
+        if self.zero_pool is not None:
+            self.zero_pool.stop()
+        self.thread_pool.shutdown()
+
     def encrypt_live_neighbours_grid(self, live_neighbours_grid, dim):
         '''
         Encodes the live neighbor matrix by applying following rules. If the cell [i][j] has 2 neighbors with 0,
@@ -50,26 +309,16 @@ class Encryption:
         :return: List of encoded and encrypted neighbors
         '''
 
-        encrypted_live_neighbours_grid = []
-
-        # Loop through every element of the board and encrypt it
-        for i in range(dim):
-           for j in range(dim):
-               # transformation / encoding rules
-               if(live_neighbours_grid[i][j] == 2):
-                   value = 0
-               elif(live_neighbours_grid[i][j] == 3):
-                    value = 2
-               elif(live_neighbours_grid[i][j] > 3 or live_neighbours_grid[i][j] < 2):
-                    value = -2
-                
-               # element-wise homomorphic encryption
-               encrypted = Ciphertext()
-               plain = self.encoder.encode(value)
-               self.encryptor.encrypt(plain, encrypted)
-               encrypted_live_neighbours_grid.append(encrypted)
-                
-        return encrypted_live_neighbours_grid
+        # transformation / encoding rules
+        live_neighbours_grid = numpy.asarray(live_neighbours_grid)
+        values = numpy.full((dim, dim), -2, dtype='i')
+        values[live_neighbours_grid == 2] = 0
+        values[live_neighbours_grid == 3] = 2
+
+        if self.batching:
+            return self.encrypt_batched(values)
+
+        return self.encrypt_cells(values)
     
     def encrypt_old_grid(self, old_grid, dim):
         '''
@@ -79,20 +328,15 @@ class Encryption:
         :param dim:
         :return:
         '''
-        
-        encrypted_old_grid = []
-
-        # Loop through every element of the board and encrypt it
-        for i in range(dim):
-            for j in range(dim):
-                # element-wise homomorphic encryption
-                encrypted = Ciphertext()
-                value = old_grid[i][j]
-                plain = self.encoder.encode(value)
-                self.encryptor.encrypt(plain, encrypted)
-                encrypted_old_grid.append(encrypted)
-               
-        return encrypted_old_grid
+
+        if self.server_side_rules:
+            # pad the board with a one cell wrap-around halo for the server side neighbour rotations
+            return self.encrypt_batched(numpy.pad(old_grid, 1, mode='wrap'))
+
+        if self.batching:
+            return self.encrypt_batched(old_grid)
+
+        return self.encrypt_cells(old_grid)
     
     def decrypt_new_grid(self, encrypted_new_grid, dim):
         '''
@@ -104,22 +348,103 @@ class Encryption:
         :return:
         '''
 
-        new_grid = numpy.zeros(dim*dim, dtype='i').reshape(dim,dim)
-        
-        for i in range(dim):
-          for j in range(dim):
-              plain = Plaintext()
-              
-              encrypted = encrypted_new_grid[dim*i + j]
-                  
-              self.decryptor.decrypt(encrypted, plain)
-              value = self.encoder.decode_int32(plain)
-              
-              # transformation / decoding rules
-              if(value <= 0):
-                  new_grid[i][j] = 0
-              elif(value > 0):
-                  new_grid[i][j] = 1
-              
-        return new_grid
-        
+        if self.server_side_rules:
+            # the server already applied the rules, only the interior without the halo is valid
+            values = self.decrypt_batched(encrypted_new_grid, dim + 2)
+            return values[1:-1, 1:-1].astype('i')
+
+        if self.batching:
+            values = self.decrypt_batched(encrypted_new_grid, dim)
+            # transformation / decoding rules
+            return (values > 0).astype('i')
+
+        values = self.decrypt_cells(encrypted_new_grid[:dim * dim]).reshape(dim, dim)
+
+        # transformation / decoding rules
+        return (values > 0).astype('i')
+
+    def encrypt_cells(self, grid):
+        '''
+        Encrypts every element of the grid on its own, row by row
+
+        :param grid: np array of integer cell values
+        :return: List of encrypted cells
+        '''
+
+        def encrypt_cell(value, memory_pool):
+            # element-wise homomorphic encryption
+            return self.encrypt(self.encoder.encode(int(value)), memory_pool)
+
+        return self.thread_pool.map(encrypt_cell, numpy.asarray(grid).ravel())
+
+    def decrypt_cells(self, encrypted_cells):
+        '''
+        Decrypts a list of cells encrypted by encrypt_cells
+
+        :param encrypted_cells: List of encrypted cells
+        :return: np array of the decrypted values
+        '''
+
+        plains = self.decrypt_plains(encrypted_cells)
+
+        with metrics.timer("decode"):
+            return numpy.array([self.encoder.decode_int32(plain) for plain in plains], dtype=numpy.int64)
+
+    def decrypt_plains(self, encrypted_list):
+        '''
+        Decrypts a list of ciphertexts into a list of plaintexts
+        '''
+
+        def decrypt(encrypted, memory_pool):
+            plain = Plaintext()
+            self.decryptor.decrypt(encrypted, plain, memory_pool)
+            return plain
+
+        with metrics.timer("decrypt"):
+            return self.thread_pool.map(decrypt, encrypted_list)
+
+    def encrypt_batched(self, grid):
+        '''
+        Packs the cells of the grid row by row into the slots of the PolyCRTBuilder and encrypts
+        them, so that a single ciphertext holds up to slot_count cells. Negative values are
+        stored modulo the plain modulus.
+
+        :param grid: np array of integer cell values
+        :return: List of encrypted batches
+        '''
+
+        values = numpy.asarray(grid, dtype='i').ravel() % self.plain_modulus
+
+        def encrypt_batch(start, memory_pool):
+            # remaining slots of the last batch are filled with zeros by compose
+            plain = Plaintext()
+            self.crtbuilder.compose([int(v) for v in values[start:start + self.slot_count]], plain)
+            return self.encrypt(plain, memory_pool)
+
+        return self.thread_pool.map(encrypt_batch, range(0, len(values), self.slot_count))
+
+    def decrypt_batched(self, encrypted_batches, dim):
+        '''
+        Decrypts and unpacks a list of batches created by encrypt_batched. Slot values above
+        half the plain modulus are mapped back to negative numbers.
+
+        :param encrypted_batches: List of encrypted batches
+        :param dim: dimension of the board
+        :return: dim x dim np array of the decrypted values
+        '''
+
+        def decode_batch(plain, memory_pool):
+            self.crtbuilder.decompose(plain, memory_pool)
+            return [plain.coeff_at(i) for i in range(self.slot_count)]
+
+        plains = self.decrypt_plains(encrypted_batches)
+
+        with metrics.timer("decode"):
+            values = []
+            for batch_values in self.thread_pool.map(decode_batch, plains):
+                values.extend(batch_values)
+
+            values = numpy.array(values[:dim * dim], dtype=numpy.int64)
+            values[values > self.plain_modulus // 2] -= self.plain_modulus
+
+        return values.reshape(dim, dim)
@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+@author: Patrick Tu & Kathrin Witzlsperger
+"""
+
+import numpy as np
+
+
+class Engine:
+    '''
+    Vectorized stepping engine for Conway's Game of Life which is shared by the client and
+    the server. Instead of looping over every cell, the whole grid is processed at once by
+    summing shifted copies of the board, where np.roll takes care of the "toroidal array".
+    '''
+
+    # offsets (row, column) of the 8 adjacent cells
+    NEIGHBOUR_OFFSETS = [(-1, -1), (-1, 0), (-1, 1),
+                         (0, -1),           (0, 1),
+                         (1, -1),  (1, 0),  (1, 1)]
+
+    @staticmethod
+    def live_neighbours(old_grid):
+        """
+        Computes the live neighbours matrix A of a N x N grid, where A[i][j] expresses
+        how many live neighbours the cell [i][j] has. The grid wraps around at its edges.
+        Returns the live neighbours matrix as a numpy array of dtype int32.
+        """
+
+        old_grid = np.asarray(old_grid, dtype='i')
+        live_neighbours_grid = np.zeros_like(old_grid)
+
+        # add up the board shifted into each of the 8 neighbour directions
+        for x, y in Engine.NEIGHBOUR_OFFSETS:
+            live_neighbours_grid += np.roll(old_grid, (-x, -y), axis=(0, 1))
+
+        return live_neighbours_grid
+
+    @staticmethod
+    def update_grid(old_grid):
+        """
+        Applies Conway's rules to the whole grid at once and returns the new grid
+        as a numpy array of dtype int32.
+        """
+
+        old_grid = np.asarray(old_grid, dtype='i')
+        live = Engine.live_neighbours(old_grid)
+
+        # a cell lives in the next generation if it has exactly 3 live neighbours (reproduction
+        # or continue living) or if it is alive and has exactly 2 live neighbours (continue living)
+        new_grid = (live == 3) | ((old_grid == 1) & (live == 2))
+
+        return new_grid.astype('i')
+
+    @staticmethod
+    def update_padded_grid(padded_grid):
+        """
+        Applies Conway's rules to the interior of a grid which is padded with a one cell halo
+        of its neighbours, e.g. a tile of a larger board, or to a stack of such grids along the
+        last two axes. Returns the new (h-2) x (w-2) interior as a boolean numpy array.
+        """
+
+        rows, cols = padded_grid.shape[-2] - 2, padded_grid.shape[-1] - 2
+        live = np.zeros(padded_grid.shape[:-2] + (rows, cols), dtype=padded_grid.dtype)
+
+        # add up the interior shifted into each of the 8 neighbour directions
+        for x, y in Engine.NEIGHBOUR_OFFSETS:
+            live += padded_grid[..., 1 + x:1 + x + rows, 1 + y:1 + y + cols]
+
+        return (live == 3) | ((padded_grid[..., 1:-1, 1:-1] == 1) & (live == 2))
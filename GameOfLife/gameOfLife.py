@@ -5,13 +5,14 @@
 """
 
 import numpy as np
-import random
 import encryption
-import time
-import socket
-from io import BytesIO
-import sys
-from GameOfLife.helper import Helper
+from seal import Ciphertext
+from GameOfLife.key_store import KeyStore
+from GameOfLife.instrumentation import log, metrics
+from GameOfLife.helper import Helper, Connection
+from GameOfLife.shared_grid import SharedGrid
+from GameOfLife.cycle_detector import CycleDetector
+from GameOfLife.engine import Engine
 
 
 class GameOfLife:
@@ -21,10 +22,34 @@ class GameOfLife:
     t of the grid to generation t+1.
     '''
 
-    def __init__(self, N):
+    # network communication parameter to communicate with remote server
+    SERVER_ADRESS = "127.0.0.1"
+    PORT = 12345
+
+    def __init__(self, N, batching=False, server_side_rules=False, remote_homomorphic_encryption=False, threads=1,
+                 precompute=True, key_store_directory=KeyStore.DIRECTORY, shared_memory=False,
+                 compression=True, server_session=False, detect_cycles=True):
         """
         Set up Conway's Game of Life and initialize a random configuration of dead and alive
-        cells on the board.
+        cells on the board. If batching is True, the homomorphic encryption packs the whole
+        grid into as few ciphertexts as possible. If server_side_rules is True, only the batched
+        board is encrypted and the server counts the neighbours and applies the rules. If
+        remote_homomorphic_encryption is True, the encrypted grids are sent to the TCP server
+        instead of the simulated server. threads is the number of threads that encrypt and
+        decrypt in parallel. The encryption parameters are selected for the size of the board.
+        If precompute is True, encryptions of zero are prepared in the background between the
+        generations, which shortens the encryption of the next generation. The encryption is set
+        up when homomorphic encryption is used for the first time, with the keys cached in the key
+        store in key_store_directory (None disables the cache). If shared_memory is True, the plain
+        grids of update_grid and advance are handed to a TCP server on the same host through a
+        SharedGrid instead of the socket, with a fallback to the socket if the server can not map it.
+        If compression is True, the plain grids are exchanged with the TCP server as compressed deltas
+        of bit-packed boards, provided the server supports it. If server_session is True, the TCP
+        server keeps the board of the game and update_grid, advance and edit_cells only send commands
+        instead of the grid; the board is uploaded again whenever the server does not hold it.
+        If detect_cycles is True, update_grid recognizes when the board became a still life or an
+        oscillator and serves the later generations, also of advance, from a memo without the server
+        and without encryption. The detected period is stored in period.
         """
 
         # dimension of grid (N*N = number of cells)
@@ -37,16 +62,40 @@ class GameOfLife:
         self.live_neighbours_grid = np.zeros(N * N, dtype='i').reshape(N, N)
 
         # set up a random initial configuration for the grid
-        # each point is either alive or dead, represented by integer values of 1 and 0, respectively
-        for i in range(0, self.N):
-            for j in range(0, self.N):
-                if (random.randint(0, 100) < 15):
-                    self.old_grid[i][j] = 1
-                else:
-                    self.old_grid[i][j] = 0
-
-        # initialize encryption
-        self.encryption = encryption.Encryption()
+        # each point is either alive or dead, represented by integer values of 1 and 0, respectively,
+        # and alive with a probability of 15 in 101 (drawn for all cells at once)
+        self.old_grid[np.random.randint(0, 101, size=(N, N)) < 15] = 1
+
+        # encryption, set up by setup_encryption when it is needed for the first time
+        self.encryption = None
+        self.encryption_options = dict(batching=batching, server_side_rules=server_side_rules, threads=threads,
+                                       dim=N, precompute=precompute)
+        self.key_store = KeyStore(key_store_directory) if key_store_directory is not None else None
+        # noise budget in bits left in the encrypted new grid of every homomorphic generation
+        self.noise_budgets = []
+        self.remote_homomorphic_encryption = remote_homomorphic_encryption
+        # id under which the TCP server stored our encryption parameters and keys
+        self.homomorphic_key_id = None
+        # one connection to the TCP server carries all requests of this game
+        self.connection = Connection(self.SERVER_ADRESS, self.PORT, compression)
+        # whether STOP was already sent for the current run
+        self.run_stopped = False
+        # generation of the current grid
+        self.generation = 0
+        # grids are exchanged with the TCP server through a shared grid, mapped on the first request
+        self.shared_memory = shared_memory
+        self.shared_grid = None
+        # copy of the last grid computed in the shared grid and the index of the buffer holding it
+        self.shared_answer = None
+        # the board is kept by the server under the game id, it equals the grid game_grid
+        self.server_session = server_session
+        self.game_id = None
+        self.game_grid = None
+        # history of the generations computed by update_grid, which started from the grid recorded_grid
+        self.cycle_detector = CycleDetector() if detect_cycles else None
+        self.recorded_grid = None
+        # period of the board once it is known to be periodic
+        self.period = None
 
 
     def live_neighbours(self):
@@ -56,148 +105,495 @@ class GameOfLife:
         Game grid has.
         """
 
-        # loop over whole grid
-        for i in range(self.N):
-            for j in range(self.N):
-
-                number_of_live_neighbours = 0  # total number of live neighbours
-
-                # loop over all neighbours
-                for x in [i - 1, i, i + 1]:
-                    for y in [j - 1, j, j + 1]:
+        # neighbour counts of the whole grid are computed at once by the shared engine
+        with metrics.timer("neighbour_count"):
+            self.live_neighbours_grid = Engine.live_neighbours(self.old_grid)
 
-                        if (x == i and y == j):
-                            continue  # skip current point, only count neighbours
 
-                        if (x != self.N and y != self.N):
-                            number_of_live_neighbours += self.old_grid[x][y]
-
-                        # remaining branches handle the case where the neighbour is off the end of the grid
-                        # in this case, we loop back round such that the grid becomes a "toroidal array"
-                        elif (x == self.N and y != self.N):
-                            number_of_live_neighbours += self.old_grid[0][y]
-                        elif (x != self.N and y == self.N):
-                            number_of_live_neighbours += self.old_grid[x][0]
-                        else:
-                            number_of_live_neighbours += self.old_grid[0][0]
+    def setup_encryption(self):
+        '''
+        Sets up the encryption parameters and keys unless already done and returns the Encryption
+        '''
 
-                # store number of neighbours in corresponding matrix
-                self.live_neighbours_grid[i][j] = number_of_live_neighbours
+        if self.encryption is None:
+            self.encryption = encryption.Encryption(key_store=self.key_store, **self.encryption_options)
+        return self.encryption
 
 
-    def update_grid_with_homomorphic_encryption(self, server_to_client_queue, client_to_server_queue):
+    def encrypt_message(self):
         '''
-        If homomorphic encryption is true, we use our simulated server realized by using threads and message queues
-        to perform the update of the game based on the encrypted operation in the threaded server. This workaround has
-        been chosen because the Pyseal instances such as Ciphertext() and Context() can't be serialized for a transfer using
-        sockets.
+        Encrypts the old grid and, unless the server applies the rules by itself, the encoded live neighbour
+        grid and returns them as a message dictionary for the server
         '''
 
-        # compute live neighbour grid
-        self.live_neighbours()
-        print("[CLIENT/update_grid] live neighbour grid:")
-        print(self.live_neighbours_grid)
+        self.setup_encryption()
+
+        # with server side rules the server derives the live neighbours itself
+        if not self.encryption.server_side_rules:
+            # compute live neighbour grid
+            self.live_neighbours()
+            log.debug("[CLIENT/update_grid] live neighbour grid:\n%s", self.live_neighbours_grid)
 
-        # encrypt old grid and live neighbour grid
-        encrypted_old_grid = self.encryption.encrypt_old_grid(self.old_grid, self.N)
-        encrypted_live_neighbours_grid = self.encryption.encrypt_live_neighbours_grid(self.live_neighbours_grid, self.N)
+        with metrics.timer("encrypt"):
+            # encrypt old grid
+            encrypted_old_grid = self.encryption.encrypt_old_grid(self.old_grid, self.N)
+            message = {"encrypted_old_grid": encrypted_old_grid}
 
-        # Put encrypted old grid and live neighbour in a dictionary to send to server as a message
-        message = {"encrypted_old_grid": encrypted_old_grid,
-                   "encrypted_live_neighbours_grid": encrypted_live_neighbours_grid}
+            if not self.encryption.server_side_rules:
+                # encrypt live neighbour grid and add it to the message to the server
+                encrypted_live_neighbours_grid = self.encryption.encrypt_live_neighbours_grid(self.live_neighbours_grid,
+                                                                                              self.N)
+                message["encrypted_live_neighbours_grid"] = encrypted_live_neighbours_grid
 
-        # send encrypted message to simulated server via queue
-        client_to_server_queue.put(message)
-        print("[CLIENT/update_grid] Put message into client to server queue")
+        return message
 
-        # waiting until get a reply in server to client queue
-        while server_to_client_queue.qsize() == 0:
-            print("[CLIENT/update_grid] Client thread waiting for server reply")
-            time.sleep(0.001)
 
-        # receive and fetch reply from server
-        encrypted_new_grid = server_to_client_queue.get()
-        print("[CLIENT/update_grid] fetch message from server to client queue")
-        print("[CLIENT/update_grid] Encrypted Message received from simulated-server")
+    def decrypt_new_grid(self, encrypted_new_grid):
+        '''
+        Decrypts the new grid computed by the server and makes it the current grid of the game
+        '''
+
+        # headroom of the encryption parameters, 0 bits means the grid was decrypted incorrectly
+        noise_budget = self.encryption.noise_budget(encrypted_new_grid)
+        self.noise_budgets.append(noise_budget)
+        log.info("[CLIENT/update_grid] noise budget of generation %d: %d bits", self.generation + 1, noise_budget)
 
         # decrypt new grid and set it as the current/new grid of the game
         self.new_grid = self.encryption.decrypt_new_grid(encrypted_new_grid, self.N)
-        print("[CLIENT/update_grid] decrypted new grid:")
-        print(self.new_grid)
+        log.debug("[CLIENT/update_grid] decrypted new grid:\n%s", self.new_grid)
 
         # new configuration becomes the old configuration for the next generation.
         self.old_grid = self.new_grid
 
 
+    def update_grid_with_homomorphic_encryption(self, simulated_server):
+        '''
+        If homomorphic encryption is true, we use our simulated server realized by using threads and a message queue
+        to perform the update of the game based on the encrypted operation in the threaded server. This avoids
+        the serialization of the ciphertexts when the (simulated) server runs in the same process.
+        '''
+
+        # send encrypted message to simulated server via its queue
+        message = self.encrypt_message()
+        with metrics.timer("transport"):
+            reply = simulated_server.submit(message)
+            log.info("[CLIENT/update_grid] Put message into client to server queue")
+
+            # blocks until the server resolved the future with its reply
+            encrypted_new_grid = reply.result()
+        log.info("[CLIENT/update_grid] Encrypted Message received from simulated-server")
+
+        self.decrypt_new_grid(encrypted_new_grid)
+
+
+    def send_request(self, message_type, payload, generation=0):
+        '''
+        Sends a request over the persistent connection to the TCP server and returns the type and payload of its answer
+        '''
+
+        answer_type, answer_from_server = self.connection.request(message_type, payload, generation)
+        log.info("[CLIENT/update_grid] Message sent to server and answer received via socket")
+
+        return answer_type, answer_from_server
+
+
+    def close(self):
+        '''
+        Ends the session with the TCP server and stops the background work of the encryption
+        '''
+
+        self.end_game()
+        self.connection.close()
+        self.close_shared_grid()
+        if self.encryption is not None:
+            self.encryption.close()
+
+
+    def attach_shared_grid(self):
+        '''
+        Creates the shared grid and lets the TCP server map it. If the server can not map it, e.g. because
+        it runs on another host, the shared memory is turned off and False is returned
+        '''
+
+        shared_grid = SharedGrid(self.old_grid.shape, self.old_grid.dtype)
+        try:
+            answer_type, answer_from_server = self.send_request(Helper.SHM_ATTACH, shared_grid.describe())
+        finally:
+            # the server mapped the file or failed to, either way nobody opens it again
+            shared_grid.unlink()
+
+        if answer_type != Helper.SHM_ATTACH:
+            log.warning("[CLIENT/update_grid] Shared memory not available, grids are sent over the socket: %s",
+                        bytes(answer_from_server).decode())
+            shared_grid.close()
+            self.shared_memory = False
+            return False
+
+        self.shared_grid = shared_grid
+        return True
+
+
+    def close_shared_grid(self):
+        '''
+        Unmaps the shared grid, grids still referenced stay valid
+        '''
+
+        if self.shared_grid is not None:
+            self.shared_grid.close()
+            self.shared_grid = None
+        self.shared_answer = None
+
+
+    def shared_request(self, generations):
+        '''
+        Lets the TCP server advance the grid by a number of generations in the shared grid. Only the index of
+        the buffer holding the old grid is sent, which is the buffer of the last answer in consecutive requests,
+        so the grids are neither serialized nor sent. The buffers are overwritten by later requests, hence the
+        new grid is returned as a copy.
+
+        :param generations: number of generations
+        :return: copy of the new grid, or None if the shared memory is not available
+        '''
+
+        # map the shared grid once and again if the server lost it (e.g. after a reconnect)
+        for attempt in range(2):
+            if self.shared_grid is None and not self.attach_shared_grid():
+                return None
+
+            if self.shared_answer is not None and self.shared_answer[0] is self.old_grid:
+                source = self.shared_answer[1]
+            else:
+                source = 0
+                self.shared_grid.buffers[source][...] = self.old_grid
+
+            answer_type, answer_from_server = self.send_request(Helper.SHM_STEP,
+                                                                Helper.SHM_PARAMETERS.pack(source, generations))
+            if answer_type == Helper.SHM_STEP:
+                self.shared_answer = (self.shared_grid.buffers[1 - source].copy(), 1 - source)
+                return self.shared_answer[0]
+            if bytes(answer_from_server) != Helper.NO_SHARED_GRID:
+                break
+            self.close_shared_grid()
+
+        raise RuntimeError("Server error: " + bytes(answer_from_server).decode())
+
+
+    def create_game(self):
+        '''
+        Uploads the current grid as board of a new game kept by the TCP server
+        '''
+
+        self.end_game()
+        answer_type, answer_from_server = self.send_request(Helper.GAME_CREATE, self.old_grid)
+        if answer_type != Helper.GAME_CREATE:
+            raise RuntimeError("Server error: " + bytes(answer_from_server).decode())
+
+        self.game_id = bytes(answer_from_server)
+        self.game_grid = self.old_grid
+
+
+    def end_game(self):
+        '''
+        Lets the TCP server remove the game, it is evicted from the cache of the server anyway if that fails
+        '''
+
+        if self.game_id is None:
+            return
+        game_id, self.game_id = self.game_id, None
+        try:
+            self.send_request(Helper.GAME_END, Helper.pack_blobs([game_id, b'']))
+        except (OSError, RuntimeError):
+            pass
+
+
+    def game_request(self, message_type, argument=b'', generations=0):
+        '''
+        Sends a command for the game kept by the TCP server. The game is created first if the server does not
+        hold the current grid, because this is the first command, the grid was changed without the server or
+        the server evicted the game.
+
+        :param message_type: GAME_STEP, GAME_EDIT or GAME_FETCH
+        :param argument: argument of the command
+        :param generations: number of generations of GAME_STEP
+        :return: the board of the game after the command
+        '''
+
+        for attempt in range(2):
+            if self.game_id is None or self.old_grid is not self.game_grid:
+                self.create_game()
+
+            try:
+                answer_type, answer_from_server = self.send_request(message_type,
+                                                                    Helper.pack_blobs([self.game_id, argument]),
+                                                                    generations)
+            except (OSError, RuntimeError):
+                # the server may have applied the command, the next command creates the game again from the grid
+                self.game_grid = None
+                raise
+            if answer_type == Helper.PLAIN_GRID:
+                self.game_grid = answer_from_server
+                return answer_from_server
+            if bytes(answer_from_server) != Helper.UNKNOWN_GAME:
+                break
+            # the server lost the game, e.g. it was evicted or the server restarted
+            self.game_id = None
+
+        raise RuntimeError("Server error: " + bytes(answer_from_server).decode())
+
+
+    def edit_cells(self, cells):
+        '''
+        Sets the state of single cells of the grid
+
+        :param cells: list of (row, column, alive) triples, alive is 1 or 0
+        '''
+
+        cells = np.asarray(cells, dtype='<i4').reshape(-1, 3)
+        if self.server_session:
+            grid = self.game_request(Helper.GAME_EDIT, cells.tobytes())
+        else:
+            grid = self.old_grid.copy()
+            grid[cells[:, 0], cells[:, 1]] = cells[:, 2]
+
+        self.new_grid = grid
+        self.old_grid = self.new_grid
+
+
+    def fetch(self):
+        '''
+        Replaces the grid with the board of the game kept by the TCP server
+        '''
+
+        self.new_grid = self.game_request(Helper.GAME_FETCH)
+        self.old_grid = self.new_grid
+
+
+    def periodic_grid(self, generations):
+        '''
+        Returns the grid a number of generations ahead from the memo of the cycle detector, or None if the board
+        is not known to be periodic
+        '''
+
+        if self.cycle_detector is None:
+            return None
+        # a grid changed outside of update_grid (edited, streamed or advanced by the server) starts a new history
+        if self.old_grid is not self.recorded_grid:
+            self.cycle_detector.reset()
+            self.cycle_detector.record(self.old_grid)
+            self.recorded_grid = self.old_grid
+            self.period = None
+
+        if not self.cycle_detector.advance(generations):
+            return None
+        return self.cycle_detector.grid()
+
+
+    def register_homomorphic_keys(self):
+        '''
+        Sends the encryption parameters and the keys the server needs for the evaluation to the TCP server
+        and stores the key id the server answers with
+        '''
+
+        self.setup_encryption()
+        keys = [str(self.N).encode(), self.encryption.parms.save_bytes(), b'', b'']
+        if self.encryption.server_side_rules:
+            keys[2] = self.encryption.galois_keys.save_bytes()
+            keys[3] = self.encryption.evaluation_keys.save_bytes()
+
+        answer_type, answer_from_server = self.send_request(Helper.HE_KEYS, Helper.pack_blobs(keys))
+        if answer_type != Helper.HE_KEYS_ACCEPTED:
+            raise RuntimeError("Server did not accept the keys: " + bytes(answer_from_server).decode())
+
+        self.homomorphic_key_id = bytes(answer_from_server)
+        log.info("[CLIENT/update_grid] Homomorphic keys registered at server")
+
+
+    def update_grid_with_remote_homomorphic_encryption(self):
+        '''
+        Sends the serialized encrypted grid to the TCP server, which computes the new encrypted grid
+        possibly on a separate machine.
+        '''
+
+        message = self.encrypt_message()
+
+        # register keys once and again if the server lost them (e.g. after a restart)
+        for attempt in range(2):
+            if self.homomorphic_key_id is None:
+                self.register_homomorphic_keys()
+
+            with metrics.timer("transport"):
+                encrypted_old_grid = Helper.pack_blobs([encrypted.save_bytes() for encrypted in
+                                                        message["encrypted_old_grid"]])
+                encrypted_live_neighbours_grid = Helper.pack_blobs([encrypted.save_bytes() for encrypted in
+                                                                    message.get("encrypted_live_neighbours_grid", [])])
+                payload = Helper.pack_blobs([self.homomorphic_key_id, encrypted_old_grid, encrypted_live_neighbours_grid])
+                answer_type, answer_from_server = self.send_request(Helper.HE_GRID, payload)
+                if answer_type == Helper.HE_GRID:
+                    encrypted_new_grid = []
+                    for blob in Helper.unpack_blobs(answer_from_server):
+                        encrypted = Ciphertext()
+                        encrypted.load_bytes(blob)
+                        encrypted_new_grid.append(encrypted)
+                    break
+            if bytes(answer_from_server) != Helper.UNKNOWN_KEY_ID:
+                raise RuntimeError("Server error: " + bytes(answer_from_server).decode())
+            # the server lost the keys, e.g. they were evicted or the server restarted
+            self.homomorphic_key_id = None
+        else:
+            raise RuntimeError("Server error: " + bytes(answer_from_server).decode())
+        log.info("[CLIENT/update_grid] Encrypted Message received from server")
+
+        self.decrypt_new_grid(encrypted_new_grid)
+
+
     def update_grid_without_homomorphic_encryption(self):
         '''
         If homomorphic encryption is not chosen, we can use are initial distributed architecture usuing TCP/Socket
         communication with a server.
         '''
 
-        # Set up network communication parameter to communicate with remote server
-        SERVER_ADRESS ="127.0.0.1"
-        PORT = 12345
+        with metrics.timer("transport"):
+            if self.server_session:
+                grid_by_server = self.game_request(Helper.GAME_STEP, generations=1)
+            else:
+                grid_by_server = self.shared_request(1) if self.shared_memory else None
+            if grid_by_server is None:
+                # the raw grid is sent, its dtype and shape travel in the message header
+                answer_type, grid_by_server = self.send_request(Helper.PLAIN_GRID, self.old_grid)
+                if answer_type != Helper.PLAIN_GRID:
+                    raise RuntimeError("Server error: " + bytes(grid_by_server).decode())
+        log.debug("[CLIENT/update_grid] Server Reply:\n%s", grid_by_server)
+        log.info("[CLIENT/update_grid] Not-encrypted message received from server")
 
-        # Establish connection to remote server
-        client_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM) #get client socket
-        client_socket.connect((SERVER_ADRESS, PORT)) # connect to the server
-        print("[CLIENT/update_grid] Client connection established at ", SERVER_ADRESS,":",PORT)
-
-        # Serialize current grid state as byte string for sever transmission
-        with BytesIO() as b:
-            np.save(b, self.old_grid)
-            old_grid_serialized = b.getvalue()
-        print("[CLIENT/update_grid] Grid serialized for socket communication")
+        #update grid states
+        self.new_grid = grid_by_server
+        self.old_grid = self.new_grid
 
-        # measure size of the message to ensure that server receives the whole message
-        size=sys.getsizeof(old_grid_serialized)
-        print("[CLIENT/update_grid] Size of the message in bytes: ", size)
 
-        # send to server
-        out = old_grid_serialized
-        client_socket.sendall(out)
-        print("[CLIENT/update_grid] Message sent to server via socket")
+    def run_without_homomorphic_encryption(self, generations=0, frame_interval=1, frame_callback=None):
+        '''
+        Lets the TCP server advance the grid by several generations without a round trip per generation.
+        The server streams every frame_interval-th generation and the last one back while it keeps computing.
+
+        :param generations: number of generations to compute, 0 computes until stop_run is called
+        :param frame_interval: only every frame_interval-th generation is streamed back
+        :param frame_callback: called as frame_callback(generation, grid) for every streamed frame; a slow
+                               callback throttles the server
+        :return: number of generations computed
+        '''
 
-        #Sever answer is the new grid state as a bytestream
-        answer_from_server = Helper.receive_complete_bytestream(client_socket, MESSAGE_SIZE=size, MAX_BUFFER_SIZE=65536)
+        self.run_stopped = False
+        self.connection.send(Helper.RUN, Helper.RUN_PARAMETERS.pack(generations, frame_interval))
+        self.connection.send(Helper.PLAIN_GRID, self.old_grid)
+
+        while True:
+            message_type, payload, generation = self.connection.receive()
+            if message_type == Helper.FRAME:
+                #update grid states
+                self.new_grid = payload
+                self.old_grid = self.new_grid
+                if frame_callback is not None:
+                    frame_callback(generation, payload)
+            elif message_type == Helper.PERIOD:
+                self.period = generation
+                log.info("[CLIENT/update_grid] Server detected period %d", generation)
+            elif message_type == Helper.RUN_DONE:
+                log.info("[CLIENT/update_grid] Run ended after %d generations", generation)
+                self.generation += generation
+                return generation
+            else:
+                raise RuntimeError("unexpected message during a run")
+
+
+    def advance(self, generations):
+        '''
+        Lets the TCP server jump the grid ahead by a number of generations, which for power of two boards
+        is computed by HashLife in far fewer steps than generations
 
-        try:
-            grid_by_server = np.load(BytesIO(answer_from_server)) #deserialize byte server reply to a np array
-            print("[CLIENT/update_grid] Server Reply:\n", grid_by_server)
-        except ValueError:
-            print("[CLIENT/update_grid] Value error occured")
+        :param generations: number of generations
+        '''
 
-        print("[CLIENT/update_grid] Not-encrypted message received from server")
-        print("[CLIENT/update_grid] decrypted new grid:")
-        print(self.new_grid)
+        grid_by_server = self.periodic_grid(generations)
+        periodic = grid_by_server is not None
+        if not periodic and self.server_session:
+            grid_by_server = self.game_request(Helper.GAME_STEP, generations=generations)
+        elif not periodic and self.shared_memory:
+            grid_by_server = self.shared_request(generations)
+        if grid_by_server is None:
+            answer_type, grid_by_server = self.send_request(Helper.ADVANCE, self.old_grid, generations)
+            if answer_type != Helper.PLAIN_GRID:
+                raise RuntimeError("Server error: " + bytes(grid_by_server).decode())
+        log.info("[CLIENT/update_grid] Grid advanced by %d generations", generations)
 
         #update grid states
         self.new_grid = grid_by_server
         self.old_grid = self.new_grid
+        self.generation += generations
+        if periodic:
+            self.recorded_grid = self.old_grid
 
-        #close connection after message received
-        client_socket.close()
+
+    def advance_power(self, k):
+        '''
+        Jumps the grid ahead by 2^k generations
+        '''
+
+        self.advance(1 << k)
+
+
+    def advance_to(self, generation):
+        '''
+        Jumps the grid ahead to the given generation
+        '''
+
+        if generation < self.generation:
+            raise ValueError("generation {} already passed".format(generation))
+        self.advance(generation - self.generation)
 
 
-    def update_grid(self, server_to_client_queue, client_to_server_queue, homomorphic_encryption):
+    def stop_run(self):
+        '''
+        Asks the TCP server to stop the current run, frames that are already on their way are still delivered
+        '''
+
+        if not self.run_stopped:
+            self.run_stopped = True
+            self.connection.send(Helper.STOP, b'')
+
+
+    def update_grid(self, simulated_server, homomorphic_encryption):
         '''
         updates the grid of the game depending on the boolean homomorphic_encryption parameter either using homomorphic encryption on a
         threaded simulated server or directly computing the next grid using a (remote) socket TCP server
 
-        :param server_to_client_queue: Queue used for communication from server to client
-        :param client_to_server_queue:  Queue used for communication from client to (simulated) server
+        :param simulated_server: Threaded_server computing the encrypted update
         :param homomorphic_encryption: Boolean variable; True of homomorphic encryption is ticked and should be used for the grid update
         :return:
         '''
 
-        print("[CLIENT/update_grid] old grid:")
-        print(self.old_grid)
-
-        if (homomorphic_encryption == True):
-            # homomorphic encryption uses simulated server via thread
-            self.update_grid_with_homomorphic_encryption(server_to_client_queue, client_to_server_queue)
-        else:
-            # normal grid update is done via socket server
-            self.update_grid_without_homomorphic_encryption()
+        log.debug("[CLIENT/update_grid] old grid:\n%s", self.old_grid)
+
+        periodic_grid = self.periodic_grid(1)
+        with metrics.timer("generation"):
+            if periodic_grid is not None:
+                # the board repeats, neither the server nor the encryption are needed anymore
+                self.new_grid = periodic_grid
+                self.old_grid = self.new_grid
+            elif (homomorphic_encryption == True and self.remote_homomorphic_encryption):
+                # homomorphic encryption on the (remote) socket TCP server
+                self.update_grid_with_remote_homomorphic_encryption()
+            elif (homomorphic_encryption == True):
+                # homomorphic encryption uses simulated server via thread
+                self.update_grid_with_homomorphic_encryption(simulated_server)
+            else:
+                # normal grid update is done via socket server
+                self.update_grid_without_homomorphic_encryption()
+
+        self.generation += 1
+
+        if self.cycle_detector is not None:
+            if periodic_grid is None and self.cycle_detector.record(self.old_grid) is not None:
+                self.period = self.cycle_detector.period
+                log.info("[CLIENT/update_grid] Period %d detected at generation %d", self.period, self.generation)
+            self.recorded_grid = self.old_grid
 
@@ -0,0 +1,154 @@
+'''
+@Author: Patrick Tu & Kathrin Witzlsperger
+
+'''
+
+import os
+import secrets
+import threading
+from collections import OrderedDict
+import numpy as np
+from GameOfLife.bit_engine import BitEngine
+from GameOfLife.tiled_engine import TiledEngine
+from GameOfLife.instrumentation import log
+
+
+class Game:
+    '''
+    Board of a game kept by the server between the commands of its client. The board is stored
+    bit-packed, which is 32 times smaller than the int32 grid, and single generations are stepped
+    on the packed board directly.
+
+    :param grid: initial board of 0 and 1
+    '''
+
+    def __init__(self, grid):
+
+        self.cols = grid.shape[1]
+        self.packed = BitEngine.pack(grid)
+        # number of generations computed by the server
+        self.generation = 0
+        # commands of the same game are applied one after the other
+        self.lock = threading.Lock()
+
+    @property
+    def nbytes(self):
+        '''
+        Returns the memory of the board in bytes
+        '''
+
+        return self.packed.nbytes
+
+    @property
+    def shape(self):
+        '''
+        Returns the shape (rows, columns) of the board
+        '''
+
+        return len(self.packed), self.cols
+
+    def grid(self):
+        '''
+        Returns the board as dense int32 grid
+        '''
+
+        return BitEngine.unpack(self.packed, self.cols)
+
+    def edit(self, cells):
+        '''
+        Sets the state of single cells
+
+        :param cells: numpy array of (row, column, alive) triples
+        '''
+
+        rows, cols, alive = cells.T
+        if (rows < 0).any() or (rows >= len(self.packed)).any() or (cols < 0).any() or (cols >= self.cols).any() \
+                or ((alive != 0) & (alive != 1)).any():
+            raise ValueError("cells out of range")
+
+        words = cols // BitEngine.WORD_BITS
+        masks = np.left_shift(np.uint64(1), (cols % BitEngine.WORD_BITS).astype(np.uint64))
+        dead = alive == 0
+        np.bitwise_and.at(self.packed, (rows[dead], words[dead]), ~masks[dead])
+        np.bitwise_or.at(self.packed, (rows[~dead], words[~dead]), masks[~dead])
+
+
+class GameStore:
+    '''
+    Games of all clients of a server by game id. The memory of the boards is capped, when a new game
+    does not fit anymore, the games that were not used for the longest time are evicted. A client whose
+    game was evicted creates it again from its own copy of the board. The TiledEngine of a shape is closed
+    together with the last game of the shape.
+
+    :param max_bytes: memory cap of the boards in bytes, GOL_GAME_CACHE_MB megabytes by default
+    '''
+
+    MAX_BYTES = int(os.environ.get("GOL_GAME_CACHE_MB", 256)) << 20
+
+    def __init__(self, max_bytes=MAX_BYTES):
+
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        # least recently used game first
+        self.games = OrderedDict()
+        self.lock = threading.Lock()
+
+    def create(self, grid):
+        '''
+        Stores a new game with the grid as board and returns its id
+        '''
+
+        game = Game(grid)
+        if game.nbytes > self.max_bytes:
+            raise ValueError("board exceeds the memory of the game cache")
+
+        game_id = secrets.token_hex(16).encode()
+        evicted_games = []
+        with self.lock:
+            self.games[game_id] = game
+            self.nbytes += game.nbytes
+            while self.nbytes > self.max_bytes:
+                evicted_id, evicted = self.games.popitem(last=False)
+                self.nbytes -= evicted.nbytes
+                evicted_games.append(evicted)
+                log.info("[SERVER] Game %s evicted", evicted_id.decode())
+        self.release_engines(evicted_games)
+        return game_id
+
+    def get(self, game_id):
+        '''
+        Returns the game with the id, which becomes the most recently used game, or None if it is unknown
+        '''
+
+        with self.lock:
+            game = self.games.get(game_id)
+            if game is not None:
+                self.games.move_to_end(game_id)
+            return game
+
+    def remove(self, game_id):
+        '''
+        Removes the game with the id if it is stored
+        '''
+
+        with self.lock:
+            game = self.games.pop(game_id, None)
+            if game is not None:
+                self.nbytes -= game.nbytes
+        if game is not None:
+            self.release_engines([game])
+
+    def release_engines(self, removed_games):
+        '''
+        Closes the TiledEngines of the shapes of removed games which no stored game has anymore
+        '''
+
+        with self.lock:
+            shapes = {game.shape for game in self.games.values()}
+        for shape in {game.shape for game in removed_games} - shapes:
+            if shape[0] * shape[1] >= TiledEngine.MIN_CELLS:
+                TiledEngine.release(shape)
+
+    def __len__(self):
+
+        return len(self.games)
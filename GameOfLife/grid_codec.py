@@ -0,0 +1,106 @@
+'''
+@Author: Patrick Tu & Kathrin Witzlsperger
+
+'''
+
+import zlib
+import numpy as np
+
+
+class GridCodec:
+    '''
+    Compact encoding of the boards exchanged in one session. A board is bit-packed (one bit per cell
+    instead of 4 bytes) and, once both sides know a previous board, only the XOR delta to the board
+    exchanged last is sent, which is almost all zeros between consecutive generations. Frames and
+    deltas are compressed with zlib. A full frame is sent instead of a delta whenever it is smaller.
+
+    Both sides of a session keep one codec, which remembers the last board sent or received. As the
+    boards of a session never cross the connection in both directions at the same time, the codecs of
+    both sides always agree on it.
+    '''
+
+    # name of the encoding, negotiated at the start of a session
+    FORMAT = b"bits-xor-zlib/1"
+
+    # first byte of an encoded board
+    FULL = 0
+    DELTA = 1
+
+    # zlib level, the packed boards are small and the fastest level already removes the runs of zeros
+    LEVEL = 1
+
+    def __init__(self):
+
+        # packed cells and shape of the board exchanged last
+        self.reference = None
+        self.shape = None
+
+    @staticmethod
+    def accepts(grid):
+        '''
+        Returns whether the grid is a board of 0 and 1, which is the only kind of grid the codec encodes
+        '''
+
+        return grid.ndim == 2 and grid.size > 0 and grid.dtype.kind in 'biu' and grid.min() >= 0 and grid.max() <= 1
+
+    def encode(self, grid):
+        '''
+        Encodes a board as delta to the board exchanged last or as full frame, whichever is smaller
+
+        :return: bytes of the encoded board
+        '''
+
+        # packing bytes is an order of magnitude faster than packing the int32 cells
+        packed = np.packbits(grid.astype(np.uint8).ravel())
+
+        data = None
+        if self.reference is not None and self.shape == grid.shape:
+            data = bytes([self.DELTA]) + zlib.compress(packed ^ self.reference, self.LEVEL)
+        # a delta which does not compress well is compared with the full frame
+        if data is None or 4 * len(data) > len(packed):
+            full = bytes([self.FULL]) + zlib.compress(packed, self.LEVEL)
+            if data is None or len(full) < len(data):
+                data = full
+
+        self.reference = packed
+        self.shape = grid.shape
+        return data
+
+    def decode(self, payload, dtype, shape):
+        '''
+        Decodes a board encoded by the codec of the other side. The payload comes from the peer, it is never
+        inflated beyond the size of the packed board and invalid payloads raise RuntimeError
+
+        :param payload: bytes-like encoded board
+        :param dtype: dtype of the decoded board
+        :param shape: shape of the decoded board
+        :return: the board as numpy array
+        '''
+
+        view = memoryview(payload)
+        if not len(view):
+            raise RuntimeError("empty encoded board")
+        encoding = view[0]
+        rows, cols = shape
+        size = -(-rows * cols // 8)
+
+        # one byte more than the packed board reveals a payload which inflates too far
+        decompressor = zlib.decompressobj()
+        try:
+            data = decompressor.decompress(view[1:], size + 1)
+        except zlib.error as error:
+            raise RuntimeError("invalid encoded board: {}".format(error)) from None
+        if len(data) != size or not decompressor.eof or decompressor.unused_data:
+            raise RuntimeError("encoded board does not match its shape")
+        packed = np.frombuffer(data, dtype=np.uint8)
+
+        if encoding == self.DELTA:
+            if self.reference is None or self.shape != tuple(shape):
+                raise RuntimeError("delta without matching previous board")
+            packed = packed ^ self.reference
+        elif encoding != self.FULL:
+            raise RuntimeError("unknown board encoding {}".format(encoding))
+
+        self.reference = packed
+        self.shape = tuple(shape)
+        return np.unpackbits(packed, count=rows * cols).reshape(shape).astype(dtype)
@@ -0,0 +1,319 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+@author: Patrick Tu & Kathrin Witzlsperger
+"""
+
+import threading
+import numpy as np
+
+
+class Node:
+    '''
+    Node of the HashLife quadtree. A node of level k is a 2^k x 2^k square made of four nodes of
+    level k-1, leaves (level 0) are single cells. Nodes are hash-consed by HashLife, so equal squares
+    are the same object and results can be memoized on the node itself.
+    '''
+
+    __slots__ = ('level', 'nw', 'ne', 'sw', 'se', 'population', 'results')
+
+    def __init__(self, level, nw, ne, sw, se, population):
+        self.level = level
+        self.nw = nw
+        self.ne = ne
+        self.sw = sw
+        self.se = se
+        self.population = population
+        # memoized centres after 2^j generations, by j
+        self.results = {}
+
+
+class CacheExhausted(Exception):
+    '''
+    Raised when a jump created more nodes than HashLife may keep while jumping
+    '''
+
+
+class HashLife:
+    '''
+    HashLife engine for boards of 2^k x 2^k cells which wrap around at their edges. The successor
+    of the centre of a node is memoized on the node, so patterned boards jump far ahead with a few
+    lookups. A toroidal board T is advanced as the centre of a node tiled with copies of T, which
+    is again made of copies of the advanced board.
+
+    :param max_nodes: number of nodes in the cache, when it is exceeded after a jump only the
+                      nodes of the current board are kept and the memoized results are dropped
+    '''
+
+    # a jump which creates this many times max_nodes nodes is split into two jumps of half the generations
+    NODE_LIMIT = 4
+
+    def __init__(self, max_nodes=1 << 20):
+
+        self.max_nodes = max_nodes
+        # whether join raises CacheExhausted beyond NODE_LIMIT * max_nodes nodes
+        self.bounded = False
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        '''
+        Empties the node cache
+        '''
+
+        self.off = Node(0, None, None, None, None, 0)
+        self.on = Node(0, None, None, None, None, 1)
+        # canonical node of every combination of four children
+        self.nodes = {}
+        # empty node of every level
+        self.empties = [self.off]
+
+    def join(self, nw, ne, sw, se):
+        '''
+        Returns the canonical node made of four nodes of the same level
+        '''
+
+        key = (nw, ne, sw, se)
+        node = self.nodes.get(key)
+        if node is None:
+            if self.bounded and len(self.nodes) >= self.NODE_LIMIT * self.max_nodes:
+                raise CacheExhausted()
+            node = Node(nw.level + 1, nw, ne, sw, se,
+                        nw.population + ne.population + sw.population + se.population)
+            self.nodes[key] = node
+        return node
+
+    def empty(self, level):
+        '''
+        Returns the node of the given level without live cells
+        '''
+
+        while len(self.empties) <= level:
+            empty = self.empties[-1]
+            self.empties.append(self.join(empty, empty, empty, empty))
+        return self.empties[level]
+
+    def centre(self, node):
+        '''
+        Returns the centre of a node, which is one level lower
+        '''
+
+        return self.join(node.nw.se, node.ne.sw, node.sw.ne, node.se.nw)
+
+    def life_4x4(self, node):
+        '''
+        Returns the centre 2 x 2 cells of a 4 x 4 node after one generation
+        '''
+
+        cells = np.zeros((4, 4), dtype='i')
+        for i, row in enumerate(((node.nw, node.ne), (node.sw, node.se))):
+            for k, quarter in enumerate(row):
+                cells[2 * i:2 * i + 2, 2 * k:2 * k + 2] = [[quarter.nw.population, quarter.ne.population],
+                                                         [quarter.sw.population, quarter.se.population]]
+
+        new_cells = []
+        for i, j in ((1, 1), (1, 2), (2, 1), (2, 2)):
+            live = cells[i - 1:i + 2, j - 1:j + 2].sum() - cells[i, j]
+            new_cells.append(self.on if live == 3 or (cells[i, j] and live == 2) else self.off)
+        return self.join(*new_cells)
+
+    def successor(self, node, j):
+        '''
+        Returns the centre of a node (one level lower) after 2^j generations, where j is at most the
+        level of the node minus 2
+        '''
+
+        if node.population == 0:
+            return self.empty(node.level - 1)
+        result = node.results.get(j)
+        if result is not None:
+            return result
+
+        if node.level == 2:
+            result = self.life_4x4(node)
+        else:
+            nw, ne, sw, se = node.nw, node.ne, node.sw, node.se
+            # the 9 overlapping squares of half the size, each advanced by up to half the generations
+            half = j if j < node.level - 2 else j - 1
+            c = [[self.successor(square, half) for square in row] for row in (
+                (nw, self.join(nw.ne, ne.nw, nw.se, ne.sw), ne),
+                (self.join(nw.sw, nw.se, sw.nw, sw.ne), self.centre(node), self.join(ne.sw, ne.se, se.nw, se.ne)),
+                (sw, self.join(sw.ne, se.nw, sw.se, se.sw), se))]
+
+            quarters = [[self.join(c[i][k], c[i][k + 1], c[i + 1][k], c[i + 1][k + 1]) for k in (0, 1)]
+                        for i in (0, 1)]
+            if j < node.level - 2:
+                # the squares already advanced by 2^j generations, only the centres are left
+                result = self.join(*[self.centre(quarter) for row in quarters for quarter in row])
+            else:
+                # the second half of the generations
+                result = self.join(*[self.successor(quarter, half) for row in quarters for quarter in row])
+
+        node.results[j] = result
+        return result
+
+    def from_grid(self, grid):
+        '''
+        Builds the node of a dense 2^k x 2^k grid of 0 and 1. Every level only creates the distinct
+        combinations of four children, which are few on sparse or patterned boards.
+        '''
+
+        grid = np.asarray(grid)
+        size = grid.shape[0]
+        if grid.shape != (size, size) or size & (size - 1):
+            raise ValueError("HashLife needs a square board whose size is a power of two")
+
+        nodes = [self.off, self.on]
+        indices = (grid != 0).astype(np.int64)
+        while indices.shape[0] > 1:
+            quads = np.stack([indices[0::2, 0::2], indices[0::2, 1::2],
+                              indices[1::2, 0::2], indices[1::2, 1::2]], axis=-1)
+            unique, inverse = np.unique(quads.reshape(-1, 4), axis=0, return_inverse=True)
+            nodes = [self.join(nodes[a], nodes[b], nodes[c], nodes[d]) for a, b, c, d in unique]
+            indices = inverse.reshape(quads.shape[:2])
+        return nodes[indices[0, 0]]
+
+    def to_grid(self, node):
+        '''
+        Returns the dense grid of a node as numpy array of dtype int32
+        '''
+
+        grid = np.zeros((1 << node.level, 1 << node.level), dtype='i')
+        blocks = {}
+
+        def fill(node, view):
+            if node.population == 0:
+                return
+            if node.level == 0:
+                view[0, 0] = 1
+                return
+            block = blocks.get(node)
+            if block is not None:
+                view[...] = block
+                return
+            half = 1 << (node.level - 1)
+            fill(node.nw, view[:half, :half])
+            fill(node.ne, view[:half, half:])
+            fill(node.sw, view[half:, :half])
+            fill(node.se, view[half:, half:])
+            # small squares repeat on patterned boards
+            if node.level <= 5:
+                blocks[node] = view.copy()
+
+        fill(node, grid)
+        return grid
+
+    def tile(self, node, level):
+        '''
+        Returns the node of the given level tiled with copies of node
+        '''
+
+        while node.level < level:
+            node = self.join(node, node, node, node)
+        return node
+
+    def advance_power(self, node, j):
+        '''
+        Advances a toroidal board by 2^j generations. A jump which fills the cache beyond NODE_LIMIT
+        times max_nodes nodes is split into two jumps of half the generations, the cache is collected
+        before each of them. A single generation is never split, its nodes are bounded by the board.
+
+        :param node: node of the board
+        :param j: exponent of the number of generations
+        :return: node of the advanced board
+        '''
+
+        self.bounded = j > 0
+        try:
+            return self.jump(node, j)
+        except CacheExhausted:
+            self.collect(node)
+            return self.advance_power(self.advance_power(node, j - 1), j - 1)
+        finally:
+            self.bounded = False
+
+    def jump(self, node, j):
+        '''
+        Advances a toroidal board by 2^j generations in one jump
+        '''
+
+        k = node.level
+        # the tiled node is large enough to advance its centre by 2^j generations and to
+        # contain at least one complete board in its centre
+        level = max(k + 1, j + 2)
+        result = self.successor(self.tile(node, level), j)
+
+        if level == k + 1:
+            # the centre starts at half the board size, swap the quadrants back
+            return self.join(result.se, result.sw, result.ne, result.nw)
+
+        # the centre starts at 2^(level-2), a multiple of the board size, and consists
+        # of aligned copies of the advanced board
+        while result.level > k:
+            result = result.nw
+        return result
+
+    def advance(self, node, generations):
+        '''
+        Advances a toroidal board by any number of generations, by jumping by the powers of two
+        of its binary representation
+        '''
+
+        j = 0
+        while generations:
+            if generations & 1:
+                node = self.advance_power(node, j)
+                self.collect(node)
+            generations >>= 1
+            j += 1
+        return node
+
+    def collect(self, node):
+        '''
+        Evicts the cache if it exceeds max_nodes, only the nodes of the given board are kept
+        '''
+
+        if len(self.nodes) <= self.max_nodes:
+            return
+
+        kept = set()
+        stack = [node]
+        while stack:
+            current = stack.pop()
+            if current.level == 0 or current in kept:
+                continue
+            kept.add(current)
+            stack.extend((current.nw, current.ne, current.sw, current.se))
+
+        self.nodes = {(kept_node.nw, kept_node.ne, kept_node.sw, kept_node.se): kept_node for kept_node in kept}
+        for kept_node in kept:
+            kept_node.results = {}
+        self.empties = [self.off]
+
+    def update_grid(self, old_grid, generations=1):
+        '''
+        Advances a dense 2^k x 2^k grid by a number of generations and returns the new grid
+        as a numpy array of dtype int32.
+        '''
+
+        with self.lock:
+            node = self.advance(self.from_grid(old_grid), generations)
+            new_grid = self.to_grid(node)
+        return new_grid
+
+    @staticmethod
+    def supports(grid):
+        '''
+        Returns whether the shape of a grid is a power of two square, as needed by HashLife
+        '''
+
+        return HashLife.supports_shape(np.shape(grid))
+
+    @staticmethod
+    def supports_shape(shape):
+        '''
+        Returns whether a shape (rows, columns) is a power of two square
+        '''
+
+        rows, cols = shape
+        return rows == cols and rows >= 2 and not rows & (rows - 1)
@@ -1,40 +1,323 @@
-import sys
+import struct
+import socket
+import numpy as np
+from GameOfLife.grid_codec import GridCodec
+from GameOfLife.instrumentation import log
 
 
 class Helper:
     '''
     provides helper method for the server and client monnunication via sockets
-    to receive bytestreams
+    to send and receive framed messages
     '''
 
+    # message types of the wire protocol
+    PLAIN_GRID = 1 # raw grid, request and reply of the plaintext update
+    HE_KEYS = 2 # encryption parameters and evaluation keys of a client
+    HE_KEYS_ACCEPTED = 3 # reply to HE_KEYS carrying the id under which the server stored the keys
+    HE_GRID = 4 # encrypted grid, request and reply of the homomorphic update
+    ERROR = 5 # utf-8 error description
+    RUN = 6 # run parameters (number of generations, 0 = until STOP, and frame interval), followed by a PLAIN_GRID
+    FRAME = 7 # grid streamed during a run, the header carries its generation
+    STOP = 8 # stops the current run, no reply
+    RUN_DONE = 9 # end of a run, the header carries the last computed generation
+    ADVANCE = 10 # raw grid to advance by the number of generations in the header, answered by a PLAIN_GRID
+    SHM_ATTACH = 11 # path, dtype and shape of the SharedGrid of a client on the same host, empty reply when mapped
+    SHM_STEP = 12 # shared grid parameters (source buffer, number of generations), empty reply when the other
+                  # buffer holds the new grid
+    COMPRESSION = 13 # GridCodec.FORMAT, the grids of the rest of the session are encoded, answered by COMPRESSION
+    # commands for games kept by the server, all but GAME_CREATE carry the packed blobs of the game id and an
+    # argument, the commands reading or changing the board are answered by a PLAIN_GRID of the board
+    GAME_CREATE = 14 # raw grid, creates a game with the grid as board, answered by GAME_CREATE with the game id
+    GAME_STEP = 15 # advances the board by the number of generations in the header
+    GAME_EDIT = 16 # argument: int32 (row, column, alive) triples of the cells to set
+    GAME_FETCH = 17 # returns the board
+    GAME_END = 18 # removes the game, answered by GAME_END
+    PERIOD = 19 # sent during a run once the board turned out to be periodic, the header carries the period
+    # ERROR payload of a command for a game the server does not hold
+    UNKNOWN_GAME = b"unknown game id"
+    # ERROR payload of a SHM_STEP in a session without shared grid
+    NO_SHARED_GRID = b"no shared grid attached"
+    # ERROR payload of a HE_GRID whose key id the server does not hold
+    UNKNOWN_KEY_ID = b"unknown key id"
+
+    # flag of the message type of a grid encoded by the GridCodec of the session, the header carries
+    # the dtype and shape of the decoded grid and the length of the encoded grid
+    ENCODED = 0x80
+
+    # every message starts with its type, the generation it refers to (0 if not applicable), the length
+    # of its payload in bytes and, if the payload is a raw numpy grid, its dtype and shape (empty dtype
+    # and shape 0 x 0 for plain bytes)
+    HEADER = struct.Struct('!BQQ8sII')
+    # payload of a RUN message: number of generations and frame interval
+    RUN_PARAMETERS = struct.Struct('!QQ')
+    # payload of a SHM_STEP message: index of the buffer holding the old grid and number of generations
+    SHM_PARAMETERS = struct.Struct('!BQ')
+    # blobs in a payload are prefixed by their number and their lengths
+    BLOB_LENGTH = struct.Struct('!Q')
+
+    # dtypes of the grids a peer may send, other dtypes (e.g. object arrays) are never built from a header
+    GRID_DTYPES = {"<i4", "|u1", "|b1", "<u8"}
+    # largest payload accepted from a peer, which has to hold the galois keys of the largest parameters,
+    # and largest grid in bytes after decoding
+    MAX_PAYLOAD = 1 << 30
+
+    # payloads up to this size are sent together with the header in one call, larger
+    # payloads are sent from their own memory to avoid copying them
+    COALESCE_SIZE = 1 << 16
+
+    @staticmethod
+    def pack_message(message_type, payload, generation=0, codec=None):
+        '''
+        Returns the header of a message and its payload as flat bytes-like object. The payload is either
+        a bytes-like object or a 2D numpy grid, whose raw memory is sent directly with its dtype and shape
+        stored in the header, so no serialization is needed. If the session negotiated compression, boards
+        are encoded by its codec instead
+        '''
+
+        if codec is not None and isinstance(payload, np.ndarray) and codec.accepts(payload):
+            rows, cols = payload.shape
+            data = codec.encode(payload)
+            header = Helper.HEADER.pack(message_type | Helper.ENCODED, generation, len(data), payload.dtype.str.encode(),
+                                        rows, cols)
+            return header, data
+        elif isinstance(payload, np.ndarray):
+            payload = np.ascontiguousarray(payload)
+            rows, cols = payload.shape
+            header = Helper.HEADER.pack(message_type, generation, payload.nbytes, payload.dtype.str.encode(), rows, cols)
+            payload = memoryview(payload).cast('B')
+        else:
+            header = Helper.HEADER.pack(message_type, generation, len(payload), b'', 0, 0)
+        return header, payload
+
+    @staticmethod
+    def unpack_header(header):
+        '''
+        Returns the message type, the generation and the payload length of a message header and the
+        dtype and shape of the grid if the payload is a raw numpy grid (None and None otherwise). The header
+        comes from the peer, hence it is validated before anything is allocated from it: the payload and the
+        grid may have at most MAX_PAYLOAD bytes, only the dtypes in GRID_DTYPES are accepted and a grid has
+        at least one cell
+        '''
+
+        message_type, generation, length, dtype, rows, cols = Helper.HEADER.unpack(header)
+        if length > Helper.MAX_PAYLOAD:
+            raise RuntimeError("payload of {} bytes exceeds the limit".format(length))
+
+        dtype = dtype.rstrip(b'\0')
+        if not dtype:
+            if message_type & Helper.ENCODED:
+                raise RuntimeError("encoded grid without dtype")
+            return message_type, generation, length, None, None
+        try:
+            dtype = dtype.decode()
+        except UnicodeDecodeError:
+            raise RuntimeError("invalid dtype of the grid") from None
+        if dtype not in Helper.GRID_DTYPES:
+            raise RuntimeError("dtype {} of the grid is not accepted".format(dtype))
+        dtype = np.dtype(dtype)
+        if rows == 0 or cols == 0:
+            raise RuntimeError("grid without cells")
+        if dtype.itemsize * rows * cols > Helper.MAX_PAYLOAD:
+            raise RuntimeError("grid of {} x {} cells exceeds the limit".format(rows, cols))
+        if not message_type & Helper.ENCODED and dtype.itemsize * rows * cols != length:
+            raise RuntimeError("payload length does not match dtype and shape of the grid")
+        return message_type, generation, length, dtype, (rows, cols)
+
+    @staticmethod
+    def send_message(conn, message_type, payload, generation=0, codec=None):
+        '''
+        Sends a message of the given type, see pack_message
+        '''
+
+        header, payload = Helper.pack_message(message_type, payload, generation, codec)
+
+        if len(payload) <= Helper.COALESCE_SIZE:
+            conn.sendall(header + bytes(payload))
+        else:
+            conn.sendall(header)
+            conn.sendall(payload)
+
     @staticmethod
-    def receive_complete_bytestream(conn, MESSAGE_SIZE, MAX_BUFFER_SIZE):
+    def receive_into(conn, buffer):
         '''
-        Handles receiving data bytestream of server side sockets so that it is
-        complete based on a fixed byte size and returns the byte string
+        Fills the preallocated, writable buffer completely with bytes received from the socket
         '''
 
+        view = memoryview(buffer).cast('B')
+        size = len(view)
         bytes_received = 0
-        # start with empty byte message
-        input_from_client_bytes = b''
 
         # QUOTE FROM DOCUMENTATION:
         # "Now we come to the major stumbling block of sockets - send and recv operate on the network buffers.
         # They do not necessarily handle all the bytes you hand them (or expect from them), [...]"
         # Hence while loop to ensure we get the whole byte stream to deserialize
-        while bytes_received < MESSAGE_SIZE:
-            # receive bytestream from socket connection
-            current_input = conn.recv(MAX_BUFFER_SIZE)
+        while bytes_received < size:
+            current_input_size = conn.recv_into(view[bytes_received:])
             #if we receive an empty message something is odd
-            if current_input == b'':
+            if current_input_size == 0:
                 raise RuntimeError("socket connection broken")
+            bytes_received += current_input_size
+
+        return buffer
+
+    @staticmethod
+    def receive_message(conn, codec=None):
+        '''
+        Receives a complete message and returns its type, its payload and its generation. The payload is
+        received with a single copy into a buffer preallocated from the header: a numpy array of the
+        announced dtype and shape for grids and a bytearray otherwise. Encoded grids are decoded with the
+        codec of the session. Returns None, None, 0 if the peer closed the connection
+        '''
+
+        header = bytearray(Helper.HEADER.size)
+        view = memoryview(header)
+
+        # an orderly shutdown of the connection between two messages ends the session
+        bytes_received = conn.recv_into(view)
+        if bytes_received == 0:
+            return None, None, 0
+        Helper.receive_into(conn, view[bytes_received:])
+        message_type, generation, length, dtype, shape = Helper.unpack_header(header)
+
+        if dtype is not None and not message_type & Helper.ENCODED:
+            payload = np.empty(shape, dtype=dtype)
+        else:
+            payload = bytearray(length)
+        Helper.receive_into(conn, payload)
+
+        message_type, payload = Helper.decode_message(message_type, payload, dtype, shape, codec)
+        return message_type, payload, generation
+
+    @staticmethod
+    def decode_message(message_type, payload, dtype, shape, codec):
+        '''
+        Returns the message type without the ENCODED flag and the payload, decoded by the codec of the
+        session if it is an encoded grid
+        '''
+
+        if not message_type & Helper.ENCODED:
+            return message_type, payload
+        if codec is None:
+            raise RuntimeError("encoded grid received without negotiated compression")
+        return message_type & ~Helper.ENCODED, codec.decode(payload, dtype, shape)
 
-            # Did we receive the whole message? How much did we receive?
-            current_input_size = sys.getsizeof(current_input)
-            print(current_input_size, " bytes received")
-            #Update size condition to exit the loop
-            bytes_received = bytes_received + current_input_size
-            #appending current input to whole input byte message
-            input_from_client_bytes = input_from_client_bytes + current_input
+    @staticmethod
+    def pack_blobs(blobs):
+        '''
+        Packs a list of bytes-like objects (e.g. serialized ciphertexts) into one payload
+        '''
+
+        header = [Helper.BLOB_LENGTH.pack(len(blobs))]
+        header.extend(Helper.BLOB_LENGTH.pack(len(blob)) for blob in blobs)
+        return b''.join(header + list(blobs))
+
+    @staticmethod
+    def unpack_blobs(payload):
+        '''
+        Inverse of pack_blobs, returns a list of memoryviews into the payload. A truncated table of
+        lengths raises struct.error, a blob reaching beyond the payload raises ValueError.
+        '''
+
+        view = memoryview(payload)
+        count, = Helper.BLOB_LENGTH.unpack_from(view, 0)
+        offset = Helper.BLOB_LENGTH.size * (count + 1)
+
+        blobs = []
+        for i in range(count):
+            length, = Helper.BLOB_LENGTH.unpack_from(view, Helper.BLOB_LENGTH.size * (i + 1))
+            if offset + length > len(view):
+                raise ValueError("blob {} exceeds the payload".format(i))
+            blobs.append(view[offset:offset + length])
+            offset += length
+        return blobs
+
+
+class Connection:
+    '''
+    Long-lived client connection to the TCP server. One connection carries many requests of a
+    session; it is established lazily and re-established once if it broke in the meantime. With
+    compression, every new session asks the server to exchange the boards encoded by a GridCodec,
+    servers that do not support it keep receiving and sending raw grids.
+    '''
+
+    def __init__(self, server_adress, port, compression=False):
+        self.server_adress = server_adress
+        self.port = port
+        self.compression = compression
+        self.socket = None
+        # codec of the session, None while the grids are sent raw
+        self.codec = None
+
+    def connect(self):
+        '''
+        Establishes the connection to the server
+        '''
+
+        self.socket = socket.create_connection((self.server_adress, self.port))
+        # sessions exchange many small request / reply messages
+        self.socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        log.info("[CLIENT/connection] Client connection established at %s:%s", self.server_adress, self.port)
+
+        if self.compression:
+            Helper.send_message(self.socket, Helper.COMPRESSION, GridCodec.FORMAT)
+            answer_type, _, _ = Helper.receive_message(self.socket)
+            if answer_type is None:
+                raise RuntimeError("socket connection closed by server")
+            if answer_type == Helper.COMPRESSION:
+                self.codec = GridCodec()
+
+    # requests which change the state kept by the server, sending them again after a lost answer would
+    # apply them twice (e.g. step a game twice)
+    NOT_IDEMPOTENT = (Helper.GAME_STEP,)
+
+    def request(self, message_type, payload, generation=0):
+        '''
+        Sends a request and returns the type and payload of the answer of the server. An idempotent
+        request that failed on a broken connection is sent again once on a new connection, the
+        requests in NOT_IDEMPOTENT raise the error
+        '''
+
+        for attempt in range(2):
+            try:
+                if self.socket is None:
+                    self.connect()
+                Helper.send_message(self.socket, message_type, payload, generation, self.codec)
+                answer_type, answer, generation = Helper.receive_message(self.socket, self.codec)
+                if answer_type is None:
+                    raise RuntimeError("socket connection closed by server")
+                return answer_type, answer
+            except (OSError, RuntimeError):
+                self.close()
+                if attempt or message_type in self.NOT_IDEMPOTENT:
+                    raise
+                log.warning("[CLIENT/connection] Connection broken, reconnecting")
+
+    def send(self, message_type, payload):
+        '''
+        Sends a message without waiting for an answer, used for streamed runs which can not be retried
+        '''
+
+        if self.socket is None:
+            self.connect()
+        Helper.send_message(self.socket, message_type, payload, codec=self.codec)
+
+    def receive(self):
+        '''
+        Receives the next message of a streamed run and returns its type, payload and generation
+        '''
+
+        message_type, payload, generation = Helper.receive_message(self.socket, self.codec)
+        if message_type is None:
+            raise RuntimeError("socket connection closed by server")
+        return message_type, payload, generation
+
+    def close(self):
+        '''
+        Closes the connection, the next request will reconnect
+        '''
 
-        return input_from_client_bytes
\ No newline at end of file
+        if self.socket is not None:
+            self.socket.close()
+            self.socket = None
+        self.codec = None
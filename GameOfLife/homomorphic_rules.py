@@ -0,0 +1,231 @@
+'''
+@Author: Patrick Tu & Kathrin Witzlsperger
+
+'''
+
+from seal import Evaluator, Ciphertext, Plaintext, PolyCRTBuilder, ChooserEvaluator
+from GameOfLife.engine import Engine
+from GameOfLife.thread_pool import ThreadPool
+
+
+class HomomorphicRules:
+    '''
+    Evaluates Conway's rules completely on the server side on a batched, encrypted board.
+    The client packs the N x N board with a one cell wrap-around halo into the first row of
+    the batching slots, i.e. as a (N+2) x (N+2) matrix in row-major order. The 8 neighbour
+    shifts are then simple rotations of the slot row and the new generation of every interior
+    cell is computed by a low-depth polynomial in the neighbour count and the cell itself.
+    '''
+
+    # roots of the polynomial q(s) = s(s-1)(s-4)(s-5)(s-6)(s-7)(s-8), which vanishes for every
+    # neighbour count s except 2 and 3
+    ROOTS = [0, 1, 4, 5, 6, 7, 8]
+
+    def __init__(self, context, dim, galois_keys, evaluation_keys, thread_pool=None):
+
+        self.dim = dim
+        self.width = dim + 2 # width of the board including the halo
+        self.galois_keys = galois_keys
+        self.evaluation_keys = evaluation_keys
+
+        self.evaluator = Evaluator(context)
+        # rotations and independent multiplications are spread over the threads of the pool
+        self.thread_pool = thread_pool or ThreadPool()
+        self.crtbuilder = PolyCRTBuilder(context)
+        self.plain_modulus = context.plain_modulus().value()
+
+        # the padded board has to fit into one row of the 2 x slot_count/2 batching matrix
+        if self.width * self.width > self.crtbuilder.slot_count() // 2:
+            raise ValueError("Board of dimension {} does not fit into one batched ciphertext".format(dim))
+
+        # cache of plaintexts holding the same constant in every slot
+        self.constants = {}
+
+        # alive = q(s) * [(s-2) / q(3) + x * (s-3) / -q(2)] evaluates to 1 for s == 3
+        # and for x == 1, s == 2 and to 0 otherwise
+        q3 = self.q(3)
+        q2 = -self.q(2)
+        self.inverse_q3 = self.inverse(q3)
+        self.inverse_q2 = self.inverse(q2)
+
+    def q(self, s):
+        '''
+        Evaluates q(s) in plain integers
+        '''
+
+        result = 1
+        for root in self.ROOTS:
+            result *= s - root
+        return result
+
+    def inverse(self, value):
+        '''
+        Returns the multiplicative inverse of value modulo the (prime) plain modulus
+        '''
+
+        return pow(value % self.plain_modulus, self.plain_modulus - 2, self.plain_modulus)
+
+    def constant(self, value):
+        '''
+        Returns a batched plaintext holding value in every slot
+        '''
+
+        value = value % self.plain_modulus
+        if value not in self.constants:
+            plain = Plaintext()
+            self.crtbuilder.compose([value] * self.crtbuilder.slot_count(), plain)
+            self.constants[value] = plain
+        return self.constants[value]
+
+    def multiply(self, encrypted1, encrypted2, memory_pool=None):
+        '''
+        Multiplies two ciphertexts and relinearizes the result back to size 2
+        '''
+
+        memory_pool = memory_pool or self.thread_pool.memory_pool()
+        encrypted_result = Ciphertext()
+        self.evaluator.multiply(encrypted1, encrypted2, encrypted_result, memory_pool)
+        self.evaluator.relinearize(encrypted_result, self.evaluation_keys, memory_pool)
+        return encrypted_result
+
+    def multiply_tree(self, encrypted_factors):
+        '''
+        Multiplies a list of ciphertexts pairwise level by level to keep the multiplicative depth logarithmic
+        '''
+
+        while len(encrypted_factors) > 1:
+            # the products of one level are independent of each other
+            pairs = [(encrypted_factors[i], encrypted_factors[i + 1]) for i in range(0, len(encrypted_factors) - 1, 2)]
+            next_level = self.thread_pool.map(lambda pair, memory_pool: self.multiply(pair[0], pair[1], memory_pool), pairs)
+            if len(encrypted_factors) % 2:
+                next_level.append(encrypted_factors[-1])
+            encrypted_factors = next_level
+        return encrypted_factors[0]
+
+    def live_neighbours(self, encrypted_grid):
+        '''
+        Computes the encrypted live neighbour count of every interior cell by summing the 8 rotations
+        of the padded board
+
+        :param encrypted_grid: Ciphertext of the padded board
+        :return: Ciphertext of the live neighbour counts
+        '''
+
+        def rotate(offset, memory_pool):
+            # rotating to the left by k steps moves the value of slot i+k into slot i
+            x, y = offset
+            encrypted_shift = Ciphertext()
+            self.evaluator.rotate_rows(encrypted_grid, x * self.width + y, self.galois_keys, encrypted_shift, memory_pool)
+            return encrypted_shift
+
+        encrypted_shifts = self.thread_pool.map(rotate, Engine.NEIGHBOUR_OFFSETS)
+
+        encrypted_live_neighbours = Ciphertext()
+        self.evaluator.add_many(encrypted_shifts, encrypted_live_neighbours)
+        return encrypted_live_neighbours
+
+    def next_generation(self, encrypted_grid):
+        '''
+        Computes the encrypted next generation of the padded board. Interior slots of the result
+        hold 1 (alive) or 0 (dead), the halo slots have to be ignored by the client.
+
+        :param encrypted_grid: Ciphertext of the padded board
+        :return: Ciphertext of the new generation
+        '''
+
+        encrypted_live_neighbours = self.live_neighbours(encrypted_grid)
+
+        # linear factors (s - root) of q(s), multiplied with depth 3
+        encrypted_factors = []
+        for root in self.ROOTS:
+            encrypted_factor = Ciphertext(encrypted_live_neighbours)
+            self.evaluator.sub_plain(encrypted_factor, self.constant(root))
+            encrypted_factors.append(encrypted_factor)
+        encrypted_q = self.multiply_tree(encrypted_factors)
+
+        # (s-2) / q(3)
+        encrypted_born = Ciphertext(encrypted_live_neighbours)
+        self.evaluator.sub_plain(encrypted_born, self.constant(2))
+        self.evaluator.multiply_plain(encrypted_born, self.constant(self.inverse_q3))
+
+        # x * (s-3) / -q(2)
+        encrypted_survive = Ciphertext(encrypted_live_neighbours)
+        self.evaluator.sub_plain(encrypted_survive, self.constant(3))
+        encrypted_survive = self.multiply(encrypted_grid, encrypted_survive)
+        self.evaluator.multiply_plain(encrypted_survive, self.constant(self.inverse_q2))
+
+        self.evaluator.add(encrypted_born, encrypted_survive)
+        return self.multiply(encrypted_q, encrypted_born)
+
+    @classmethod
+    def model(cls, encrypted_grid, decomposition_bit_count):
+        '''
+        Models next_generation on a ChooserPoly for the parameter selection of the client. Rotations
+        switch keys like a relinearization, so they are modelled as relinearizations. The plaintext
+        constants are modelled as polynomials with one coefficient of absolute value 1, the slot values
+        themselves are reduced modulo the plain modulus and only the noise of the result is meaningful.
+
+        :param encrypted_grid: ChooserPoly of a freshly encrypted padded board
+        :param decomposition_bit_count: decomposition bit count of the galois keys and evaluation keys
+        :return: ChooserPoly of the new generation
+        '''
+
+        evaluator = ChooserEvaluator()
+
+        def multiply(operand1, operand2):
+            return evaluator.relinearize(evaluator.multiply(operand1, operand2), decomposition_bit_count)
+
+        live_neighbours = evaluator.add_many([evaluator.relinearize(encrypted_grid, decomposition_bit_count)
+                                              for _ in Engine.NEIGHBOUR_OFFSETS])
+
+        factors = [evaluator.sub_plain(live_neighbours, 1, 1) for _ in cls.ROOTS]
+        while len(factors) > 1:
+            next_level = [multiply(factors[i], factors[i + 1]) for i in range(0, len(factors) - 1, 2)]
+            if len(factors) % 2:
+                next_level.append(factors[-1])
+            factors = next_level
+
+        born = evaluator.multiply_plain(evaluator.sub_plain(live_neighbours, 1, 1), 1, 1)
+        survive = multiply(encrypted_grid, evaluator.sub_plain(live_neighbours, 1, 1))
+        survive = evaluator.multiply_plain(survive, 1, 1)
+        return multiply(factors[0], evaluator.add(born, survive))
+
+
+class HomomorphicEvaluator:
+    '''
+    Computes the encrypted new grid from the encrypted message of a client. It is shared by the
+    simulated server and the TCP server and keeps one Evaluator for all generations. With more
+    than one thread the cells or batches are evaluated in parallel.
+    '''
+
+    def __init__(self, context, N, galois_keys=None, evaluation_keys=None, threads=1):
+
+        self.evaluator = Evaluator(context)
+        self.thread_pool = ThreadPool(threads)
+        # with galois keys and evaluation keys the server counts neighbours and applies the rules itself
+        self.rules = None
+        if galois_keys is not None and evaluation_keys is not None:
+            self.rules = HomomorphicRules(context, N, galois_keys, evaluation_keys, self.thread_pool)
+
+    def evaluate(self, encrypted_old_grid, encrypted_live_neighbours_grid=None):
+        '''
+        Computes the encrypted new grid. Without a live neighbour grid the client only sent the batched
+        board and the neighbours and rules are evaluated homomorphically by HomomorphicRules.
+
+        :param encrypted_old_grid: List of ciphertexts of the old grid
+        :param encrypted_live_neighbours_grid: List of ciphertexts of the encoded live neighbours or None
+        :return: List of ciphertexts of the new grid
+        '''
+
+        if encrypted_live_neighbours_grid is None:
+            if self.rules is None:
+                raise ValueError("Server side rules need galois keys and evaluation keys")
+            return [self.rules.next_generation(encrypted_old_grid[0])]
+
+        def add(indices, memory_pool):
+            # one C++ call adds all cells or batches of the chunk
+            return self.evaluator.add_elementwise([encrypted_old_grid[i] for i in indices],
+                                                  [encrypted_live_neighbours_grid[i] for i in indices])
+
+        # one addition per cell or per batch of cells
+        return self.thread_pool.map_chunks(add, range(len(encrypted_old_grid)))
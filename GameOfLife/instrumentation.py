@@ -0,0 +1,213 @@
+'''
+@Author: Patrick Tu & Kathrin Witzlsperger
+
+'''
+
+import os
+import sys
+import time
+import bisect
+import logging
+import threading
+from contextlib import contextmanager
+from http.server import HTTPServer, BaseHTTPRequestHandler
+
+
+# tracing of every generation, progress messages at INFO and whole grids at DEBUG. Nothing is output
+# unless a level is configured, and the grids are only formatted if DEBUG is enabled.
+log = logging.getLogger("GameOfLife")
+
+
+class Histogram:
+    '''
+    Histogram of the durations of one stage with fixed, roughly logarithmic buckets
+
+    :param buckets: upper bounds of the buckets in seconds, an overflow bucket is added
+    '''
+
+    BUCKETS = [0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10]
+
+    def __init__(self, buckets=BUCKETS):
+
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds):
+        '''
+        Records one duration
+        '''
+
+        self.counts[bisect.bisect_left(self.buckets, seconds)] += 1
+        self.count += 1
+        self.sum += seconds
+        self.max = max(self.max, seconds)
+
+    def quantile(self, q):
+        '''
+        Returns the upper bound of the bucket holding the q-quantile, the maximum for the overflow bucket
+        '''
+
+        rank = q * self.count
+        cumulative = 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            if cumulative >= rank:
+                return min(bound, self.max)
+        return self.max
+
+
+class Metrics:
+    '''
+    Registry of the stage timers of one process. The stages are
+
+        neighbour_count  counting the live neighbours on the client
+        encrypt          encoding and encrypting a generation
+        transport        from handing a request to the (simulated) server until the reply is back,
+                         including the serialization and server_evaluate
+        server_evaluate  computing a generation on the server, plain or encrypted
+        decrypt          decrypting the ciphertexts of a generation
+        decode           decoding the plaintexts into the grid
+        render           drawing a generation in the GUI
+        generation       a whole GameOfLife.update_grid
+
+    The durations are exported as periodic summary and in the Prometheus text format on a local HTTP endpoint.
+    '''
+
+    def __init__(self):
+
+        self.histograms = {}
+        self.lock = threading.Lock()
+
+    def observe(self, stage, seconds):
+        '''
+        Records a duration of a stage
+        '''
+
+        with self.lock:
+            histogram = self.histograms.get(stage)
+            if histogram is None:
+                histogram = self.histograms[stage] = Histogram()
+            histogram.observe(seconds)
+
+    @contextmanager
+    def timer(self, stage):
+        '''
+        Context manager recording the duration of its block for the stage
+        '''
+
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - start)
+
+    def snapshot(self):
+        '''
+        Returns count, mean, approximate median and 95th percentile and maximum in milliseconds of every stage
+        '''
+
+        with self.lock:
+            return {stage: {"count": histogram.count,
+                            "mean_ms": 1000 * histogram.sum / histogram.count,
+                            "p50_ms": 1000 * histogram.quantile(0.5),
+                            "p95_ms": 1000 * histogram.quantile(0.95),
+                            "max_ms": 1000 * histogram.max}
+                    for stage, histogram in self.histograms.items()}
+
+    def summary(self):
+        '''
+        Returns the snapshot as one line per stage
+        '''
+
+        return "\n".join("[METRICS] {:<16} count {:>7}  mean {:9.3f} ms  p50 <= {:9.3f} ms  p95 <= {:9.3f} ms  "
+                         "max {:9.3f} ms".format(stage, s["count"], s["mean_ms"], s["p50_ms"], s["p95_ms"], s["max_ms"])
+                         for stage, s in sorted(self.snapshot().items()))
+
+    def prometheus(self):
+        '''
+        Returns the histograms in the Prometheus text exposition format
+        '''
+
+        lines = ["# HELP gameoflife_stage_seconds Duration of the stages of the Game of Life pipeline",
+                 "# TYPE gameoflife_stage_seconds histogram"]
+        with self.lock:
+            for stage, histogram in sorted(self.histograms.items()):
+                cumulative = 0
+                for bound, count in zip(histogram.buckets + ["+Inf"], histogram.counts):
+                    cumulative += count
+                    lines.append('gameoflife_stage_seconds_bucket{{stage="{}",le="{}"}} {}'.format(stage, bound,
+                                                                                                  cumulative))
+                lines.append('gameoflife_stage_seconds_sum{{stage="{}"}} {}'.format(stage, histogram.sum))
+                lines.append('gameoflife_stage_seconds_count{{stage="{}"}} {}'.format(stage, histogram.count))
+        return "\n".join(lines) + "\n"
+
+    def start_reporter(self, interval, stream=None):
+        '''
+        Writes the summary every interval seconds to the stream (default stderr) in a background thread
+        '''
+
+        def report():
+            while True:
+                time.sleep(interval)
+                summary = self.summary()
+                if summary:
+                    print(summary, file=stream or sys.stderr, flush=True)
+
+        threading.Thread(target=report, daemon=True).start()
+
+    def serve(self, port, address="127.0.0.1"):
+        '''
+        Serves the histograms at http://address:port/metrics in a background thread
+
+        :return: the HTTPServer
+        '''
+
+        metrics = self
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+
+            def do_GET(self):
+                if self.path != "/metrics":
+                    self.send_error(404)
+                    return
+                body = metrics.prometheus().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                # scrapes are not traced
+                pass
+
+        server = HTTPServer((address, port), MetricsHandler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return server
+
+
+# stage timers of this process
+metrics = Metrics()
+
+
+def configure(level=None, report_interval=None, port=None):
+    '''
+    Enables the tracing and the export of the stage timers, everything is off by default. Unset
+    arguments are taken from the environment variables GOL_LOG_LEVEL (e.g. INFO, or DEBUG for the
+    grid dumps), GOL_METRICS_INTERVAL (seconds between summaries) and GOL_METRICS_PORT.
+    '''
+
+    level = level or os.environ.get("GOL_LOG_LEVEL")
+    report_interval = report_interval or os.environ.get("GOL_METRICS_INTERVAL")
+    port = port or os.environ.get("GOL_METRICS_PORT")
+
+    if level:
+        logging.basicConfig(format="%(message)s")
+        log.setLevel(level.upper() if isinstance(level, str) else level)
+    if report_interval:
+        metrics.start_reporter(float(report_interval))
+    if port:
+        metrics.serve(int(port))
@@ -0,0 +1,120 @@
+'''
+@Author: Patrick Tu & Kathrin Witzlsperger
+
+'''
+
+import os
+import shutil
+import hashlib
+import tempfile
+from seal import PublicKey, SecretKey, GaloisKeys, EvaluationKeys
+from GameOfLife.instrumentation import log
+
+
+class KeyStore:
+    '''
+    Caches the keys of the client on disk, so that a new game with the same encryption parameters
+    loads its keys instead of running the key generation again. Every set of parameters has its own
+    directory, named after the hash of the serialized parameters. The directory holds the secret key
+    and is therefore only readable by the user. The keys of one key generation are written into a
+    temporary directory, which is renamed into place in one step, so a directory never mixes keys of
+    different key generations.
+
+    :param directory: directory of the key store, created if it does not exist
+    '''
+
+    DIRECTORY = os.path.join(os.path.expanduser("~"), ".gameoflife", "keys")
+
+    # types of the stored keys by file name
+    KEY_TYPES = {"public_key": PublicKey,
+                 "secret_key": SecretKey,
+                 "galois_keys": GaloisKeys,
+                 "evaluation_keys": EvaluationKeys}
+
+    def __init__(self, directory=DIRECTORY):
+
+        self.directory = directory
+
+    def path(self, parms):
+        '''
+        Returns the directory of the keys for the encryption parameters
+        '''
+
+        return os.path.join(self.directory, hashlib.sha256(parms.save_bytes()).hexdigest())
+
+    def load(self, parms, names):
+        '''
+        Loads the keys for the encryption parameters
+
+        :param parms: EncryptionParameters the keys were generated for
+        :param names: names of the keys to load
+        :return: dictionary of the keys by name or None if one of them is not stored or can not be loaded
+        '''
+
+        path = self.path(parms)
+        keys = {}
+        for name in names:
+            try:
+                with open(os.path.join(path, name), 'rb') as file:
+                    data = file.read()
+            except OSError:
+                return None
+            key = self.KEY_TYPES[name]()
+            try:
+                key.load_bytes(data)
+            except RuntimeError:
+                # the SEAL wrapper raises RuntimeError on a damaged key, which is generated again
+                return None
+            keys[name] = key
+        return keys
+
+    def save(self, parms, keys):
+        '''
+        Stores the keys for the encryption parameters. If a concurrent game stored a complete set of keys
+        for the same parameters first, its keys are kept and returned instead, so that both games use the
+        same keys. A stored set lacking some of the keys is replaced.
+
+        :param parms: EncryptionParameters the keys were generated for
+        :param keys: dictionary of the keys by name
+        :return: the keys stored for the parameters
+        '''
+
+        path = self.path(parms)
+        os.makedirs(self.directory, mode=0o700, exist_ok=True)
+        # mkdtemp creates the directory only readable by the user
+        temporary = tempfile.mkdtemp(prefix=".tmp-", dir=self.directory)
+        try:
+            for name, key in keys.items():
+                descriptor = os.open(os.path.join(temporary, name), os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+                with os.fdopen(descriptor, 'wb') as file:
+                    file.write(key.save_bytes())
+
+            for attempt in range(3):
+                try:
+                    os.rename(temporary, path)
+                    return keys
+                except OSError:
+                    if not os.path.isdir(path):
+                        raise
+                stored = self.load(parms, keys)
+                if stored is not None:
+                    return stored
+                self.discard(path)
+            log.warning("[KEYSTORE] Keys for %s not stored, the directory keeps being replaced", path)
+            return keys
+        finally:
+            shutil.rmtree(temporary, ignore_errors=True)
+
+    def discard(self, path):
+        '''
+        Removes the directory of stored keys. It is renamed away first, so concurrent loads see
+        either all keys or none.
+        '''
+
+        trash = tempfile.mkdtemp(prefix=".tmp-", dir=self.directory)
+        try:
+            # an empty directory is replaced by the rename
+            os.rename(path, trash)
+        except FileNotFoundError:
+            pass
+        shutil.rmtree(trash, ignore_errors=True)
@@ -6,21 +6,39 @@
 
 '''
 
+import os
 import numpy as np
 import socket
-from threading import Thread
-import traceback
+import struct
+from collections import OrderedDict
+from threading import Thread, Lock
 import sys
-from io import BytesIO
+import hashlib
+import select
+from seal import EncryptionParameters, \
+                 SEALContext,          \
+                 Ciphertext,           \
+                 GaloisKeys,           \
+                 EvaluationKeys
 from time import gmtime, strftime
 from GameOfLife.helper import Helper
+from GameOfLife.engine import Engine
+from GameOfLife.bit_engine import BitEngine
+from GameOfLife.tiled_engine import TiledEngine
+from GameOfLife.hashlife import HashLife
+from GameOfLife.active_engine import ActiveEngine
+from GameOfLife.shared_grid import SharedGrid
+from GameOfLife.grid_codec import GridCodec
+from GameOfLife.game_store import GameStore
+from GameOfLife.cycle_detector import CycleDetector
+from GameOfLife.homomorphic_rules import HomomorphicEvaluator
+from GameOfLife.instrumentation import log, metrics, configure
 
 
-# This server is started in parallel with the client. For the extension of the functionality,
-# the homomorphic operations could be further implemented in this class once the issues
-# of serializing PySEAL objects (i.e. Ciphertext and Context) are resolved. There were already github
-# issues regarding that issued. Currently the server just supports the non-homomorphic-encrypted
-# operations to compute the next state of the game of live.
+# This server is started in parallel with the client. It computes the next state of the game of live
+# either on the plain grid or homomorphically on an encrypted grid. Encrypted grids and the keys needed by
+# the server are transferred using the binary save_bytes / load_bytes serialization of the PySEAL wrapper,
+# so that the homomorphic operations can run on a separate machine.
 
 
 class gol_methods:
@@ -29,110 +47,510 @@ class gol_methods:
     of Conway's game of life
     '''
 
+    # HashLife engine shared by all clients, its node cache pays off across requests
+    hashlife = HashLife()
+
+    # generations a request may step one by one, the cost of a jump of HashLife grows only with their logarithm
+    MAX_GENERATIONS = 1 << 16
+
     @staticmethod
     def live_neighbours(i, j, old_grid):
         """
         Count the number of live neighbours around point (i, j). In total all
         8 adjacent cells are assessed.
         """
-        s = 0 # The total number of live neighbours.
         N = len(old_grid)
 
-        # Loop over all the neighbours.
-        for x in [i-1, i, i+1]:
-            for y in [j-1, j, j+1]:
-                if(x == i and y == j):
-                    continue # Skip the current point itself - we only want to count the neighbours!
-                if(x != N and y != N):
-                    s += old_grid[x][y]
-                # The remaining branches handle the case where the neighbour is off the end of the grid.
-                # In this case, we loop back round such that the grid becomes a "toroidal array".
-                elif(x == N and y != N):
-                    s += old_grid[0][y]
-                elif(x != N and y == N):
-                    s += old_grid[x][0]
-                else:
-                    s += old_grid[0][0]
-        return s
+        # The modulo wraps the neighbours off the end of the grid around, such that the grid becomes a "toroidal array".
+        return sum(old_grid[(i + x) % N][(j + y) % N] for x, y in Engine.NEIGHBOUR_OFFSETS)
+
+    @staticmethod
+    def next_generation(old_grid):
+        """
+        Applies Conway's rules with the bit-packed engine, very large boards
+        are split into tiles which are stepped on all cores
+        """
+
+        if old_grid.size >= TiledEngine.MIN_CELLS:
+            with TiledEngine.for_shape(old_grid.shape) as engine:
+                return engine.update_grid(old_grid)
+        return BitEngine.update_grid(old_grid)
 
     @staticmethod
     def update_grid(old_grid):
         """
-        Updates a N X N numpy array / grid by looping over each
-        cell of the grid and apply Conway's rules
+        Updates a N X N numpy array / grid by applying Conway's rules
+        to all cells at once using the shared vectorized engine
         Returns the new Numpy Array
         """
 
-        N = len(old_grid)
+        new_grid = gol_methods.next_generation(old_grid)
+
+        log.info("[SERVER] New Grid State computed")
+        return new_grid
+
+    @staticmethod
+    def generations_allowed(shape, generations):
+        """
+        Returns whether a request may advance a board of the shape by a number of generations, boards
+        which are not advanced by HashLife are stepped at most MAX_GENERATIONS generations
+        """
+
+        return generations <= gol_methods.MAX_GENERATIONS or HashLife.supports_shape(shape)
+
+    @staticmethod
+    def advance(old_grid, generations):
+        """
+        Advances a grid by a number of generations. Power of two square boards jump ahead
+        with HashLife, other boards are stepped generation by generation
+        """
+
+        if HashLife.supports(old_grid):
+            new_grid = gol_methods.hashlife.update_grid(old_grid, generations)
+        else:
+            new_grid = old_grid
+            for _ in range(generations):
+                new_grid = gol_methods.next_generation(new_grid)
 
-        new_grid = np.zeros(N*N, dtype='i').reshape(N,N) # I THINK HERE IS THE ERROR
-        for i in range(N):
-            for j in range(N):
-                live = gol_methods.live_neighbours(i, j, old_grid)
-                if(old_grid[i][j] == 1 and live < 2):
-                    new_grid[i][j] = 0 # Dead from starvation.
-                elif(old_grid[i][j] == 1 and (live == 2 or live == 3)):
-                    new_grid[i][j] = 1 # Continue living.
-                elif(old_grid[i][j] == 1 and live > 3):
-                    new_grid[i][j] = 0 # Dead from overcrowding.
-                elif(old_grid[i][j] == 0 and live == 3):
-                    new_grid[i][j] = 1 # Alive from reproduction.
-
-        print("[SERVER] New Grid State computed")
+        log.info("[SERVER] Grid advanced by %d generations", generations)
         return new_grid
 
+    @staticmethod
+    def advance_packed(packed, cols, generations):
+        """
+        Advances a bit-packed board with cols columns by a number of generations. Jumps on power of two
+        boards are computed by HashLife and very large boards are stepped in tiles, other boards are
+        stepped without unpacking them
+        """
+
+        rows = len(packed)
+        if generations > 1 and HashLife.supports_shape((rows, cols)):
+            return BitEngine.pack(gol_methods.advance(BitEngine.unpack(packed, cols), generations))
+        if rows * cols >= TiledEngine.MIN_CELLS:
+            grid = BitEngine.unpack(packed, cols)
+            for _ in range(generations):
+                grid = gol_methods.next_generation(grid)
+            return BitEngine.pack(grid)
+
+        for _ in range(generations):
+            packed = BitEngine.update_packed(packed, cols)
+        log.info("[SERVER] Packed grid advanced by %d generations", generations)
+        return packed
+
+    @staticmethod
+    def advance_power(old_grid, k):
+        """
+        Advances a grid by 2^k generations
+        """
+
+        return gol_methods.advance(old_grid, 1 << k)
+
 class Server:
+    '''
+    Threaded TCP server, one thread per client session
+
+    :param game_cache_bytes: memory cap of the boards of the games kept by the server
+    '''
+
+    # homomorphic evaluators kept at the same time, each holds the keys of a client, which take up to hundreds of MB
+    MAX_EVALUATORS = int(os.environ.get("GOL_HE_EVALUATORS", 4))
+
+    def __init__(self, game_cache_bytes=GameStore.MAX_BYTES):
+        # homomorphic evaluators of the clients that registered their keys, by key id, least recently used
+        # first. A client whose evaluator was evicted registers its keys again.
+        self.homomorphic_evaluators = OrderedDict()
+        self.homomorphic_evaluators_lock = Lock()
+        # games kept by the server for clients sending commands instead of grids, by game id
+        self.games = GameStore(game_cache_bytes)
+
+    def plain_grid_request(self, old_grid):
+        '''
+        Computes the next generation of a grid
+        :param old_grid: old grid as numpy array
+        :return: reply message type and new grid
+        '''
+
+        if not isinstance(old_grid, np.ndarray):
+            return Helper.ERROR, b"grid expected"
+
+        log.debug("[SERVER] Grid received\n%s", old_grid)
+
+        # update the grid by calling the method from gol_methods
+        with metrics.timer("server_evaluate"):
+            new_grid = gol_methods.update_grid(old_grid)
+
+        return Helper.PLAIN_GRID, new_grid
+
+    def advance_request(self, old_grid, generations):
+        '''
+        Advances a grid by a number of generations, e.g. 2^k or the distance to a target generation
+        :param old_grid: old grid as numpy array
+        :param generations: number of generations
+        :return: reply message type and new grid
+        '''
+
+        if not isinstance(old_grid, np.ndarray):
+            return Helper.ERROR, b"grid expected"
+        if not gol_methods.generations_allowed(old_grid.shape, generations):
+            return Helper.ERROR, "at most {} generations per request".format(gol_methods.MAX_GENERATIONS).encode()
+
+        return Helper.PLAIN_GRID, gol_methods.advance(old_grid, generations)
+
+    def shared_attach_request(self, payload, session):
+        '''
+        Maps the shared grid of a client on the same host for the rest of the session
+        :param payload: path, dtype and shape of the shared grid, see SharedGrid.describe
+        :param session: state of the client session
+        :return: reply message type and empty reply, or an error if the grid can not be mapped (e.g. because
+                 the client runs on another host)
+        '''
+
+        try:
+            shared_grid = SharedGrid.attach(payload)
+        except (OSError, ValueError, TypeError, struct.error) as error:
+            return Helper.ERROR, str(error).encode()
+
+        self.close_session(session)
+        session["shared_grid"] = shared_grid
+        log.info("[SERVER] Shared grid %s attached", shared_grid.path)
+        return Helper.SHM_ATTACH, b''
+
+    def shared_step_request(self, payload, session):
+        '''
+        Advances the old grid in one buffer of the shared grid of the session and writes the new grid
+        into the other buffer
+        :param payload: index of the buffer holding the old grid and number of generations
+        :param session: state of the client session
+        :return: reply message type and empty reply
+        '''
+
+        shared_grid = session.get("shared_grid")
+        if shared_grid is None:
+            return Helper.ERROR, Helper.NO_SHARED_GRID
+        try:
+            source, generations = Helper.SHM_PARAMETERS.unpack(payload)
+        except struct.error:
+            return Helper.ERROR, b"malformed shared grid parameters"
+        if source > 1:
+            return Helper.ERROR, b"invalid buffer"
+
+        old_grid = shared_grid.buffers[source]
+        if not gol_methods.generations_allowed(old_grid.shape, generations):
+            return Helper.ERROR, "at most {} generations per request".format(gol_methods.MAX_GENERATIONS).encode()
+        with metrics.timer("server_evaluate"):
+            if generations == 1:
+                new_grid = gol_methods.update_grid(old_grid)
+            else:
+                new_grid = gol_methods.advance(old_grid, generations)
+            shared_grid.buffers[1 - source][...] = new_grid
+
+        return Helper.SHM_STEP, b''
+
+    def game_create_request(self, grid):
+        '''
+        Creates a game kept by the server
+        :param grid: initial board as numpy array
+        :return: reply message type and game id
+        '''
+
+        if not isinstance(grid, np.ndarray) or grid.ndim != 2:
+            return Helper.ERROR, b"grid expected"
+        try:
+            game_id = self.games.create(grid)
+        except ValueError as error:
+            return Helper.ERROR, str(error).encode()
+
+        log.info("[SERVER] Game %s created, %d games kept", game_id.decode(), len(self.games))
+        return Helper.GAME_CREATE, game_id
+
+    def game_request(self, message_type, payload, generations):
+        '''
+        Applies a command to a game kept by the server
+        :param message_type: GAME_STEP, GAME_EDIT, GAME_FETCH or GAME_END
+        :param payload: packed blobs of the game id and the argument of the command
+        :param generations: number of generations of GAME_STEP
+        :return: reply message type and board, or an error if the game is unknown (e.g. because it was evicted)
+                 or the command is malformed
+        '''
 
-    def client_thread(self,conn, ip, port, MAX_BUFFER_SIZE = 65536):
+        try:
+            blobs = Helper.unpack_blobs(payload)
+        except (struct.error, ValueError):
+            return Helper.ERROR, b"malformed game command"
+        if len(blobs) != 2:
+            return Helper.ERROR, b"malformed game command"
+        game_id, argument = [bytes(blob) for blob in blobs]
+        if message_type == Helper.GAME_END:
+            self.games.remove(game_id)
+            return Helper.GAME_END, b''
+
+        game = self.games.get(game_id)
+        if game is None:
+            return Helper.ERROR, Helper.UNKNOWN_GAME
+
+        if message_type == Helper.GAME_STEP and not gol_methods.generations_allowed((len(game.packed), game.cols),
+                                                                                    generations):
+            return Helper.ERROR, "at most {} generations per step".format(gol_methods.MAX_GENERATIONS).encode()
+
+        with game.lock:
+            if message_type == Helper.GAME_STEP:
+                with metrics.timer("server_evaluate"):
+                    game.packed = gol_methods.advance_packed(game.packed, game.cols, generations)
+                game.generation += generations
+            elif message_type == Helper.GAME_EDIT:
+                try:
+                    game.edit(np.frombuffer(argument, dtype='<i4').reshape(-1, 3))
+                except ValueError as error:
+                    return Helper.ERROR, str(error).encode()
+            return Helper.PLAIN_GRID, game.grid()
+
+    def compression_request(self, payload, session):
+        '''
+        Encodes the grids of the rest of the session with a GridCodec if the client asks for its format
+        :param payload: GridCodec.FORMAT of the client
+        :param session: state of the client session
+        :return: reply message type and the accepted format
+        '''
+
+        if bytes(payload) != GridCodec.FORMAT:
+            return Helper.ERROR, b"unsupported grid format"
+        session["codec"] = GridCodec()
+        return Helper.COMPRESSION, GridCodec.FORMAT
+
+    @staticmethod
+    def close_session(session):
+        '''
+        Releases the resources of a client session, i.e. its shared grid
+        '''
+
+        shared_grid = session.pop("shared_grid", None)
+        if shared_grid is not None:
+            shared_grid.close()
+
+    def homomorphic_keys_request(self, payload):
+        '''
+        Stores the encryption parameters and keys of a client, so that following encrypted grids
+        only need to carry the key id instead of the (large) keys
+        :param payload: packed blobs of the grid dimension, the encryption parameters, the galois keys
+                        and the evaluation keys, where the keys are empty if not used
+        :return: reply message type and key id, or an error if the keys are malformed
+        '''
+
+        # the SEAL wrapper raises RuntimeError on data it can not load
+        try:
+            dimension, parms_bytes, galois_keys_bytes, evaluation_keys_bytes = Helper.unpack_blobs(payload)
+
+            parms = EncryptionParameters()
+            parms.load_bytes(parms_bytes)
+            context = SEALContext(parms)
+
+            galois_keys = None
+            evaluation_keys = None
+            if len(galois_keys_bytes) and len(evaluation_keys_bytes):
+                galois_keys = GaloisKeys()
+                galois_keys.load_bytes(galois_keys_bytes)
+                evaluation_keys = EvaluationKeys()
+                evaluation_keys.load_bytes(evaluation_keys_bytes)
+
+            homomorphic_evaluator = HomomorphicEvaluator(context, int(bytes(dimension)), galois_keys, evaluation_keys)
+        except (struct.error, ValueError, RuntimeError) as error:
+            return Helper.ERROR, "invalid homomorphic keys: {}".format(error).encode()
+
+        key_id = hashlib.sha256(payload).hexdigest().encode()
+        with self.homomorphic_evaluators_lock:
+            self.homomorphic_evaluators[key_id] = homomorphic_evaluator
+            self.homomorphic_evaluators.move_to_end(key_id)
+            while len(self.homomorphic_evaluators) > self.MAX_EVALUATORS:
+                evicted_id, _ = self.homomorphic_evaluators.popitem(last=False)
+                log.info("[SERVER] Homomorphic keys %s evicted", evicted_id.decode())
+        log.info("[SERVER] Homomorphic keys registered with id %s", key_id.decode())
+
+        return Helper.HE_KEYS_ACCEPTED, key_id
+
+    def homomorphic_grid_request(self, payload):
+        '''
+        Computes the encrypted next generation of an encrypted grid
+        :param payload: packed blobs of the key id, the packed ciphertexts of the old grid and
+                        the packed ciphertexts of the live neighbours grid (empty for server side rules)
+        :return: reply message type and packed ciphertexts of the new grid, or an error if the key id is unknown
+                 (e.g. because the evaluator was evicted) or the grid is malformed
+        '''
+
+        try:
+            key_id, old_grid_bytes, live_neighbours_grid_bytes = Helper.unpack_blobs(payload)
+        except (struct.error, ValueError):
+            return Helper.ERROR, b"malformed encrypted grid"
+
+        with self.homomorphic_evaluators_lock:
+            homomorphic_evaluator = self.homomorphic_evaluators.get(bytes(key_id))
+            if homomorphic_evaluator is None:
+                return Helper.ERROR, Helper.UNKNOWN_KEY_ID
+            self.homomorphic_evaluators.move_to_end(bytes(key_id))
+
+        # the SEAL wrapper raises RuntimeError on data it can not load, missing ciphertexts raise IndexError
+        try:
+            encrypted_old_grid = self.load_ciphertexts(old_grid_bytes)
+            encrypted_live_neighbours_grid = self.load_ciphertexts(live_neighbours_grid_bytes) or None
+
+            with metrics.timer("server_evaluate"):
+                encrypted_new_grid = homomorphic_evaluator.evaluate(encrypted_old_grid, encrypted_live_neighbours_grid)
+        except (struct.error, ValueError, IndexError, RuntimeError) as error:
+            return Helper.ERROR, "invalid encrypted grid: {}".format(error).encode()
+        log.info("[SERVER] New encrypted Grid State computed")
+
+        return Helper.HE_GRID, Helper.pack_blobs([encrypted.save_bytes() for encrypted in encrypted_new_grid])
+
+    @staticmethod
+    def load_ciphertexts(payload):
+        '''
+        Deserializes a list of ciphertexts packed by Helper.pack_blobs
         '''
-        Thread starts when a client dials in
+
+        ciphertexts = []
+        for blob in Helper.unpack_blobs(payload):
+            encrypted = Ciphertext()
+            encrypted.load_bytes(blob)
+            ciphertexts.append(encrypted)
+        return ciphertexts
+
+    @staticmethod
+    def step_engine(engine, detector):
+        '''
+        Steps the engine of a run by one generation and records the generation in the cycle detector
+        :return: the period if the board just turned out to be periodic, None otherwise
+        '''
+
+        with metrics.timer("server_evaluate"):
+            engine.step()
+        return detector.record(engine.grid)
+
+    @staticmethod
+    def run_grid(engine, detector):
+        '''
+        Returns the current generation of a run, from the memo of the cycle detector once the board is periodic
+        '''
+
+        if detector.cycle is not None:
+            return detector.grid()
+        return engine.current_grid()
+
+    def run_request(self, conn, payload, session):
+        '''
+        Advances a grid by a number of generations, or until the client sends STOP, and streams every
+        frame_interval-th generation and the last generation back as FRAME messages, followed by RUN_DONE.
+        Streaming blocks while the client does not keep up, which throttles the run to the client's rate.
+        Once the board is a still life or an oscillator, the client is sent its period and the generations
+        are served from the memo of a cycle detector instead of being computed.
+        :param conn: Connection
+        :param payload: run parameters, the start grid follows as PLAIN_GRID message
+        :param session: state of the client session
+        :return:
+        '''
+
+        codec = session.get("codec")
+        generations, frame_interval = Helper.RUN_PARAMETERS.unpack(payload)
+        frame_interval = max(frame_interval, 1)
+        message_type, grid, _ = Helper.receive_message(conn, codec)
+        if message_type != Helper.PLAIN_GRID or not isinstance(grid, np.ndarray):
+            raise RuntimeError("RUN has to be followed by a grid")
+        log.info("[SERVER] Run of %s generations started", generations or "unlimited")
+
+        # over many generations only the active regions of the board are recomputed
+        engine = ActiveEngine(grid, update_grid=gol_methods.next_generation)
+        detector = CycleDetector()
+        detector.record(engine.grid)
+        generation = 0
+        while generations == 0 or generation < generations:
+            # a STOP of the client is waiting in the socket
+            readable, _, _ = select.select([conn], [], [], 0)
+            if readable:
+                message_type, _, _ = Helper.receive_message(conn, codec)
+                if message_type != Helper.STOP:
+                    raise RuntimeError("only STOP is allowed during a run")
+                break
+
+            if not detector.advance():
+                period = self.step_engine(engine, detector)
+                if period is not None:
+                    log.info("[SERVER] Period %d detected after %d generations", period, generation + 1)
+                    Helper.send_message(conn, Helper.PERIOD, b'', period)
+            generation += 1
+            if generation % frame_interval == 0:
+                Helper.send_message(conn, Helper.FRAME, self.run_grid(engine, detector), generation, codec)
+
+        # the client always receives the last computed generation
+        if generation % frame_interval:
+            Helper.send_message(conn, Helper.FRAME, self.run_grid(engine, detector), generation, codec)
+        Helper.send_message(conn, Helper.RUN_DONE, b'', generation)
+        log.info("[SERVER] Run ended after %d generations", generation)
+
+    def handle_message(self, message_type, payload, generation=0, session=None):
+        '''
+        Dispatches a request of the client by its message type
+        :param session: dictionary with the state of the client session, e.g. its shared grid
+        :return: reply message type and reply payload
+        '''
+
+        if message_type == Helper.PLAIN_GRID:
+            return self.plain_grid_request(payload)
+        elif message_type == Helper.ADVANCE:
+            return self.advance_request(payload, generation)
+        elif message_type == Helper.HE_KEYS:
+            return self.homomorphic_keys_request(payload)
+        elif message_type == Helper.HE_GRID:
+            return self.homomorphic_grid_request(payload)
+        elif message_type == Helper.SHM_ATTACH and session is not None:
+            return self.shared_attach_request(payload, session)
+        elif message_type == Helper.SHM_STEP and session is not None:
+            return self.shared_step_request(payload, session)
+        elif message_type == Helper.COMPRESSION and session is not None:
+            return self.compression_request(payload, session)
+        elif message_type == Helper.GAME_CREATE:
+            return self.game_create_request(payload)
+        elif message_type in (Helper.GAME_STEP, Helper.GAME_EDIT, Helper.GAME_FETCH, Helper.GAME_END):
+            return self.game_request(message_type, payload, generation)
+        return Helper.ERROR, "unknown message type {}".format(message_type).encode()
+
+    def client_thread(self,conn, ip, port):
+        '''
+        Thread starts when a client dials in and serves all requests of this client session
+        until the client closes the connection
         :param conn: Connection
         :param ip: Ip adress of client
         :param port: Port
-        :param MAX_BUFFER_SIZE: maximum byte size of a processed message until exception is thrown
         :return:
         '''
-        print("[SERVER] Server Thread started")
+        log.info("[SERVER] Server Thread started")
 
-        # sockets don't know if the whole msg has been transmitted, hence check for fixed msg size
-        # msg size depends on the board size, byte size of 100x100 grid is 40113; Byte size of 15x15 grid is 1013
-        MESSAGE_SIZE = 1061 # This is hard coded for our demo purpose
-        input_from_client_bytes = Helper.receive_complete_bytestream(conn, MESSAGE_SIZE, MAX_BUFFER_SIZE)
-    
-        print("[SERVER] Input from client received competely")
-        print(input_from_client_bytes)
-
-        # MAX_BUFFER_SIZE is how big the message can be
-        # this is test if it's sufficiently big
-        siz = sys.getsizeof(input_from_client_bytes)
-        print("[SERVER] Size of whole received package is ", siz)
-        if  siz >= MAX_BUFFER_SIZE:
-            print("[SERVER] The length of input is probably too long: {}".format(siz))
-    
-        # deserialize input as it is a pickled np array
+        session = {}
         try:
-            input_from_client = np.load(BytesIO(input_from_client_bytes))
-            print("[SERVER] Message deserialized")
-        except ValueError:
-            print("[SERVER] Value error occured")
-    
-        print("[SERVER] Grid received \n",input_from_client)
-    
-        # update the grid by calling the method from gol_methods
-        old_grid = input_from_client
-        new_grid = gol_methods.update_grid(old_grid)
-
-        #serialize reply
-        with BytesIO() as b:
-            np.save(b, new_grid)
-            new_grid_serialized = b.getvalue()
-
-        #send reply
-        out = new_grid_serialized
-        conn.sendall(out)  # send it to client
-        conn.close()  # close connection
-        print('Connection ' + ip + ':' + port + " ended")
-    
+            while True:
+                # messages are framed with their type and length, hence we know when the whole msg has been transmitted
+                message_type, payload, generation = Helper.receive_message(conn, session.get("codec"))
+                if message_type is None:
+                    break # client ended the session
+                log.info("[SERVER] Input from client received competely")
+
+                # runs stream their own replies, a STOP after the end of a run is ignored
+                if message_type == Helper.RUN:
+                    self.run_request(conn, payload, session)
+                    continue
+                if message_type == Helper.STOP:
+                    continue
+
+                #send reply
+                reply_type, reply = self.handle_message(message_type, payload, generation, session)
+                Helper.send_message(conn, reply_type, reply, codec=session.get("codec"))  # send it to client
+        except (OSError, RuntimeError):
+            log.exception("[SERVER] Connection %s:%s broken", ip, port)
+        except Exception:
+            # a failing request ends its session, but never the server
+            log.exception("[SERVER] Request of %s:%s failed", ip, port)
+        finally:
+            self.close_session(session)
+            conn.close()  # close connection
+        log.info("[SERVER] Connection %s:%s ended", ip, port)
+
     def start_server(self):
         '''
         Starts the server and license at the port, starts thread if a client connects
@@ -142,7 +560,7 @@ class Server:
         server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         # this is for easy starting/killing the app
         server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-        print('[SERVER] Socket created')
+        log.info('[SERVER] Socket created')
     
         #Specify server adress
         server_adress ="127.0.0.1"
@@ -150,32 +568,35 @@ class Server:
     
         try:
             server_socket.bind((server_adress, port))
-            print('[SERVER] Socket bind complete')
+            log.info('[SERVER] Socket bind complete')
         except socket.error as msg:
-            print('[SERVER] Bind failed. Error : ' + str(sys.exc_info()))
+            log.exception('[SERVER] Bind failed')
             sys.exit()
     
         #Start listening on socket
         server_socket.listen(10)
-        print('[SERVER] Socket now listening 127.0.0.1:12345')
+        log.info('[SERVER] Socket now listening %s:%d', server_adress, port)
     
         # for handling task in separate jobs we need threading
         # this will make an infinite loop needed for 
         # not resetting server for every client
         while True:
             conn, addr = server_socket.accept()
+            # sessions exchange many small request / reply messages
+            conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
             ip, port = str(addr[0]), str(addr[1])
-            print('[SERVER] Accepting connection from ' + ip + ':' + port)
+            log.info('[SERVER] Accepting connection from %s:%s', ip, port)
             try:
-                Thread(target=self.client_thread, args=(conn, ip, port)).start()
+                # one worker thread per client session
+                Thread(target=self.client_thread, args=(conn, ip, port), daemon=True).start()
             except:
-                print("[SERVER] Terible error!")
-                traceback.print_exc()
+                log.exception("[SERVER] Terible error!")
         server_socket.close()
 
 
 # --------------------- START MAIN -------------------------
 if __name__== '__main__':
     print(strftime("%Y-%m-%d %H:%M:%S", gmtime()))
+    configure()
     server = Server()
     server.start_server()
\ No newline at end of file
@@ -4,81 +4,88 @@
 '''
 
 import threading
-import time
-from seal import Evaluator, Ciphertext
+import queue
+from concurrent.futures import Future
+from GameOfLife.homomorphic_rules import HomomorphicEvaluator
+from GameOfLife.instrumentation import log, metrics
 
 class Threaded_server(threading.Thread):
     '''
-    This class simulates a server as a thread. The thread waits for a incoming message in
-    the queue from client, computes the state of the new grid encryptedly and sends
-    the new encrypted grid to the client by another queue
+    This class simulates a server as a thread. The thread blocks until a request of the client
+    arrives in its queue, computes the state of the new grid encryptedly and hands the new
+    encrypted grid to the client by resolving the future of the request
     '''
 
-    def __init__(self, N, server_to_client_queue, client_to_server_queue, encryptionContext ):
+    def __init__(self, N, encryptionContext, galois_keys=None, evaluation_keys=None, threads=1):
 
         self.N = N #assign gridsize
-        self.client_to_server_queue = client_to_server_queue # create the queue
-        self.server_to_client_queue = server_to_client_queue
+        # requests of the client with the futures of their replies, None stops the server
+        self.client_to_server_queue = queue.Queue()
         self.encryptionContext = encryptionContext # type: SEALContext(parms)
-        self.running = 1
-        #delay for the periodic calls
-        self.delay =0.001
+        # one evaluator for the whole life of the server, with more than one thread the cells
+        # or batches are evaluated in parallel
+        self.homomorphic_evaluator = HomomorphicEvaluator(encryptionContext, N, galois_keys, evaluation_keys, threads)
         threading.Thread.__init__(self)
 
     def run(self):
         '''
-        Start threads and calls periodic Calls
+        Start threads and serves the requests of the client until stop is called
         :return:
         '''
 
-        print("[SERVER SIMULATION] Threaded Server Run")
-        self.periodicCall()
+        log.info("[SERVER SIMULATION] Threaded Server Run")
+        while True:
+            # blocks until the client sends a request
+            request = self.client_to_server_queue.get()
+            if request is None:
+                break
+            self.processMessage(*request)
+        log.info("[SERVER SIMULATION] Threaded Server stopped")
 
-    def periodicCall(self):
+    def submit(self, message):
         '''
-        Checks every 1 ms if a message is in the queue.
-        If a messafe is in the queue process it.
-        :return:
+        Hands a message of the client over to the server
+        :param message: dictionary with the encrypted old grid and, unless the rules are evaluated by the
+                        server, the encrypted live neighbours grid
+        :return: Future of the new encrypted grid
         '''
 
-        print("[SERVER SIMULATION] Start periodic call")
-        while self.running:
-            if self.client_to_server_queue.qsize():
-                print("[SERVER SIMULATION] Simulated Thread Server running")
-                self.processMessage()
-            else:
-                #print("[SERVER] Server thread sleeps 1 ms")
-                time.sleep(self.delay)
-
+        future = Future()
+        self.client_to_server_queue.put((message, future))
+        return future
 
-    def processMessage(self):
+    def stop(self):
         '''
-        Fetches a message from the queue and computes encrypted operations to get the generation / new grid state
-        and pushes new encrypted grid state in the queue to the client
+        Stops the server after the requests submitted so far
         :return:
         '''
 
-        print("[SERVER SIMULATION] Start fetching message")
-        # fetch Message from queue, message is a dictionary with structure
-        # {"encrypted_old_grid": encrypted_old_grid, "encrypted_live_neighbours_grid": encrypted_live_neighbours_grid}
-        message_from_client = self.client_to_server_queue.get(0)
-        print("[SERVER SIMULATION] In Queue", message_from_client)
-        encrypted_old_grid = message_from_client["encrypted_old_grid"]
-        encrypted_live_neighbours_grid = message_from_client["encrypted_live_neighbours_grid"]
-
-        # Pyseal Evaluator
-        evaluator = Evaluator(self.encryptionContext)
-
-        # Computation of new grid
-        encrypted_new_grid = []
-        for i in range(self.N * self.N):
-            encrypted_result = Ciphertext()
-            evaluator.add(encrypted_old_grid[i], encrypted_live_neighbours_grid[i], encrypted_result)
-            encrypted_new_grid.append(encrypted_result)
+        self.client_to_server_queue.put(None)
 
-        print("[SERVER SIMULATION] New Grid Computed")
-        print("[SERVER SIMULATION] Message to client ", encrypted_new_grid)
-        self.server_to_client_queue.put(encrypted_new_grid)
-        print("[SERVER SIMULATION] Put computed grid into server to client queue")
+    def processMessage(self, message_from_client, future):
+        '''
+        Computes encrypted operations to get the generation / new grid state from a message of the client
+        and resolves the future of the request with the new encrypted grid state
+        :return:
+        '''
 
+        if not future.set_running_or_notify_cancel():
+            return
 
+        # message is a dictionary with structure
+        # {"encrypted_old_grid": encrypted_old_grid, "encrypted_live_neighbours_grid": encrypted_live_neighbours_grid}
+        encrypted_old_grid = message_from_client["encrypted_old_grid"]
+        encrypted_live_neighbours_grid = message_from_client.get("encrypted_live_neighbours_grid")
+        log.info("[SERVER SIMULATION] Message with %d ciphertexts received", len(encrypted_old_grid))
+
+        try:
+            # Computation of new grid
+            with metrics.timer("server_evaluate"):
+                encrypted_new_grid = self.homomorphic_evaluator.evaluate(encrypted_old_grid,
+                                                                         encrypted_live_neighbours_grid)
+        except Exception as error:
+            future.set_exception(error)
+            return
+
+        log.info("[SERVER SIMULATION] New Grid Computed")
+        future.set_result(encrypted_new_grid)
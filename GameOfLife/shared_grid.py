@@ -0,0 +1,104 @@
+'''
+@Author: Patrick Tu & Kathrin Witzlsperger
+
+'''
+
+import os
+import mmap
+import tempfile
+import numpy as np
+from GameOfLife.helper import Helper
+
+
+class SharedGrid:
+    '''
+    Double buffered board in a memory mapped file, through which a client and a server on the same
+    host hand grids over without serializing or copying them through a socket. The client writes the
+    old grid into one buffer, the server maps the same file, reads the old grid from that buffer and
+    writes the new grid into the other one. Only a small notification carrying the index of the buffer
+    crosses the socket. The next generation starts from the buffer the server wrote, which is overwritten
+    by the generation after the next one, so grids handed on by the client are copies of the buffers.
+
+    The file lives in DIRECTORY, on Linux the RAM backed /dev/shm, and is removed by the client as soon
+    as the server mapped it, the mappings stay valid until both sides close them.
+
+    :param shape: shape (rows, columns) of the grids
+    :param dtype: dtype of the grids
+    :param path: path of the file of an existing shared grid to map, a new file is created if None
+    '''
+
+    DIRECTORY = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+    PREFIX = "gameoflife-"
+
+    def __init__(self, shape, dtype, path=None):
+
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(dtype)
+        nbytes = self.dtype.itemsize * self.shape[0] * self.shape[1]
+
+        if path is None:
+            descriptor, self.path = tempfile.mkstemp(prefix=self.PREFIX, dir=self.DIRECTORY)
+            os.ftruncate(descriptor, 2 * nbytes)
+        else:
+            self.path = path
+            # never follow a link out of the directory of the shared grids
+            descriptor = os.open(path, os.O_RDWR | os.O_NOFOLLOW)
+            if os.fstat(descriptor).st_size != 2 * nbytes:
+                os.close(descriptor)
+                raise ValueError("size of the shared grid does not match its dtype and shape")
+        try:
+            self.mmap = mmap.mmap(descriptor, 2 * nbytes)
+        finally:
+            os.close(descriptor)
+
+        self.buffers = [np.frombuffer(self.mmap, dtype=self.dtype, count=nbytes // self.dtype.itemsize,
+                                      offset=i * nbytes).reshape(self.shape) for i in range(2)]
+
+    def describe(self):
+        '''
+        Returns the payload of a SHM_ATTACH message, the packed path, dtype and shape of the shared grid
+        '''
+
+        return Helper.pack_blobs([self.path.encode(), self.dtype.str.encode(), str(self.shape[0]).encode(),
+                                  str(self.shape[1]).encode()])
+
+    @classmethod
+    def attach(cls, payload):
+        '''
+        Maps the shared grid of a client described by a SHM_ATTACH payload. Only files created by
+        SharedGrid are mapped, the server never writes into other files of the host. The payload comes
+        from the peer, its dtype has to be one of Helper.GRID_DTYPES and the grids at most
+        Helper.MAX_PAYLOAD bytes, otherwise ValueError is raised.
+        '''
+
+        path, dtype, rows, cols = [bytes(blob).decode() for blob in Helper.unpack_blobs(payload)]
+        if os.path.dirname(path) != cls.DIRECTORY or not os.path.basename(path).startswith(cls.PREFIX):
+            raise ValueError("not a shared grid: " + path)
+        if dtype not in Helper.GRID_DTYPES:
+            raise ValueError("dtype {} of the shared grid is not accepted".format(dtype))
+        rows, cols = int(rows), int(cols)
+        if rows < 1 or cols < 1 or np.dtype(dtype).itemsize * rows * cols > Helper.MAX_PAYLOAD:
+            raise ValueError("invalid shape {} x {} of the shared grid".format(rows, cols))
+        return cls((rows, cols), dtype, path)
+
+    def unlink(self):
+        '''
+        Removes the file of the shared grid, the mappings stay valid
+        '''
+
+        try:
+            os.unlink(self.path)
+        except FileNotFoundError:
+            pass
+
+    def close(self):
+        '''
+        Unmaps the shared grid, the buffers must not be used anymore
+        '''
+
+        self.buffers = []
+        try:
+            self.mmap.close()
+        except BufferError:
+            # grids handed out are still referenced, the mapping is released together with them
+            pass
@@ -0,0 +1,76 @@
+'''
+@Author: Patrick Tu & Kathrin Witzlsperger
+
+'''
+
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from seal import MemoryPoolHandle
+
+
+class ThreadPool:
+    '''
+    Spreads independent SEAL operations, e.g. the encryption of single cells or batches, over a
+    number of threads. The SEAL wrapper releases the GIL while it encrypts, decrypts or evaluates,
+    so the threads run in parallel. Every thread allocates from its own memory pool, which is only
+    used by this thread and hence needs no locking, instead of contending for the global pool.
+
+    :param threads: number of threads, 1 runs everything in the calling thread with the global pool
+    '''
+
+    # number of chunks per thread the items are split into, to balance uneven chunks
+    CHUNKS_PER_THREAD = 4
+
+    def __init__(self, threads=1):
+
+        self.threads = threads
+        self.executor = ThreadPoolExecutor(threads) if threads > 1 else None
+        self.local = threading.local()
+
+    def memory_pool(self):
+        '''
+        Returns the memory pool of the calling thread
+        '''
+
+        if self.executor is None:
+            return MemoryPoolHandle.acquire_global()
+
+        memory_pool = getattr(self.local, 'memory_pool', None)
+        if memory_pool is None:
+            memory_pool = self.local.memory_pool = MemoryPoolHandle.New(False)
+        return memory_pool
+
+    def map_chunks(self, function, items):
+        '''
+        Splits the items into chunks, which are processed by the threads of the pool, and returns the
+        concatenated lists function(chunk, memory_pool), where memory_pool is the memory pool of the
+        processing thread
+        '''
+
+        items = list(items)
+        if self.executor is None or len(items) < 2:
+            return function(items, self.memory_pool())
+
+        size = -(-len(items) // (self.threads * self.CHUNKS_PER_THREAD))
+        chunks = [items[start:start + size] for start in range(0, len(items), size)]
+
+        results = []
+        for chunk_results in self.executor.map(lambda chunk: function(chunk, self.memory_pool()), chunks):
+            results.extend(chunk_results)
+        return results
+
+    def map(self, function, items):
+        '''
+        Returns [function(item, memory_pool) for item in items], where the items are processed in chunks
+        by the threads of the pool and memory_pool is the memory pool of the processing thread
+        '''
+
+        return self.map_chunks(lambda chunk, memory_pool: [function(item, memory_pool) for item in chunk], items)
+
+    def shutdown(self):
+        '''
+        Stops the threads of the pool
+        '''
+
+        if self.executor is not None:
+            self.executor.shutdown()
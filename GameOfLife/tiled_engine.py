@@ -0,0 +1,229 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+@author: Patrick Tu & Kathrin Witzlsperger
+"""
+
+import threading
+import contextlib
+import multiprocessing
+from collections import OrderedDict
+from multiprocessing.sharedctypes import RawArray
+import numpy as np
+from GameOfLife.engine import Engine
+from GameOfLife.bit_engine import BitEngine
+
+
+class TiledEngine:
+    '''
+    Steps very large boards on all cores. The board lives in two shared memory buffers (current and
+    next generation), which the worker processes of a pool map once at start up. Every generation the
+    board is split into row / column blocks, each worker reads its tile with a one cell halo that wraps
+    around the edges of the board ("toroidal array") and writes the new tile into the other buffer, so
+    the tiles are stitched back without copying them between processes.
+
+    :param shape: shape (rows, columns) of the boards
+    :param processes: number of worker processes, defaults to the number of cores
+    :param tiles: number of row blocks and column blocks, defaults to 4 row bands per process as rows
+                  are contiguous in memory
+    :param start_method: start method of the worker processes, defaults to START_METHOD
+    '''
+
+    # boards with fewer cells are stepped faster by Engine in the calling process
+    MIN_CELLS = 1 << 22
+
+    # the engines are created by the threads of the server, forking there would copy the locks held by the
+    # other threads into the workers, so the workers are started from a clean process
+    START_METHOD = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+
+    # engines shared by all callers of for_shape by shape, least recently used first, at most MAX_ENGINES
+    # are kept to bound the memory and the worker processes
+    MAX_ENGINES = 2
+    shared_engines = OrderedDict()
+    shared_engine_lock = threading.Lock()
+
+    # buffers and shape of the board mapped by a worker process, set by init_worker
+    worker_buffers = None
+    worker_shape = None
+
+    def __init__(self, shape, processes=None, tiles=None, start_method=None):
+
+        self.shape = tuple(shape)
+        rows, cols = self.shape
+        self.processes = processes or multiprocessing.cpu_count()
+
+        if tiles is None:
+            tiles = (4 * self.processes, 1)
+        self.tiles = self.split(self.shape, *tiles)
+
+        # cells are stored as one byte each, current generation and next generation
+        self.buffers = [RawArray('B', rows * cols) for _ in range(2)]
+        self.current = 0
+
+        context = multiprocessing.get_context(start_method or self.START_METHOD)
+        self.pool = context.Pool(self.processes, initializer=TiledEngine.init_worker,
+                                 initargs=(self.buffers, self.shape))
+        # one board at a time is stepped in the shared buffers
+        self.lock = threading.Lock()
+        # callers of for_shape currently using the engine, it is only closed when there are none
+        self.users = 0
+
+    @staticmethod
+    def split(shape, row_blocks, col_blocks):
+        '''
+        Splits a board into at most row_blocks x col_blocks tiles of nearly equal size
+
+        :return: list of tiles (first row, end row, first column, end column)
+        '''
+
+        rows, cols = shape
+        row_bounds = np.linspace(0, rows, min(row_blocks, rows) + 1).astype(int)
+        col_bounds = np.linspace(0, cols, min(col_blocks, cols) + 1).astype(int)
+        return [(int(r0), int(r1), int(c0), int(c1))
+                for r0, r1 in zip(row_bounds[:-1], row_bounds[1:])
+                for c0, c1 in zip(col_bounds[:-1], col_bounds[1:])]
+
+    @staticmethod
+    def init_worker(buffers, shape):
+        '''
+        Maps the shared buffers in a worker process
+        '''
+
+        TiledEngine.worker_buffers = buffers
+        TiledEngine.worker_shape = shape
+
+    @staticmethod
+    def view(buffer, shape):
+        '''
+        Returns a numpy view of a shared buffer
+        '''
+
+        return np.frombuffer(buffer, dtype=np.uint8).reshape(shape)
+
+    @staticmethod
+    def step_tile(task):
+        '''
+        Computes the next generation of one tile in a worker process
+
+        :param task: index of the buffer with the current generation and the tile
+        '''
+
+        source, (r0, r1, c0, c1) = task
+        rows, cols = TiledEngine.worker_shape
+        old_grid = TiledEngine.view(TiledEngine.worker_buffers[source], TiledEngine.worker_shape)
+        new_grid = TiledEngine.view(TiledEngine.worker_buffers[1 - source], TiledEngine.worker_shape)
+
+        # the tile and its halo, the indices wrap around the edges of the board
+        row_index = np.arange(r0 - 1, r1 + 1) % rows
+        if c1 - c0 == cols:
+            # row bands span the whole width, which the bit-packed kernel wraps around by itself
+            packed_band = BitEngine.update_packed(BitEngine.pack(old_grid[row_index]), cols)
+            new_grid[r0:r1] = BitEngine.unpack(packed_band[1:-1], cols)
+            return
+
+        col_index = np.arange(c0 - 1, c1 + 1) % cols
+        padded_tile = old_grid[np.ix_(row_index, col_index)]
+
+        new_grid[r0:r1, c0:c1] = Engine.update_padded_grid(padded_tile)
+
+    def load(self, grid):
+        '''
+        Copies a board into the shared buffer of the current generation
+        '''
+
+        np.copyto(self.view(self.buffers[self.current], self.shape), grid, casting='unsafe')
+
+    def grid(self):
+        '''
+        Returns a copy of the current generation as numpy array of dtype int32
+        '''
+
+        return self.view(self.buffers[self.current], self.shape).astype('i')
+
+    def step(self, generations=1):
+        '''
+        Advances the board in the shared buffers by a number of generations
+        '''
+
+        for _ in range(generations):
+            # the workers only return once all tiles of this generation are written
+            self.pool.map(TiledEngine.step_tile, [(self.current, tile) for tile in self.tiles])
+            self.current = 1 - self.current
+
+    def update_grid(self, old_grid, generations=1):
+        '''
+        Applies Conway's rules to a board on all cores and returns the new grid
+        as a numpy array of dtype int32.
+        '''
+
+        with self.lock:
+            self.load(old_grid)
+            self.step(generations)
+            return self.grid()
+
+    def close(self):
+        '''
+        Stops the worker processes once they finished their tiles
+        '''
+
+        self.pool.close()
+        self.pool.join()
+
+    def __enter__(self):
+
+        return self
+
+    def __exit__(self, *exc_info):
+
+        self.close()
+
+    @staticmethod
+    @contextlib.contextmanager
+    def for_shape(shape):
+        '''
+        Lends the shared engine for boards of the given shape for the duration of a with block. Boards of
+        a shape seen recently reuse the pool of their engine, engines beyond MAX_ENGINES are closed as soon
+        as they are not used anymore
+        '''
+
+        shape = tuple(shape)
+        with TiledEngine.shared_engine_lock:
+            engine = TiledEngine.shared_engines.get(shape)
+            if engine is None:
+                engine = TiledEngine.shared_engines[shape] = TiledEngine(shape)
+            TiledEngine.shared_engines.move_to_end(shape)
+            engine.users += 1
+            TiledEngine.evict_engines()
+        try:
+            yield engine
+        finally:
+            with TiledEngine.shared_engine_lock:
+                engine.users -= 1
+                TiledEngine.evict_engines()
+
+    @staticmethod
+    def evict_engines():
+        '''
+        Closes the least recently used engines beyond MAX_ENGINES which are not in use, called with
+        shared_engine_lock held
+        '''
+
+        for shape, engine in list(TiledEngine.shared_engines.items()):
+            if len(TiledEngine.shared_engines) <= TiledEngine.MAX_ENGINES:
+                break
+            if engine.users == 0:
+                del TiledEngine.shared_engines[shape]
+                engine.close()
+
+    @staticmethod
+    def release(shape):
+        '''
+        Closes the shared engine for boards of the given shape, e.g. when the last game of the shape ended.
+        An engine in use is left to the eviction of for_shape.
+        '''
+
+        with TiledEngine.shared_engine_lock:
+            engine = TiledEngine.shared_engines.get(tuple(shape))
+            if engine is not None and engine.users == 0:
+                del TiledEngine.shared_engines[engine.shape]
+                engine.close()
@@ -0,0 +1,76 @@
+'''
+@Author: Patrick Tu & Kathrin Witzlsperger
+
+'''
+
+import threading
+import queue
+from seal import Ciphertext, Plaintext, MemoryPoolHandle
+
+
+class ZeroPool(threading.Thread):
+    '''
+    Precomputes fresh encryptions of zero in the background, e.g. while the client waits for the
+    server or the GUI renders a generation. Encrypting a value online then only needs the addition
+    of its plaintext onto a pooled zero, which is as secure as a fresh encryption as long as every
+    zero is used only once. If the pool runs empty, the zero is encrypted on demand.
+
+    :param encryptor: Encryptor of the public key
+    :param size: maximum number of zeros kept in the pool
+    '''
+
+    def __init__(self, encryptor, size):
+
+        self.encryptor = encryptor
+        self.zeros = queue.Queue(size)
+        # number of zeros that had to be encrypted on demand because the pool was empty
+        self.misses = 0
+        self.stopped = threading.Event()
+        threading.Thread.__init__(self)
+        self.daemon = True
+
+    def encrypt_zero(self, memory_pool):
+        '''
+        Returns a fresh encryption of zero
+        '''
+
+        encrypted = Ciphertext()
+        self.encryptor.encrypt(Plaintext(), encrypted, memory_pool)
+        return encrypted
+
+    def run(self):
+        '''
+        Keeps the pool filled until stop is called
+        '''
+
+        # the temporaries of the encryptions come from a pool only used by this thread
+        memory_pool = MemoryPoolHandle.New(False)
+        while not self.stopped.is_set():
+            encrypted = self.encrypt_zero(memory_pool)
+            # blocks while the pool is full, but still notices stop
+            while not self.stopped.is_set():
+                try:
+                    self.zeros.put(encrypted, timeout=0.1)
+                    break
+                except queue.Full:
+                    pass
+
+    def take(self, memory_pool):
+        '''
+        Returns an encryption of zero which was not handed out before, from the pool if possible
+
+        :param memory_pool: memory pool used if the zero has to be encrypted on demand
+        '''
+
+        try:
+            return self.zeros.get_nowait()
+        except queue.Empty:
+            self.misses += 1
+            return self.encrypt_zero(memory_pool)
+
+    def stop(self):
+        '''
+        Stops filling the pool
+        '''
+
+        self.stopped.set()
@@ -17,6 +17,10 @@
 #include "seal/publickey.h"
 #include "seal/secretkey.h"
 #include "seal/polycrt.h"
+#include "seal/galoiskeys.h"
+#include "seal/evaluationkeys.h"
+#include <sstream>
+#include <streambuf>
 
 namespace py = pybind11;
 
@@ -24,6 +28,76 @@ using namespace pybind11::literals;
 using namespace seal;
 using namespace std;
 
+// Releases the GIL while SEAL encrypts, decrypts or evaluates, so that Python threads using
+// separate objects or thread-local memory pools run in parallel
+using release_gil = py::call_guard<py::gil_scoped_release>;
+
+// Read-only stream buffer over the memory of a Python buffer object, so that loading
+// from bytes, bytearray or memoryview objects does not need to copy the data first
+struct BufferStreambuf : public std::streambuf
+{
+  BufferStreambuf(char *data, std::size_t size)
+  {
+    setg(data, data, data + size);
+  }
+};
+
+// Saves a SEAL object in its binary format to a Python bytes object
+template <class T>
+py::bytes save_bytes(const T &object)
+{
+  std::ostringstream stream(std::ios::binary);
+  object.save(stream);
+  return py::bytes(stream.str());
+}
+
+// Loads a SEAL object from any Python object supporting the buffer protocol
+template <class T>
+void load_bytes(T &object, py::buffer buffer)
+{
+  py::buffer_info info = buffer.request();
+  BufferStreambuf streambuf(static_cast<char *>(info.ptr), info.size * info.itemsize);
+  std::istream stream(&streambuf);
+  stream.exceptions(std::ios::failbit | std::ios::badbit);
+  object.load(stream);
+}
+
+// Adds two lists of ciphertexts elementwise in one call. The ciphertexts are referenced, not
+// copied, and the GIL is released while the additions run
+py::list add_elementwise(Evaluator &evaluator, py::list encrypteds1, py::list encrypteds2)
+{
+  if (encrypteds1.size() != encrypteds2.size())
+  {
+    throw std::invalid_argument("lists of ciphertexts differ in length");
+  }
+
+  std::vector<const Ciphertext *> operands1, operands2;
+  for (auto item : encrypteds1)
+  {
+    operands1.push_back(&item.cast<const Ciphertext &>());
+  }
+  for (auto item : encrypteds2)
+  {
+    operands2.push_back(&item.cast<const Ciphertext &>());
+  }
+
+  std::vector<Ciphertext> results(operands1.size());
+  {
+    py::gil_scoped_release release;
+    for (std::size_t i = 0; i < results.size(); i++)
+    {
+      evaluator.add(*operands1[i], *operands2[i], results[i]);
+    }
+  }
+
+  py::list destination;
+  for (auto &result : results)
+  {
+    destination.append(py::cast(std::move(result)));
+  }
+  return destination;
+}
+
 // http://pybind11.readthedocs.io/en/stable/classes.html
 
 PYBIND11_MODULE(seal, m) {
@@ -146,6 +220,12 @@ PYBIND11_MODULE(seal, m) {
     .def("set_fresh", (void (ChooserPoly::*)()) &ChooserPoly::set_fresh,
         "Sets the operation history to that of a freshly encrypted ciphertext");
 
+  py::class_<Simulation>(m, "Simulation")
+    .def("invariant_noise_budget", &Simulation::invariant_noise_budget,
+        "Returns the invariant noise budget that is being simulated")
+    .def("decrypts", &Simulation::decrypts, py::arg("budget_gap")=0,
+        "Returns true if the simulated ciphertext still decrypts with the given noise budget to spare");
+
   py::class_<Ciphertext>(m, "Ciphertext")
     .def(py::init<>())
     .def(py::init<const Ciphertext &>())
@@ -160,19 +240,21 @@ PYBIND11_MODULE(seal, m) {
         "Allocates enough memory to accommodate the backing array of a ciphertext with given capacity")
     .def("reserve", (void (Ciphertext::*)(const EncryptionParameters &, int, const MemoryPoolHandle &)) &Ciphertext::reserve,
         "Allocates enough memory to accommodate the backing array of a ciphertext with given capacity")
-    .def("size", &Ciphertext::size, "Returns the capacity of the allocation");
+    .def("size", &Ciphertext::size, "Returns the capacity of the allocation")
+    .def("save_bytes", &save_bytes<Ciphertext>, "Saves the Ciphertext to a bytes object")
+    .def("load_bytes", &load_bytes<Ciphertext>, "Loads the Ciphertext from a bytes-like object");
 
   py::class_<Decryptor>(m, "Decryptor")
     .def(py::init<const SEALContext &, const SecretKey &>())
     .def(py::init<const SEALContext &, const SecretKey &, const MemoryPoolHandle &>())
     .def("decrypt", (void (Decryptor::*)(const Ciphertext &, Plaintext &, const MemoryPoolHandle &)) &Decryptor::decrypt,
-        "Decrypts a ciphertext and writes the result to a given destination.")
+        "Decrypts a ciphertext and writes the result to a given destination.", release_gil())
     .def("decrypt", (void (Decryptor::*)(const Ciphertext &, Plaintext &)) &Decryptor::decrypt,
-        "Decrypts a ciphertext and writes the result to a given destination.")
+        "Decrypts a ciphertext and writes the result to a given destination.", release_gil())
     .def("invariant_noise_budget", (int (Decryptor::*)(const Ciphertext &))
-        &Decryptor::invariant_noise_budget, "Returns noise budget")
+        &Decryptor::invariant_noise_budget, "Returns noise budget", release_gil())
     .def("invariant_noise_budget", (int (Decryptor::*)(const Ciphertext &, const MemoryPoolHandle &))
-        &Decryptor::invariant_noise_budget, "Returns noise budget");
+        &Decryptor::invariant_noise_budget, "Returns noise budget", release_gil());
 
   py::class_<Encryptor>(m, "Encryptor")
     .def(py::init<const SEALContext &, const PublicKey &>())
@@ -181,9 +263,9 @@ PYBIND11_MODULE(seal, m) {
     .def(py::init<Encryptor &>())
     .def("encrypt", (void (Encryptor::*)(const Plaintext &, Ciphertext &,
         const MemoryPoolHandle &)) &Encryptor::encrypt,
-        "Encrypts a plaintext and writes the result to a given destination")
+        "Encrypts a plaintext and writes the result to a given destination", release_gil())
     .def("encrypt", (void (Encryptor::*)(const Plaintext &, Ciphertext &)) &Encryptor::encrypt,
-        "Encrypts a plaintext and writes the result to a given destination");
+        "Encrypts a plaintext and writes the result to a given destination", release_gil());
 
   py::class_<EncryptionParameters>(m, "EncryptionParameters")
     .def(py::init<>())
@@ -204,121 +286,127 @@ PYBIND11_MODULE(seal, m) {
         "Set polynomial modulus parameter")
     .def("set_poly_modulus",
         (void (EncryptionParameters::*)(const std::string &)) &EncryptionParameters::set_poly_modulus,
-        "Set polynomial modulus parameter");
+        "Set polynomial modulus parameter")
+    .def("save_bytes", &save_bytes<EncryptionParameters>, "Saves the EncryptionParameters to a bytes object")
+    .def("load_bytes", &load_bytes<EncryptionParameters>, "Loads the EncryptionParameters from a bytes-like object");
 
   py::class_<EncryptionParameterQualifiers>(m, "EncryptionParameterQuailifers");
 
   py::class_<EvaluationKeys>(m, "EvaluationKeys")
     .def(py::init<>())
-    .def("decomposition_bit_count", &EvaluationKeys::decomposition_bit_count, "Returns the decomposition bit count");
+    .def("decomposition_bit_count", &EvaluationKeys::decomposition_bit_count, "Returns the decomposition bit count")
+    .def("save_bytes", &save_bytes<EvaluationKeys>, "Saves the EvaluationKeys to a bytes object")
+    .def("load_bytes", &load_bytes<EvaluationKeys>, "Loads the EvaluationKeys from a bytes-like object");
 
   py::class_<Evaluator>(m, "Evaluator")
     .def(py::init<const SEALContext &>())
     .def(py::init<const SEALContext &, const MemoryPoolHandle &>())
     .def("square", (void (Evaluator::*)(Ciphertext &)) &Evaluator::square,
-        "Squares a ciphertext")
+        "Squares a ciphertext", release_gil())
     .def("square", (void (Evaluator::*)(Ciphertext &, const MemoryPoolHandle &)) &Evaluator::square,
-        "Squares a ciphertext")
+        "Squares a ciphertext", release_gil())
     .def("add_many", (void (Evaluator::*)(const std::vector<Ciphertext> &, Ciphertext &)) &Evaluator::add_many,
-        "Adds together a vector of ciphertexts and stores the result in the destination parameter.")
+        "Adds together a vector of ciphertexts and stores the result in the destination parameter.", release_gil())
     .def("add_plain", (void (Evaluator::*)(Ciphertext &, const Plaintext &)) &Evaluator::add_plain,
-        "Adds a ciphertext and a plaintext.")
+        "Adds a ciphertext and a plaintext.", release_gil())
     .def("add_plain", (void (Evaluator::*)(const Ciphertext &, const Plaintext &, Ciphertext &))
-        &Evaluator::add_plain, "Adds a ciphertext and a plaintext.")
+        &Evaluator::add_plain, "Adds a ciphertext and a plaintext.", release_gil())
     .def("sub_plain", (void (Evaluator::*)(Ciphertext &, const Plaintext &))
-        &Evaluator::sub_plain, "Subtracts a plaintext from a ciphertext.")
+        &Evaluator::sub_plain, "Subtracts a plaintext from a ciphertext.", release_gil())
     .def("sub_plain", (void (Evaluator::*)(const Ciphertext &, const Plaintext &, Ciphertext &))
-        &Evaluator::sub_plain, "Subtracts a plaintext from a ciphertext.")
+        &Evaluator::sub_plain, "Subtracts a plaintext from a ciphertext.", release_gil())
     .def("multiply_plain", (void (Evaluator::*)(Ciphertext &, const Plaintext &, const MemoryPoolHandle &))
-        &Evaluator::multiply_plain, "Multiplies a ciphertext and a plaintext.")
+        &Evaluator::multiply_plain, "Multiplies a ciphertext and a plaintext.", release_gil())
     .def("multiply_plain", (void (Evaluator::*)(Ciphertext &, const Plaintext &))
-        &Evaluator::multiply_plain, "Multiplies a ciphertext and a plaintext.")
+        &Evaluator::multiply_plain, "Multiplies a ciphertext and a plaintext.", release_gil())
     .def("multiply_plain", (void (Evaluator::*)(const Ciphertext &, const Plaintext &, Ciphertext &, const MemoryPoolHandle &))
-        &Evaluator::multiply_plain, "Multiplies a ciphertext and a plaintext.")
+        &Evaluator::multiply_plain, "Multiplies a ciphertext and a plaintext.", release_gil())
     .def("multiply_plain", (void (Evaluator::*)(const Ciphertext &, const Plaintext &, Ciphertext &))
-        &Evaluator::multiply_plain, "Multiplies a ciphertext and a plaintext.")
+        &Evaluator::multiply_plain, "Multiplies a ciphertext and a plaintext.", release_gil())
     .def("exponentiate", (void (Evaluator::*)(Ciphertext &, std::uint64_t,
         const EvaluationKeys &, const MemoryPoolHandle &))
-        &Evaluator::exponentiate, "Exponentiates a ciphertext.")
+        &Evaluator::exponentiate, "Exponentiates a ciphertext.", release_gil())
     .def("exponentiate", (void (Evaluator::*)(Ciphertext &, std::uint64_t,
         const EvaluationKeys &))
-        &Evaluator::exponentiate, "Exponentiates a ciphertext.")
+        &Evaluator::exponentiate, "Exponentiates a ciphertext.", release_gil())
     .def("exponentiate", (void (Evaluator::*)(const Ciphertext &, std::uint64_t,
         const EvaluationKeys &, Ciphertext &, const MemoryPoolHandle &))
-        &Evaluator::exponentiate, "Exponentiates a ciphertext.")
+        &Evaluator::exponentiate, "Exponentiates a ciphertext.", release_gil())
     .def("exponentiate", (void (Evaluator::*)(const Ciphertext &, std::uint64_t,
         const EvaluationKeys &, Ciphertext &))
-        &Evaluator::exponentiate, "Exponentiates a ciphertext.")
+        &Evaluator::exponentiate, "Exponentiates a ciphertext.", release_gil())
     .def("negate", (void (Evaluator::*)(Ciphertext &)) &Evaluator::negate,
-        "Negates a ciphertext")
+        "Negates a ciphertext", release_gil())
     .def("negate", (void (Evaluator::*)(const Ciphertext &, Ciphertext &)) &Evaluator::negate,
-        "Negates a ciphertext and writes to a given destination")
+        "Negates a ciphertext and writes to a given destination", release_gil())
     .def("add", (void (Evaluator::*)(const Ciphertext &, const Ciphertext &,
         Ciphertext &)) &Evaluator::add,
-        "Adds two ciphertexts and writes to a given destination")
+        "Adds two ciphertexts and writes to a given destination", release_gil())
     .def("add", (void (Evaluator::*)(Ciphertext &, const Ciphertext &)) &Evaluator::add,
-        "Adds two ciphertexts and writes output over the first ciphertext")
+        "Adds two ciphertexts and writes output over the first ciphertext", release_gil())
+    .def("add_elementwise", &add_elementwise,
+        "Adds two lists of ciphertexts elementwise and returns the list of sums")
     .def("sub", (void (Evaluator::*)(Ciphertext &, const Ciphertext &)) &Evaluator::sub,
-        "Subtracts two ciphertexts and writes output over the first ciphertext")
+        "Subtracts two ciphertexts and writes output over the first ciphertext", release_gil())
     .def("sub", (void (Evaluator::*)(const Ciphertext &, const Ciphertext &,
         Ciphertext &)) &Evaluator::sub,
-        "Subtracts two ciphertexts and writes to a given destination")
+        "Subtracts two ciphertexts and writes to a given destination", release_gil())
     .def("multiply", (void (Evaluator::*)(Ciphertext &, const Ciphertext &,
         const MemoryPoolHandle &)) &Evaluator::multiply,
-        "Multiplies two ciphertexts and writes output over the first ciphertext")
+        "Multiplies two ciphertexts and writes output over the first ciphertext", release_gil())
     .def("multiply", (void (Evaluator::*)(Ciphertext &, const Ciphertext &)) &Evaluator::multiply,
-        "Multiplies two ciphertexts and writes output over the first ciphertext")
+        "Multiplies two ciphertexts and writes output over the first ciphertext", release_gil())
     .def("multiply", (void (Evaluator::*)(const Ciphertext &, const Ciphertext &,
         Ciphertext &, const MemoryPoolHandle &)) &Evaluator::multiply,
-        "Multiplies two ciphertexts and writes to a given destination")
+        "Multiplies two ciphertexts and writes to a given destination", release_gil())
     .def("multiply", (void (Evaluator::*)(const Ciphertext &, const Ciphertext &,
         Ciphertext &)) &Evaluator::multiply,
-        "Multiplies two ciphertexts and writes to a given destination")
+        "Multiplies two ciphertexts and writes to a given destination", release_gil())
     .def("multiply_plain", (void (Evaluator::*)(Ciphertext &, const Plaintext &,
         const MemoryPoolHandle &)) &Evaluator::multiply_plain,
-        "Multiplies a ciphertext with a plaintext")
+        "Multiplies a ciphertext with a plaintext", release_gil())
     .def("multiply_plain", (void (Evaluator::*)(Ciphertext &, const Plaintext &))
-        &Evaluator::multiply_plain, "Multiplies a ciphertext with a plaintext")
+        &Evaluator::multiply_plain, "Multiplies a ciphertext with a plaintext", release_gil())
     .def("multiply_plain", (void (Evaluator::*)(const Ciphertext &, const Plaintext &,
         Ciphertext &, const MemoryPoolHandle &)) &Evaluator::multiply_plain,
-        "Multiplies a ciphertext with a plaintext and writes to a given destination")
+        "Multiplies a ciphertext with a plaintext and writes to a given destination", release_gil())
     .def("multiply_plain", (void (Evaluator::*)(const Ciphertext &, const Plaintext &,
         Ciphertext &)) &Evaluator::multiply_plain,
-        "Multiplies a ciphertext with a plaintext and writes to a given destination")
+        "Multiplies a ciphertext with a plaintext and writes to a given destination", release_gil())
     .def("relinearize", (void (Evaluator::*)(Ciphertext &, const EvaluationKeys &,
-        const MemoryPoolHandle &)) &Evaluator::relinearize, "Relinearizes a ciphertext")
+        const MemoryPoolHandle &)) &Evaluator::relinearize, "Relinearizes a ciphertext", release_gil())
     .def("relinearize", (void (Evaluator::*)(Ciphertext &, const EvaluationKeys &))
-        &Evaluator::relinearize, "Relinearizes a ciphertext")
+        &Evaluator::relinearize, "Relinearizes a ciphertext", release_gil())
     .def("relinearize", (void (Evaluator::*)(const Ciphertext &, const EvaluationKeys &,
         Ciphertext &, const MemoryPoolHandle &)) &Evaluator::relinearize,
-        "Relinearizes a ciphertext and writes to a given destination")
+        "Relinearizes a ciphertext and writes to a given destination", release_gil())
     .def("relinearize", (void (Evaluator::*)(const Ciphertext &, const EvaluationKeys &,
         Ciphertext &)) &Evaluator::relinearize,
-        "Relinearizes a ciphertext and writes to a given destination")
+        "Relinearizes a ciphertext and writes to a given destination", release_gil())
     .def("rotate_rows", (void (Evaluator::*)(const Ciphertext &, int,
         const GaloisKeys &, Ciphertext &)) &Evaluator::rotate_rows,
-        "Rotates plaintext matrix rows cyclically")
+        "Rotates plaintext matrix rows cyclically", release_gil())
     .def("rotate_rows", (void (Evaluator::*)(const Ciphertext &, int,
         const GaloisKeys &, Ciphertext &, const MemoryPoolHandle &)) &Evaluator::rotate_rows,
-        "Rotates plaintext matrix rows cyclically")
+        "Rotates plaintext matrix rows cyclically", release_gil())
     .def("rotate_rows", (void (Evaluator::*)(Ciphertext &, int,
         const GaloisKeys &, const MemoryPoolHandle &)) &Evaluator::rotate_rows,
-        "Rotates plaintext matrix rows cyclically")
+        "Rotates plaintext matrix rows cyclically", release_gil())
     .def("rotate_rows", (void (Evaluator::*)(Ciphertext &, int,
         const GaloisKeys &)) &Evaluator::rotate_rows,
-        "Rotates plaintext matrix rows cyclically")
+        "Rotates plaintext matrix rows cyclically", release_gil())
     .def("rotate_columns", (void (Evaluator::*)(Ciphertext &,
         const GaloisKeys &, const MemoryPoolHandle &)) &Evaluator::rotate_columns,
-        "Rotates plaintext matrix rows cyclically")
+        "Rotates plaintext matrix rows cyclically", release_gil())
     .def("rotate_columns", (void (Evaluator::*)(Ciphertext &,
         const GaloisKeys &)) &Evaluator::rotate_columns,
-        "Rotates plaintext matrix rows cyclically")
+        "Rotates plaintext matrix rows cyclically", release_gil())
     .def("rotate_columns", (void (Evaluator::*)(const Ciphertext &, const GaloisKeys &,
         Ciphertext &, const MemoryPoolHandle &)) &Evaluator::rotate_columns,
-        "Rotates plaintext matrix rows cyclically")
+        "Rotates plaintext matrix rows cyclically", release_gil())
     .def("rotate_columns", (void (Evaluator::*)(const Ciphertext &, const GaloisKeys &,
         Ciphertext &)) &Evaluator::rotate_columns,
-        "Rotates plaintext matrix rows cyclically");
+        "Rotates plaintext matrix rows cyclically", release_gil());
 
   py::class_<FractionalEncoder>(m, "FractionalEncoder")
     .def(py::init<const SmallModulus &, const BigPoly &, int, int,
@@ -336,7 +424,9 @@ PYBIND11_MODULE(seal, m) {
 
   py::class_<GaloisKeys>(m, "GaloisKeys")
     .def(py::init<>())
-    .def(py::init<const GaloisKeys &>());
+    .def(py::init<const GaloisKeys &>())
+    .def("save_bytes", &save_bytes<GaloisKeys>, "Saves the GaloisKeys to a bytes object")
+    .def("load_bytes", &load_bytes<GaloisKeys>, "Loads the GaloisKeys from a bytes-like object");
 
   py::class_<IntegerEncoder>(m, "IntegerEncoder")
     .def(py::init<const SmallModulus &, std::uint64_t, const MemoryPoolHandle &>())
@@ -381,8 +471,9 @@ PYBIND11_MODULE(seal, m) {
   py::class_<MemoryPoolHandle>(m, "MemoryPoolHandle")
     .def(py::init<>())
     .def(py::init<const MemoryPoolHandle &>())
-    .def_static("New", &MemoryPoolHandle::New,
-               "Returns a MemoryPoolHandle pointing to a new memory pool")
+    .def_static("New", &MemoryPoolHandle::New, py::arg("thread_safe") = true,
+               "Returns a MemoryPoolHandle pointing to a new memory pool, a pool which is only used by one "
+               "thread does not need to be thread safe")
     .def_static("acquire_global", &MemoryPoolHandle::Global,
                "Returns a MemoryPoolHandle pointing to the global memory pool");
 
@@ -437,10 +528,14 @@ PYBIND11_MODULE(seal, m) {
         &PolyCRTBuilder::decompose, "Inverse of compose. This function unbatches a given SEAL plaintext");
 
   py::class_<PublicKey>(m, "PublicKey")
-     .def(py::init<>());
+     .def(py::init<>())
+     .def("save_bytes", &save_bytes<PublicKey>, "Saves the PublicKey to a bytes object")
+     .def("load_bytes", &load_bytes<PublicKey>, "Loads the PublicKey from a bytes-like object");
 
   py::class_<SecretKey>(m, "SecretKey")
-     .def(py::init<>());
+     .def(py::init<>())
+     .def("save_bytes", &save_bytes<SecretKey>, "Saves the SecretKey to a bytes object")
+     .def("load_bytes", &load_bytes<SecretKey>, "Loads the SecretKey from a bytes-like object");
 
   py::class_<SEALContext>(m, "SEALContext")
      .def(py::init<const EncryptionParameters &>())